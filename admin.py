@@ -0,0 +1,234 @@
+"""
+Admin control socket for PyPeake MUD
+Lets local tools query and manage the running server
+
+Each request and response is one line of JSON over a Unix-domain socket:
+
+    {"command": "top", "limit": 5}
+    {"ok": true, "result": [...]}
+    {"ok": false, "error": "Unknown command: foo"}
+
+The socket file is only accessible to the user running the server.
+
+Copyright (c) 2025 PyPeake MUD
+Licensed under the MIT License - see LICENSE file for details
+"""
+
+import json
+import os
+import socket
+import threading
+from backup import BACKUP_DIR, create_backup
+from database import EXPORT_FIELDS
+from memory import AllocationTracer, server_report
+
+ADMIN_SOCKET = "mud_admin.sock"
+HAS_UNIX_SOCKETS = hasattr(socket, 'AF_UNIX')
+
+class AdminError(Exception):
+    """Raised when the server rejects an admin request"""
+
+def public_record(username, player_data):
+    """Get the exportable fields of a player record, without the password hash"""
+    record = {field: player_data.get(field) for field in EXPORT_FIELDS}
+    if record['name'] is None:
+        record['name'] = username
+    return record
+
+class AdminServer:
+    """Answers admin requests against a running MUDServer"""
+
+    def __init__(self, server, path=ADMIN_SOCKET):
+        self.server = server
+        self.path = path
+        self.socket = None
+        self.tracer = AllocationTracer()
+        self.commands = {
+            'stats': self.stats,
+            'online': self.online,
+            'players': self.players,
+            'top': self.top,
+            'save': self.save,
+            'kick': self.kick,
+            'backup': self.backup,
+            'metrics': self.metrics,
+            'channels': self.channels,
+            'announce': self.announce,
+            'reload_help': self.reload_help,
+            'memory': self.memory,
+            'npcs': self.npcs,
+        }
+
+    def start(self):
+        """Listen on the admin socket in a background thread"""
+        if os.path.exists(self.path):
+            os.remove(self.path)  # Left over from a server that did not shut down cleanly
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)  # Create the socket file private, with no window before a chmod
+        try:
+            self.socket.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        self.socket.listen(5)
+
+        thread = threading.Thread(target=self.serve)
+        thread.daemon = True
+        thread.start()
+        print(f"Admin socket listening on {self.path}")
+
+    def close(self):
+        """Stop listening and remove the socket file"""
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def serve(self):
+        """Accept admin connections until the socket is closed"""
+        while True:
+            try:
+                connection, _ = self.socket.accept()
+            except (OSError, AttributeError):
+                return
+            thread = threading.Thread(target=self.handle_connection, args=(connection,))
+            thread.daemon = True
+            thread.start()
+
+    def handle_connection(self, connection):
+        """Answer requests on one connection until the client hangs up"""
+        with connection, connection.makefile('rb') as requests:
+            for line in requests:
+                response = self.handle_request(line)
+                try:
+                    connection.sendall(json.dumps(response).encode('utf-8') + b'\n')
+                except OSError:
+                    return
+
+    def handle_request(self, line):
+        """Run one JSON request line and build the response"""
+        try:
+            request = json.loads(line)
+            command = request.pop('command', None)
+            handler = self.commands.get(command)
+            if handler is None:
+                raise ValueError(f"Unknown command: {command}")
+            return {'ok': True, 'result': handler(**request)}
+        except (ValueError, TypeError, AttributeError, KeyError) as e:
+            return {'ok': False, 'error': str(e)}
+        except Exception as e:
+            # Anything else is a bug, but the admin still gets an answer
+            print(f"Error running admin request {line.strip()!r}: {e}")
+            return {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+
+    def stats(self):
+        """Population statistics"""
+        return self.server.db.export_player_stats()
+
+    def online(self):
+        """The players who are connected right now"""
+        return self.server.call(self.roster)
+
+    def roster(self):
+        """Build the online list on the game thread"""
+        return [{'name': player.name, 'race': player.race, 'char_class': player.char_class,
+                 'level': player.level, 'location': player.location}
+                for player in self.server.players.values()]
+
+    def players(self, sort_by='name', descending=False, offset=0, limit=None, **filters):
+        """One page of stored players"""
+        # Read from a snapshot taken under db.lock (of the name index's keys, or of the records),
+        # so the game thread isn't held up
+        page = self.server.db.iter_sorted_players(sort_by, descending, offset, limit, **filters)
+        return [public_record(username, player_data) for username, player_data in page]
+
+    def top(self, limit=10, sort_by='level'):
+        """The leaderboard for a metric"""
+        top = self.server.db.get_top_players(limit, sort_by)
+        return [public_record(username, player_data) for username, player_data in top.items()]
+
+    def save(self):
+        """Save every online player now"""
+        return self.server.call(self.server.save_online_players)
+
+    def kick(self, name):
+        """Disconnect an online player"""
+        return self.server.call(self.server.kick_player, name)
+
+    def metrics(self):
+        """Command queue depth and game thread timings"""
+        return self.server.get_metrics()
+
+    def channels(self):
+        """Subscriber and message counts for every chat channel"""
+        return self.server.call(self.server.channels.stats)
+
+    def announce(self, message):
+        """Post a server announcement, returning how many players it reached"""
+        return self.server.call(self.server.announce, message)
+
+    def reload_help(self):
+        """Re-read changed data modules into the help index, returning what changed"""
+        return self.server.call(self.server.help.refresh)
+
+    def npcs(self):
+        """NPC scheduler counters: thoughts run, skipped and late, and the time they took"""
+        return self.server.call(self.server.npcs.report)
+
+    def memory(self, action='report', limit=10):
+        """Memory per subsystem, or control of allocation tracing
+
+        Actions: report (sizes by subsystem, no tracing needed), start,
+        top (largest allocation sites), diff (growth since start or the
+        last diff) and stop.
+        """
+        if action == 'report':
+            report = server_report(self.server, limit)
+            report['tracing'] = self.tracer.status()
+            return report
+        if action == 'start':
+            return self.tracer.start()
+        if action == 'top':
+            return self.tracer.top(limit)
+        if action == 'diff':
+            return self.tracer.diff(limit, rebase=True)
+        if action == 'stop':
+            return self.tracer.stop()
+        raise ValueError(f"Unknown memory action: {action}")
+
+    def backup(self, backup_dir=BACKUP_DIR, incremental=False):
+        """Back up the in-memory player records"""
+        backup_filename, backup_type, count = create_backup(self.server.db.snapshot(), backup_dir, incremental)
+        return {'file': os.path.join(backup_dir, backup_filename), 'type': backup_type, 'count': count}
+
+def admin_request(command, path=ADMIN_SOCKET, timeout=10, **args):
+    """Send one request to a running server's admin socket
+
+    Returns the result, or None if no server is listening on path.
+    Raises AdminError if the server rejects the request or cannot be talked to.
+    """
+    if not HAS_UNIX_SOCKETS or not os.path.exists(path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(timeout)
+            connection.connect(path)
+            connection.sendall(json.dumps(dict(args, command=command)).encode('utf-8') + b'\n')
+            with connection.makefile('rb') as responses:
+                line = responses.readline()
+    except (ConnectionRefusedError, FileNotFoundError):
+        return None  # Stale socket file from a server that is no longer running
+    except OSError as e:  # Timeouts, permission errors, resets
+        raise AdminError(f"Admin socket error: {e}") from e
+
+    if not line:
+        raise AdminError("Server closed the admin connection")
+    try:
+        response = json.loads(line)
+    except ValueError as e:
+        raise AdminError(f"Bad response from server: {e}") from e
+    if not isinstance(response, dict) or 'ok' not in response:
+        raise AdminError("Bad response from server")
+    if not response['ok']:
+        raise AdminError(response['error'])
+    return response['result']
@@ -0,0 +1,164 @@
+"""
+Password hashing for PyPeake MUD
+Salted, tunable-cost hashes computed on a bounded worker pool
+
+Copyright (c) 2025 PyPeake MUD
+Licensed under the MIT License - see LICENSE file for details
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from names import name_key
+
+# scrypt cost parameters; raising SCRYPT_N upgrades existing hashes on next login
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+# Used when this Python's OpenSSL has no scrypt
+PBKDF2_ITERATIONS = 200000
+
+SALT_BYTES = 16
+HAS_SCRYPT = hasattr(hashlib, 'scrypt')
+
+class AuthBusy(Exception):
+    """Raised when too many password hashes are already waiting"""
+    pass
+
+def scrypt_maxmem(n, r):
+    """Memory limit that leaves room for scrypt's working set"""
+    return 256 * n * r + 1024 * 1024
+
+def hash_password(password, n=SCRYPT_N):
+    """Hash a password with a fresh random salt"""
+    salt = os.urandom(SALT_BYTES)
+    if HAS_SCRYPT:
+        digest = hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=SCRYPT_R, p=SCRYPT_P,
+                                maxmem=scrypt_maxmem(n, SCRYPT_R))
+        return f"scrypt${n}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${digest.hex()}"
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, PBKDF2_ITERATIONS)
+    return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${salt.hex()}${digest.hex()}"
+
+# A well-formed hash no password matches, checked in place of an unknown
+# user's so a failed login takes as long whether or not the name exists
+if HAS_SCRYPT:
+    DUMMY_HASH = f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${'00' * SALT_BYTES}${'00' * 64}"
+else:
+    DUMMY_HASH = f"pbkdf2_sha256${PBKDF2_ITERATIONS}${'00' * SALT_BYTES}${'00' * 32}"
+
+def verify_password(password, stored_hash):
+    """Check a password against a stored hash in any supported format
+
+    A malformed hash matches nothing.
+    """
+    parts = stored_hash.split('$')
+    encoded = password.encode('utf-8')
+
+    try:
+        if parts[0] == 'scrypt' and len(parts) == 6:
+            n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+            expected = bytes.fromhex(parts[5])
+            digest = hashlib.scrypt(encoded, salt=bytes.fromhex(parts[4]), n=n, r=r, p=p,
+                                    maxmem=scrypt_maxmem(n, r))
+        elif parts[0] == 'pbkdf2_sha256' and len(parts) == 4:
+            expected = bytes.fromhex(parts[3])
+            digest = hashlib.pbkdf2_hmac('sha256', encoded, bytes.fromhex(parts[2]), int(parts[1]))
+        elif len(parts) == 1:
+            # Unsalted sha256 from older versions of the server
+            expected = stored_hash.encode('utf-8')
+            digest = hashlib.sha256(encoded).hexdigest().encode('utf-8')
+        else:
+            return False
+    except (ValueError, OverflowError):
+        return False
+
+    return hmac.compare_digest(digest, expected)
+
+def needs_rehash(stored_hash):
+    """True if a hash is weaker than what hash_password produces today, or malformed"""
+    parts = stored_hash.split('$')
+    try:
+        if HAS_SCRYPT:
+            return parts[0] != 'scrypt' or int(parts[1]) < SCRYPT_N
+        return parts[0] != 'pbkdf2_sha256' or int(parts[1]) < PBKDF2_ITERATIONS
+    except (IndexError, ValueError):
+        return True
+
+class PasswordHasher:
+    """Runs password hashing on a fixed pool of worker threads
+
+    hashlib releases the GIL while it hashes, so logins do not stall the
+    rest of the server. At most max_pending hashes may be queued or
+    running; beyond that submit raises AuthBusy instead of letting a
+    reconnect storm build an unbounded backlog.
+    """
+
+    def __init__(self, workers=2, max_pending=64):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='auth')
+        self.slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, fn, *args):
+        """Queue fn on the pool and return its future"""
+        if not self.slots.acquire(blocking=False):
+            raise AuthBusy()
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def hash(self, password):
+        """Hash a password on the pool"""
+        return self.submit(hash_password, password)
+
+    def verify(self, password, stored_hash):
+        """Verify a password on the pool"""
+        return self.submit(verify_password, password, stored_hash)
+
+    def shutdown(self):
+        """Stop the worker threads"""
+        self.executor.shutdown(wait=False)
+
+class ResumeTokens:
+    """Signed, expiring tokens that let a dropped player reconnect
+
+    The signing key is random per server run, so tokens stop working when
+    the server restarts, along with the in-memory players they refer to.
+    A token is issued at login and has to outlast the whole session, so
+    its lifetime is long; how soon after a drop it can be used is up to
+    whoever holds the dropped player.
+    """
+
+    def __init__(self, lifetime=86400, clock=time.time):
+        self.lifetime = lifetime
+        self.clock = clock
+        self.key = os.urandom(32)
+
+    def sign(self, payload):
+        return hmac.new(self.key, payload.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+    def issue(self, username):
+        """Create a token for username"""
+        name = base64.urlsafe_b64encode(name_key(username).encode('utf-8')).decode('ascii').rstrip('=')
+        payload = f"{name}.{int(self.clock()) + self.lifetime}"
+        return f"{payload}.{self.sign(payload)}"
+
+    def verify(self, token):
+        """Get the username a token was issued for, or None if it is invalid or expired"""
+        try:
+            name, expires, signature = token.strip().split('.')
+            if not hmac.compare_digest(signature, self.sign(f"{name}.{expires}")):
+                return None
+            if int(expires) < self.clock():
+                return None
+            padding = '=' * (-len(name) % 4)
+            return base64.urlsafe_b64decode(name + padding).decode('utf-8')
+        except ValueError:
+            return None
@@ -0,0 +1,107 @@
+"""
+Backup module for PyPeake MUD
+Full and incremental player database backups with point-in-time restore
+
+Copyright (c) 2025 PyPeake MUD
+Licensed under the MIT License - see LICENSE file for details
+"""
+
+import json
+import os
+import hashlib
+from datetime import datetime
+from database import atomic_write_json
+
+BACKUP_DIR = "backups"
+MANIFEST_FILE = "manifest.json"
+
+def record_digest(player_data):
+    """Get a short fingerprint of a player record"""
+    encoded = json.dumps(player_data, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(encoded).hexdigest()
+
+def load_manifest(backup_dir=BACKUP_DIR):
+    """Load the backup manifest, or an empty one if none exists"""
+    manifest_path = os.path.join(backup_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    return {'backups': [], 'digests': {}}
+
+def create_backup(players, backup_dir=BACKUP_DIR, incremental=False):
+    """Write a backup of a player snapshot
+
+    players should be a point-in-time copy such as Database.snapshot().
+    An incremental backup only contains records whose contents changed
+    since the previous backup, plus the names of deleted players. Falls
+    back to a full backup when there is nothing to build on.
+
+    Returns (backup filename, backup type, number of records written).
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    manifest = load_manifest(backup_dir)
+    previous = manifest['digests']
+
+    digests = {username: record_digest(data) for username, data in players.items()}
+
+    if incremental and manifest['backups']:
+        backup_type = 'incremental'
+        records = {username: data for username, data in players.items()
+                   if previous.get(username) != digests[username]}
+        deleted = [username for username in previous if username not in players]
+    else:
+        backup_type = 'full'
+        records = players
+        deleted = []
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    backup_filename = f"players_{backup_type}_{timestamp}.json"
+
+    atomic_write_json(os.path.join(backup_dir, backup_filename), {
+        'type': backup_type,
+        'created_at': datetime.now().isoformat(),
+        'players': records,
+        'deleted': deleted
+    })
+
+    manifest['backups'].append({'file': backup_filename, 'type': backup_type})
+    manifest['digests'] = digests
+    atomic_write_json(os.path.join(backup_dir, MANIFEST_FILE), manifest, indent=2)
+
+    return backup_filename, backup_type, len(records)
+
+def backup_chain(backup_dir=BACKUP_DIR, target=None):
+    """Get the backups needed to restore to target (default: latest)
+
+    The chain starts at the last full backup at or before target and
+    includes every incremental backup after it, in order.
+    """
+    backups = load_manifest(backup_dir)['backups']
+    if not backups:
+        raise ValueError("No backups found")
+
+    files = [entry['file'] for entry in backups]
+    if target and target not in files:
+        raise ValueError(f"Unknown backup: {target}")
+    end = files.index(target) if target else len(files) - 1
+
+    start = end
+    while backups[start]['type'] != 'full':
+        start -= 1
+        if start < 0:
+            raise ValueError("No full backup found before target")
+
+    return files[start:end + 1]
+
+def restore_players(backup_dir=BACKUP_DIR, target=None):
+    """Rebuild the player records by replaying a base backup and its increments"""
+    players = {}
+    for backup_filename in backup_chain(backup_dir, target):
+        with open(os.path.join(backup_dir, backup_filename), 'r') as f:
+            backup = json.load(f)
+        if backup['type'] == 'full':
+            players = {}
+        players.update(backup['players'])
+        for username in backup['deleted']:
+            players.pop(username, None)
+    return players
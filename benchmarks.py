@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for PyPeake MUD
+Measures the hot paths of the server at player counts we expect to see
+
+Copyright (c) 2025 PyPeake MUD
+Licensed under the MIT License - see LICENSE file for details
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from auth import AuthBusy, PasswordHasher, hash_password
+from mud_server import HASH_WORKERS, MAX_PENDING_HASHES, MUDServer
+from player import Player
+from races import RACES
+from classes import CLASSES
+from vitals import HAS_NUMPY, VitalsStore, regenerate_players
+from combat import CombatEngine
+from database import Database
+from simulation import Simulation, VirtualClock
+from ratelimit import RateLimiter
+from websocket import WebSocketClient
+from items import ITEMS, Inventory, Item
+from npcs import NPCS, THINK_BUDGET, NPCScheduler
+
+def percentile(values, pct):
+    """Get the pct percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(len(ordered) * pct / 100))
+    return ordered[index]
+
+def report_latencies(label, latencies):
+    """Print p50/p99/max of a list of latencies in seconds"""
+    print(f"{label}: {len(latencies)} samples, "
+          f"p50 {percentile(latencies, 50) * 1000:.1f} ms, "
+          f"p99 {percentile(latencies, 99) * 1000:.1f} ms, "
+          f"max {max(latencies, default=0) * 1000:.1f} ms")
+
+def bench_login_burst(logins=1000, workers=HASH_WORKERS, max_pending=MAX_PENDING_HASHES):
+    """Verify passwords for a burst of simultaneous logins through the hashing pool"""
+    print(f"=== Login burst: {logins} logins, {workers} workers, queue limit {max_pending} ===")
+    stored_hash = hash_password("burst-password")
+    hasher = PasswordHasher(workers, max_pending)
+    barrier = threading.Barrier(logins)
+    latencies = []
+    rejected = []
+    lock = threading.Lock()
+
+    def login():
+        barrier.wait()
+        start = time.perf_counter()
+        try:
+            hasher.verify("burst-password", stored_hash).result()
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+        except AuthBusy:
+            elapsed = time.perf_counter() - start
+            with lock:
+                rejected.append(elapsed)
+
+    threads = [threading.Thread(target=login) for _ in range(logins)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    hasher.shutdown()
+
+    report_latencies("Accepted logins", latencies)
+    report_latencies("Rejected as busy", rejected)
+
+def make_players(count):
+    """Create count players spread over every race and class"""
+    races = list(RACES)
+    classes = list(CLASSES)
+    return [Player(f"Bench{i}", "hash", races[i % len(races)], classes[i % len(classes)])
+            for i in range(count)]
+
+def time_per_call(fn, repeat):
+    """Average seconds per call of fn over repeat calls"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+def bench_regen(entities=100000, ticks=20):
+    """Regeneration tick cost with and without the NumPy vitals store"""
+    print(f"=== Regeneration tick: {entities} players ===")
+    players = make_players(entities)
+    for player in players:
+        player.health = 1
+        player.mana = 1
+
+    loop_time = time_per_call(lambda: regenerate_players(players), max(1, ticks // 10))
+    print(f"Python loop: {loop_time * 1000:.2f} ms per tick")
+
+    if not HAS_NUMPY:
+        print("NumPy not installed, skipping vitals store")
+        return
+    store = VitalsStore()
+    for player in players:
+        store.attach(player)
+    store_time = time_per_call(store.regenerate, ticks)
+    print(f"Vitals store: {store_time * 1000:.2f} ms per tick ({loop_time / store_time:.0f}x faster)")
+
+def bench_combat(sizes=(1000, 10000, 100000), ticks=3):
+    """Cost of resolving one tick of combat at several fight sizes"""
+    print("=== Combat resolution per tick ===")
+    for count in sizes:
+        players = make_players(count)
+        store = VitalsStore() if HAS_NUMPY else None
+        if store is not None:
+            for player in players:
+                store.attach(player)
+        engine = CombatEngine(store, seed=1)
+
+        elapsed = 0.0
+        for _ in range(ticks):
+            for player in players:
+                player.health = player.max_health
+                player.mana = player.max_mana
+            for i, player in enumerate(players):
+                engine.queue_attack(player, players[(i + 1) % count], "Fireball" if i % 2 else "Attack")
+            gc.collect()  # Keep a full collection of the setup garbage out of the timing
+            start = time.perf_counter()
+            engine.resolve()
+            elapsed += time.perf_counter() - start
+
+        mode = "NumPy batch" if HAS_NUMPY else "Python loop"
+        print(f"{count} combatants: {elapsed / ticks * 1000:.1f} ms per tick ({mode})")
+
+def make_records(count, seed=1):
+    """Create count player records with spread out levels and last logins"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    records = {}
+    for i in range(count):
+        name = f"Bench{i}"
+        records[name.lower()] = {
+            'name': name,
+            'level': rng.randint(1, 50),
+            'experience': rng.randint(0, 50000),
+            'created_at': (now - timedelta(days=rng.uniform(365, 730))).isoformat(),
+            'last_login': (now - timedelta(days=rng.uniform(0, 365))).isoformat(),
+        }
+    return records
+
+def scan_by_level(players, min_level, max_level):
+    """Level range query as a full scan, for comparison"""
+    return {username: player_data for username, player_data in players.items()
+            if min_level <= player_data.get('level', 1) <= max_level}
+
+def scan_inactive(players, days_inactive):
+    """Inactive player query as a full scan, for comparison"""
+    cutoff = datetime.now() - timedelta(days=days_inactive)
+    return [username for username, player_data in players.items()
+            if datetime.fromisoformat(player_data['last_login']) < cutoff]
+
+def bench_indexes(records=1000000, repeat=3):
+    """Level range and inactive player queries with and without the secondary indexes"""
+    print(f"=== Secondary indexes: {records} records ===")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db = Database(os.path.join(temp_dir, "bench_players.json"))
+    db.players = make_records(records)
+    start = time.perf_counter()
+    db.rebuild_indexes()
+    print(f"Index build: {time.perf_counter() - start:.2f} s")
+    
+    scan_time = time_per_call(lambda: scan_by_level(db.players, 49, 50), repeat)
+    index_time = time_per_call(lambda: db.get_players_by_level(49, 50), repeat)
+    print(f"Levels 49-50 ({len(db.get_players_by_level(49, 50))} players): "
+          f"scan {scan_time * 1000:.1f} ms, index {index_time * 1000:.1f} ms")
+    
+    scan_time = time_per_call(lambda: scan_inactive(db.players, 360), 1)
+    index_time = time_per_call(lambda: db.get_inactive_players(360), repeat)
+    print(f"Inactive 360+ days ({len(db.get_inactive_players(360))} players): "
+          f"scan {scan_time * 1000:.1f} ms, index {index_time * 1000:.1f} ms")
+    
+    # A save moves the player's entry in every index, the last-login one included
+    now = datetime.now().isoformat()
+    usernames = list(db.players)[:repeat * 1000]
+    update_time = time_per_call(lambda: [db.index_player(username, dict(db.players[username], last_login=now))
+                                         for username in usernames], 1) / len(usernames)
+    print(f"Re-index a saved player: {update_time * 1e6:.1f} us")
+    
+    # Only the index work is timed; the file write that follows is the same as any save's
+    db.save_players = lambda: None
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        removed = db.cleanup_old_players(300)
+    print(f"Clean up inactive 300+ days ({removed} players): {(time.perf_counter() - start) * 1000:.0f} ms")
+
+def bench_simulation(sessions=10000, speakers=100, lookers=100):
+    """Many in-memory sessions chatting, listing who is online and leaving"""
+    print(f"=== Simulation: {sessions} sessions ===")
+    with tempfile.TemporaryDirectory() as temp_dir, contextlib.redirect_stdout(io.StringIO()):
+        sim = Simulation(os.path.join(temp_dir, "sim_players.json"))
+        start = time.perf_counter()
+        players = [sim.join(f"Sim{i}") for i in range(sessions)]
+        join_time = time.perf_counter() - start
+        
+        for i in range(speakers):
+            players[i].type(f"say hello from {i}")
+        start = time.perf_counter()
+        sim.run()
+        say_time = time.perf_counter() - start
+        
+        for session in players[:lookers]:
+            session.type("who")
+        start = time.perf_counter()
+        sim.run()
+        who_time = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        saved = sim.server.save_online_players()
+        save_time = time.perf_counter() - start
+        sim.close()
+    
+    print(f"Join: {join_time * 1000:.0f} ms")
+    print(f"{speakers} says to everyone: {say_time * 1000:.0f} ms ({speakers * (sessions - 1)} messages)")
+    print(f"{lookers} who lists: {who_time * 1000:.0f} ms")
+    print(f"Save {saved} online players: {save_time * 1000:.0f} ms")
+
+class CountingReader:
+    """Wraps a binary file object, counting the bytes read through it"""
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.count = 0
+
+    def read(self, size):
+        data = self.reader.read(size)
+        self.count += len(data)
+        return data
+
+    def readline(self, size=-1):
+        line = self.reader.readline(size)
+        self.count += len(line)
+        return line
+
+class TelnetDriver:
+    """Plays the game over the raw TCP port"""
+
+    def __init__(self, port):
+        self.socket = socket.create_connection(('127.0.0.1', port))
+        self.bytes_received = 0
+
+    def send(self, line):
+        self.socket.sendall((line + '\n').encode('utf-8'))
+
+    def wait_for(self, ending):
+        text = ''
+        while not text.endswith(ending):
+            data = self.socket.recv(65536)
+            if not data:
+                raise ConnectionError("Server closed the connection")
+            self.bytes_received += len(data)
+            text += data.decode('utf-8')
+
+    def close(self):
+        self.socket.close()
+
+class WebSocketDriver:
+    """Plays the game over the WebSocket port"""
+
+    def __init__(self, port, deflate):
+        self.client = WebSocketClient(socket.create_connection(('127.0.0.1', port)), deflate=deflate)
+        self.client.reader = CountingReader(self.client.reader)
+
+    @property
+    def bytes_received(self):
+        return self.client.reader.count
+
+    def send(self, line):
+        self.client.send(line)
+
+    def wait_for(self, ending):
+        text = ''
+        while not text.endswith(ending):
+            message = self.client.receive()
+            if message is None:
+                raise ConnectionError("Server closed the connection")
+            text += message
+
+    def close(self):
+        self.client.close()
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+def play_session(make_driver, name, commands, results):
+    """Create a character, then run commands one at a time, waiting for each prompt"""
+    driver = make_driver()
+    driver.wait_for(": \n")
+    for line in ("2", name, "secret", "secret", "1"):
+        driver.send(line)
+        driver.wait_for(": \n")
+    driver.send("1")
+    driver.wait_for("> \n")
+    
+    received = driver.bytes_received
+    start = time.perf_counter()
+    for i in range(commands):
+        driver.send(("look", "who", "stats")[i % 3])
+        driver.wait_for("> \n")
+    results.append((time.perf_counter() - start, driver.bytes_received - received))
+    driver.send("quit")
+    driver.close()
+
+def bench_websocket(clients=20, commands=300):
+    """Command round trips and bytes on the wire: telnet TCP vs WebSocket with and without deflate"""
+    print(f"=== WebSocket vs TCP: {clients} clients x {commands} commands ===")
+    transports = {
+        'tcp': lambda server: TelnetDriver(server.port),
+        'websocket': lambda server: WebSocketDriver(server.websocket_port, deflate=False),
+        'websocket+deflate': lambda server: WebSocketDriver(server.websocket_port, deflate=True),
+    }
+    with tempfile.TemporaryDirectory() as temp_dir, contextlib.redirect_stdout(io.StringIO()):
+        server = MUDServer('127.0.0.1', free_port(), admin_socket=None, websocket_port=free_port(),
+                           db_file=os.path.join(temp_dir, "ws_players.json"))
+        # The clients all come from one address and send far faster than a person types
+        server.connection_limiter = RateLimiter(1000000, 1000000)
+        server.command_limiter = RateLimiter(1000000, 1000000)
+        server_thread = threading.Thread(target=server.start_server)
+        server_thread.daemon = True
+        server_thread.start()
+        while server.websocket_socket is None:
+            time.sleep(0.01)
+        
+        report = {}
+        for number, (transport, make_driver) in enumerate(transports.items()):
+            results = []
+            threads = [threading.Thread(target=play_session,
+                                        args=(lambda: make_driver(server), f"Bench{number}x{i}", commands, results))
+                       for i in range(clients)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            report[transport] = (time.perf_counter() - start, results)
+        
+        # Let the server finish saving the players before their database is removed
+        while server.call(len, server.players):
+            time.sleep(0.01)
+    
+    total_commands = clients * commands
+    for transport, (elapsed, results) in report.items():
+        received = sum(received for _, received in results)
+        round_trip = sum(session_time for session_time, _ in results) / total_commands
+        print(f"{transport}: {round_trip * 1e6:.0f} us per command round trip, "
+              f"{received / total_commands:.0f} bytes/command received ({received / 1024:.0f} KiB total, "
+              f"{elapsed:.1f} s including logins)")
+
+def bench_items(instances=1000000, per_player=10):
+    """Memory per item instance: shared templates vs a full dict per item"""
+    print(f"=== Items: {instances} instances ===")
+    template_ids = sorted(ITEMS)
+    players = instances // per_player
+    rng = random.Random(1)
+    records = [[f"{rng.choice(template_ids)}*{rng.randint(1, 5)}" for _ in range(per_player)]
+               for _ in range(players)]
+    
+    def measure(build):
+        gc.collect()
+        tracemalloc.start()
+        built = build()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return built, size
+    
+    start = time.perf_counter()
+    inventories = [Inventory.from_records(player_records) for player_records in records]
+    print(f"Decoded {players} inventories in {time.perf_counter() - start:.2f} s")
+    del inventories
+    
+    inventories, size = measure(lambda: [Inventory.from_records(player_records) for player_records in records])
+    print(f"Item instances: {size / instances:.0f} bytes/item ({size / 2 ** 20:.0f} MiB)")
+    
+    start = time.perf_counter()
+    for inventory in inventories:
+        inventory.to_records()
+    print(f"Encoded to records in {time.perf_counter() - start:.2f} s")
+    del inventories
+    
+    def full_dicts():
+        return [[dict(ITEMS[item.template_id], stat_bonuses=dict(ITEMS[item.template_id]['stat_bonuses']),
+                      template_id=item.template_id, quantity=item.quantity)
+                 for item in map(Item.from_record, player_records)]
+                for player_records in records]
+    _, size = measure(full_dicts)
+    print(f"Full dict per item: {size / instances:.0f} bytes/item ({size / 2 ** 20:.0f} MiB)")
+
+def bench_npcs(sizes=(1000, 10000, 100000), ticks=40, tick_interval=5.0):
+    """How many NPCs fit in the per-tick think budget, and how late thoughts run beyond that"""
+    print(f"=== NPC scheduler: {THINK_BUDGET * 1000:.0f} ms budget per {tick_interval:g} s tick ===")
+    observers = {"great_forest": ["watcher"]}  # The forest and the town square are awake, the rest asleep
+    for count in sizes:
+        clock = VirtualClock()
+        scheduler = NPCScheduler(notify=lambda sessions, message: None, clock=clock, seed=1)
+        templates = sorted(NPCS)
+        for i in range(count):
+            scheduler.spawn(templates[i % len(templates)])
+        
+        tick_times = []
+        for _ in range(ticks):
+            clock.advance(tick_interval)
+            start = time.perf_counter()
+            scheduler.tick(observers)
+            tick_times.append(time.perf_counter() - start)
+        report = scheduler.report()
+        think_cost = sum(tick_times) / max(1, report['thinks'])
+        print(f"{count} NPCs ({report['awake']} awake): {report['thinks'] / ticks:.0f} thoughts/tick, "
+              f"{report['late']} late by {report['skipped']} ticks (up to {report['max_late_seconds']:.0f} s), "
+              f"p99 tick {percentile(tick_times, 99) * 1000:.2f} ms, {think_cost * 1e6:.1f} us/thought")
+
+BENCHMARKS = {
+    'login': bench_login_burst,
+    'regen': bench_regen,
+    'combat': bench_combat,
+    'indexes': bench_indexes,
+    'simulation': bench_simulation,
+    'websocket': bench_websocket,
+    'items': bench_items,
+    'npcs': bench_npcs,
+}
+
+def main():
+    """Run one or all benchmarks"""
+    parser = argparse.ArgumentParser(description='PyPeake MUD Benchmarks')
+    parser.add_argument('benchmark', nargs='?', choices=sorted(BENCHMARKS), help='Benchmark to run (default: all)')
+    args = parser.parse_args()
+
+    names = [args.benchmark] if args.benchmark else sorted(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
+        print()
+
+if __name__ == "__main__":
+    main()
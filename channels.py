@@ -0,0 +1,135 @@
+"""
+Chat channels for PyPeake MUD
+Named channels with explicit subscriptions and a short history
+
+Copyright (c) 2025 PyPeake MUD
+Licensed under the MIT License - see LICENSE file for details
+"""
+
+from collections import deque
+
+HISTORY_SIZE = 50  # Recent messages kept per channel
+
+# Channels players may join and leave themselves; race and class channels
+# follow the character, and the admin channel carries server announcements
+GLOBAL_CHANNEL = "global"
+ADMIN_CHANNEL = "admin"
+GUILD_PREFIX = "guild:"
+
+def race_channel(race):
+    """Name of the channel for a race"""
+    return f"race:{race.lower()}"
+
+def class_channel(char_class):
+    """Name of the channel for a character class"""
+    return f"class:{char_class.lower()}"
+
+def guild_channel(guild):
+    """Name of the channel for a guild"""
+    return f"{GUILD_PREFIX}{guild.lower()}"
+
+class Channel:
+    """One channel: its subscribers, recent history and delivery counts"""
+
+    def __init__(self, name, history_size=HISTORY_SIZE):
+        self.name = name
+        self.subscribers = {}  # Used as an ordered set
+        self.history = deque(maxlen=history_size)
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def stats(self):
+        """Subscriber and message counts"""
+        return {
+            'subscribers': len(self.subscribers),
+            'published': self.published,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+        }
+
+class ChannelHub:
+    """Every channel, and which channels each subscriber is in
+
+    deliver(subscriber, data) hands one encoded message to a subscriber
+    and returns False if it had to be dropped, e.g. because the
+    subscriber's output is backed up.
+    """
+
+    def __init__(self, deliver, history_size=HISTORY_SIZE):
+        self.deliver = deliver
+        self.history_size = history_size
+        self.channels = {}
+        self.subscriptions = {}  # subscriber -> set of channel names
+
+    def subscribe(self, name, subscriber):
+        """Add a subscriber to a channel, creating it if needed"""
+        channel = self.channels.get(name)
+        if channel is None:
+            channel = self.channels[name] = Channel(name, self.history_size)
+        channel.subscribers[subscriber] = True
+        self.subscriptions.setdefault(subscriber, set()).add(name)
+        return channel
+
+    def unsubscribe(self, name, subscriber):
+        """Remove a subscriber from a channel, returning False if they were not in it"""
+        channel = self.channels.get(name)
+        if channel is None or channel.subscribers.pop(subscriber, None) is None:
+            return False
+        names = self.subscriptions[subscriber]
+        names.discard(name)
+        if not names:
+            del self.subscriptions[subscriber]
+        if not channel.subscribers and name.startswith(GUILD_PREFIX):
+            del self.channels[name]  # Guild channels come and go with their members
+        return True
+
+    def unsubscribe_all(self, subscriber):
+        """Remove a subscriber from every channel, e.g. when they log out"""
+        for name in list(self.subscriptions.get(subscriber, ())):
+            self.unsubscribe(name, subscriber)
+
+    def is_subscribed(self, name, subscriber):
+        """Check whether a subscriber is in a channel"""
+        return name in self.subscriptions.get(subscriber, ())
+
+    def channels_of(self, subscriber):
+        """Names of the channels a subscriber is in, sorted"""
+        return sorted(self.subscriptions.get(subscriber, ()))
+
+    def publish(self, name, text, exclude=None):
+        """Send a line to every subscriber of a channel except exclude
+
+        The line is encoded once and the same bytes are handed to every
+        subscriber. Returns the number of subscribers it was delivered to.
+        """
+        channel = self.channels.get(name)
+        if channel is None:
+            channel = self.channels[name] = Channel(name, self.history_size)
+        channel.history.append(text)
+        channel.published += 1
+
+        data = text.encode('utf-8')
+        delivered = 0
+        deliver = self.deliver
+        for subscriber in channel.subscribers:
+            if subscriber is exclude:
+                continue
+            if deliver(subscriber, data):
+                delivered += 1
+            else:
+                channel.dropped += 1
+        channel.delivered += delivered
+        return delivered
+
+    def recent(self, name, count=None):
+        """The most recent messages on a channel, oldest first"""
+        channel = self.channels.get(name)
+        if channel is None:
+            return []
+        history = list(channel.history)
+        return history if count is None else history[-count:]
+
+    def stats(self):
+        """Subscriber and message counts for every channel"""
+        return {name: channel.stats() for name, channel in sorted(self.channels.items())}
@@ -19,7 +19,8 @@ CLASSES = {
         },
         "special_abilities": ["Heavy Armor Mastery", "Weapon Expertise"],
         "mana_multiplier": 0.5,
-        "health_multiplier": 1.5
+        "health_multiplier": 1.5,
+        "damage_multiplier": 1.3
     },
     
     "Mage": {
@@ -34,7 +35,8 @@ CLASSES = {
         },
         "special_abilities": ["Spell Mastery", "Mana Efficiency"],
         "mana_multiplier": 2.0,
-        "health_multiplier": 0.8
+        "health_multiplier": 0.8,
+        "damage_multiplier": 1.0
     },
     
     "Rogue": {
@@ -50,7 +52,8 @@ CLASSES = {
         },
         "special_abilities": ["Sneak Attack", "Trap Detection"],
         "mana_multiplier": 0.8,
-        "health_multiplier": 1.0
+        "health_multiplier": 1.0,
+        "damage_multiplier": 1.2
     },
     
     "Cleric": {
@@ -65,7 +68,8 @@ CLASSES = {
         },
         "special_abilities": ["Divine Magic", "Healing Mastery"],
         "mana_multiplier": 1.5,
-        "health_multiplier": 1.2
+        "health_multiplier": 1.2,
+        "damage_multiplier": 0.9
     },
     
     "Ranger": {
@@ -80,7 +84,8 @@ CLASSES = {
         },
         "special_abilities": ["Archery Mastery", "Nature Lore"],
         "mana_multiplier": 1.0,
-        "health_multiplier": 1.1
+        "health_multiplier": 1.1,
+        "damage_multiplier": 1.1
     },
     
     "Paladin": {
@@ -95,7 +100,8 @@ CLASSES = {
         },
         "special_abilities": ["Divine Grace", "Undead Bane"],
         "mana_multiplier": 1.2,
-        "health_multiplier": 1.3
+        "health_multiplier": 1.3,
+        "damage_multiplier": 1.1
     },
     
     "Barbarian": {
@@ -110,7 +116,8 @@ CLASSES = {
         },
         "special_abilities": ["Berserker Rage", "Damage Resistance"],
         "mana_multiplier": 0.3,
-        "health_multiplier": 1.6
+        "health_multiplier": 1.6,
+        "damage_multiplier": 1.4
     },
     
     "Bard": {
@@ -125,7 +132,8 @@ CLASSES = {
         },
         "special_abilities": ["Song Magic", "Jack of All Trades"],
         "mana_multiplier": 1.3,
-        "health_multiplier": 1.0
+        "health_multiplier": 1.0,
+        "damage_multiplier": 0.9
     }
 }
 
@@ -144,6 +152,7 @@ def get_class_description(class_name):
             description += f"- {stat.title()}: {sign}{modifier}\n"
         description += f"\nHealth Multiplier: {char_class['health_multiplier']}x\n"
         description += f"Mana Multiplier: {char_class['mana_multiplier']}x\n"
+        description += f"Damage Multiplier: {char_class['damage_multiplier']}x\n"
         return description
     return "Unknown class"
 
@@ -1,22 +1,47 @@
 #!/usr/bin/env python3
 """
 Simple Telnet Client for PyPeake MUD
-Connect to the MUD server using telnet
+Connect to the MUD server using telnet, or drive it from a script
+
+Script mode sends one command at a time from a file or stdin and times
+how long the server takes to answer each, for smoke tests and ops
+scripts. Besides commands, a script can contain:
+
+    # a comment
+    @expect Enter your choice    wait until the output contains this text
+    @sleep 2.5                   pause, still showing any output
+    @password secret             send a line without showing or reporting it
 
 Copyright (c) 2025 PyPeake MUD
 Licensed under the MIT License - see LICENSE file for details
 """
 
+import argparse
+import codecs
+import select
 import socket
 import threading
 import sys
+import time
+
+RECV_SIZE = 65536
+MAX_BATCH = 1 << 20         # Most bytes to gather into one terminal write
+SETTLE_TIME = 0.05          # Quiet time after which a response counts as complete in script mode
+RESPONSE_TIMEOUT = 10.0     # Longest to wait for a response or an @expect in script mode
+
+def percentile(sorted_values, fraction):
+    """The value at a fraction of the way through a sorted list"""
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
 
 class MUDClient:
-    def __init__(self, host='localhost', port=4000):
+    def __init__(self, host='localhost', port=4000, output=None):
         self.host = host
         self.port = port
         self.socket = None
         self.connected = False
+        self.output = output or sys.stdout
+        # Keeps the bytes of a character split across two reads until the rest arrives
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
     
     def connect(self):
         """Connect to the MUD server"""
@@ -45,21 +70,122 @@ class MUDClient:
             print(f"Error sending message: {e}")
             self.connected = False
     
+    def read_available(self, timeout=None):
+        """Wait up to timeout seconds for output, then take everything already waiting
+
+        Returns the decoded text, '' if nothing arrived in time, or None
+        once the server has closed the connection.
+        """
+        ready, _, _ = select.select([self.socket], [], [], timeout)
+        chunks = []
+        size = 0
+        while ready and size < MAX_BATCH:
+            data = self.socket.recv(RECV_SIZE)
+            if not data:
+                self.connected = False
+                break
+            chunks.append(self.decoder.decode(data))
+            size += len(data)
+            ready, _, _ = select.select([self.socket], [], [], 0)
+        text = ''.join(chunks)
+        return text if text or self.connected else None
+    
+    def show(self, text):
+        """Write output to the terminal in one go"""
+        self.output.write(text)
+        self.output.flush()
+    
     def receive_messages(self):
-        """Receive messages from the server"""
+        """Receive messages from the server, writing each burst to the terminal at once"""
         while self.connected:
             try:
-                data = self.socket.recv(1024)
-                if not data:
-                    break
-                message = data.decode('utf-8')
-                print(message, end='')
+                text = self.read_available()
             except Exception as e:
                 if self.connected:
                     print(f"Error receiving message: {e}")
                 break
+            if text is None:
+                break
+            self.show(text)
         self.connected = False
     
+    def run_script(self, lines, settle=SETTLE_TIME, timeout=RESPONSE_TIMEOUT, echo=True):
+        """Send scripted commands one at a time, timing the server's answer to each
+
+        A command's round trip is the time from sending it to the first
+        output after it; its answer is complete once the server has been
+        quiet for settle seconds. Returns the round trips in seconds by
+        command word, and whether the script passed: every command was
+        answered in time and every @expect was met. Passwords are sent
+        but never timed, so they don't appear in the report.
+        """
+        timings = {}
+        received = ''  # Output since the last command, searched by @expect
+        for line in lines:
+            line = line.rstrip('\r\n')
+            if line.startswith('#'):
+                continue
+            if line.startswith('@sleep'):
+                try:
+                    seconds, = map(float, line.split()[1:])
+                except ValueError:
+                    print(f"\nScript error: {line!r} needs a number of seconds, such as '@sleep 2'")
+                    return timings, False
+                deadline = time.monotonic() + seconds
+                while self.connected and time.monotonic() < deadline:
+                    text = self.read_available(deadline - time.monotonic())
+                    if text:
+                        received += text
+                        if echo:
+                            self.show(text)
+                continue
+            if line.startswith('@expect'):
+                expected = line[len('@expect'):].strip()
+                deadline = time.monotonic() + timeout
+                while expected not in received:
+                    text = self.read_available(max(0, deadline - time.monotonic()))
+                    if not text:
+                        print(f"\nExpected {expected!r} but the server {'went quiet' if text == '' else 'disconnected'}")
+                        return timings, False
+                    received += text
+                    if echo:
+                        self.show(text)
+                continue
+            if not self.connected:
+                print("\nThe server closed the connection")
+                return timings, False
+            if line.startswith('@password'):
+                line = line[len('@password'):].strip()
+                command, shown = None, '********'
+            else:
+                command = line.split()[0].lower() if line.split() else '(blank)'
+                shown = line
+            
+            # Anything that arrived unasked (chat, NPCs) is not part of this command's answer
+            text = self.read_available(0)
+            if text and echo:
+                self.show(text)
+            if echo:
+                self.show(shown + '\n')
+            start = time.perf_counter()
+            self.send_message(line)
+            received = self.read_available(timeout)
+            if received:
+                if command is not None:
+                    timings.setdefault(command, []).append(time.perf_counter() - start)
+                while self.connected:
+                    text = self.read_available(settle)
+                    if not text:
+                        break
+                    received += text
+            elif received == '':
+                print(f"\nNo answer to {shown!r} within {timeout:g} seconds")
+                return timings, False
+            if received and echo:
+                self.show(received)
+            received = received or ''
+        return timings, True
+    
     def start(self):
         """Start the client"""
         if not self.connect():
@@ -84,19 +210,45 @@ class MUDClient:
         finally:
             self.disconnect()
 
+def report_timings(timings):
+    """Print round trip statistics for each command"""
+    print(f"\n{'Command':<12} {'Count':<8} {'Mean ms':<9} {'p50 ms':<9} {'p99 ms':<9} {'Max ms':<9}")
+    print("-" * 58)
+    for command, samples in sorted(timings.items()):
+        samples = sorted(samples)
+        print(f"{command[:12]:<12} {len(samples):<8} {sum(samples) / len(samples) * 1000:<9.3f} "
+              f"{percentile(samples, 0.5) * 1000:<9.3f} {percentile(samples, 0.99) * 1000:<9.3f} "
+              f"{samples[-1] * 1000:<9.3f}")
+
+def run_script(client, path, settle, timeout, echo):
+    """Connect, play a script from a file or stdin ('-') and report round trips; returns the exit status"""
+    if not client.connect():
+        return 2
+    try:
+        if path == '-':
+            timings, passed = client.run_script(sys.stdin, settle, timeout, echo)
+        else:
+            with open(path) as f:
+                timings, passed = client.run_script(f, settle, timeout, echo)
+    finally:
+        client.disconnect()
+    if timings:
+        report_timings(timings)
+    return 0 if passed else 1
+
 if __name__ == "__main__":
-    # Allow command line arguments for host and port
-    host = 'localhost'
-    port = 4000
-    
-    if len(sys.argv) >= 2:
-        host = sys.argv[1]
-    if len(sys.argv) >= 3:
-        try:
-            port = int(sys.argv[2])
-        except ValueError:
-            print("Invalid port number")
-            sys.exit(1)
+    parser = argparse.ArgumentParser(description='PyPeake MUD Client')
+    parser.add_argument('host', nargs='?', default='localhost', help='Server host (default: localhost)')
+    parser.add_argument('port', nargs='?', type=int, default=4000, help='Server port (default: 4000)')
+    parser.add_argument('--script', help="Play commands from this file, or - for stdin, instead of the keyboard")
+    parser.add_argument('--settle', type=float, default=SETTLE_TIME,
+                        help=f'Seconds of quiet that end a response in script mode (default: {SETTLE_TIME})')
+    parser.add_argument('--timeout', type=float, default=RESPONSE_TIMEOUT,
+                        help=f'Seconds to wait for a response or @expect (default: {RESPONSE_TIMEOUT:g})')
+    parser.add_argument('--quiet', action='store_true', help="Don't show the server's output in script mode")
+    args = parser.parse_args()
     
-    client = MUDClient(host, port)
+    client = MUDClient(args.host, args.port)
+    if args.script:
+        sys.exit(run_script(client, args.script, args.settle, args.timeout, not args.quiet))
     client.start()
@@ -0,0 +1,251 @@
+"""
+Combat engine for PyPeake MUD
+Resolves every attack queued during a tick as one batch
+
+Copyright (c) 2025 PyPeake MUD
+Licensed under the MIT License - see LICENSE file for details
+"""
+
+import random
+from classes import CLASSES
+from vitals import HAS_NUMPY, np
+
+# Attack skills: the stat that drives damage, a damage multiplier and mana cost
+ATTACK_SKILLS = {
+    "Attack": {"stat": "strength", "multiplier": 1.0, "mana_cost": 0},
+    "Fireball": {"stat": "intelligence", "multiplier": 2.0, "mana_cost": 15},
+    "Magic Missile": {"stat": "intelligence", "multiplier": 1.5, "mana_cost": 8},
+    "Backstab": {"stat": "dexterity", "multiplier": 2.5, "mana_cost": 0},
+    "Archery": {"stat": "dexterity", "multiplier": 1.4, "mana_cost": 0},
+    "Holy Strike": {"stat": "wisdom", "multiplier": 1.6, "mana_cost": 10},
+    "Rage": {"stat": "strength", "multiplier": 1.8, "mana_cost": 0},
+}
+
+BASE_HIT_CHANCE = 0.75
+HIT_CHANCE_PER_DEXTERITY = 0.02
+MIN_HIT_CHANCE = 0.05
+MAX_HIT_CHANCE = 0.95
+DAMAGE_DIE = 6  # Each hit adds 1d6
+
+def hit_chance(attacker_dexterity, target_dexterity):
+    """Chance for an attack to land, from the two dexterity scores"""
+    chance = BASE_HIT_CHANCE + (attacker_dexterity - target_dexterity) * HIT_CHANCE_PER_DEXTERITY
+    return min(MAX_HIT_CHANCE, max(MIN_HIT_CHANCE, chance))
+
+def class_damage_multiplier(char_class):
+    """Damage multiplier of a character class"""
+    return CLASSES.get(char_class, {}).get("damage_multiplier", 1.0)
+
+def skill_multiplier(skill, char_class):
+    """Combined damage multiplier of a skill used by a character class"""
+    return ATTACK_SKILLS[skill]["multiplier"] * class_damage_multiplier(char_class)
+
+def attack_damage(stat, roll, multiplier, target_constitution):
+    """Damage of a landed attack before it is applied"""
+    return max(1, int((stat // 2 + roll) * multiplier) - target_constitution // 4)
+
+SKILL_NAMES = list(ATTACK_SKILLS)
+SKILL_INDEX = {skill: i for i, skill in enumerate(SKILL_NAMES)}
+
+class CombatEngine:
+    """Collects attacks during a tick and resolves them all at once
+
+    Each combatant gets one action per tick; queueing another attack
+    replaces the first. Attacks are queued as columns of slots, skill
+    numbers and multipliers, so when every combatant is attached to a
+    VitalsStore the whole batch is resolved with array operations: stats
+    are gathered by slot, hit and damage rolls come from a vectorized RNG,
+    and damage is applied to the columns in one pass. Otherwise the same
+    rules run as a plain loop over the player objects.
+    """
+
+    def __init__(self, vitals=None, notify=None, seed=None):
+        self.vitals = vitals
+        self.notify = notify
+        self.python_rng = random.Random(seed)
+        self.numpy_rng = np.random.default_rng(seed) if HAS_NUMPY else None
+        if HAS_NUMPY:
+            self.skill_costs = np.array([ATTACK_SKILLS[skill]["mana_cost"] for skill in SKILL_NAMES], dtype=np.int64)
+            self.skill_stats = [ATTACK_SKILLS[skill]["stat"] for skill in SKILL_NAMES]
+        self.clear()
+
+    def clear(self):
+        """Drop every queued attack"""
+        self.index = {}  # attacker -> position in the queue columns
+        self.attackers = []
+        self.targets = []
+        self.skills = []
+        self.attacker_slots = []
+        self.target_slots = []
+        self.class_multipliers = []
+
+    def slot(self, player):
+        """Get a player's VitalsStore slot, or -1 if they are not attached"""
+        state = player.__dict__
+        if self.vitals is not None and state.get('_vitals') is self.vitals:
+            return state['_vitals_slot']
+        return -1
+
+    def queue_attack(self, attacker, target, skill="Attack"):
+        """Queue an attack for the next resolve()"""
+        if skill not in ATTACK_SKILLS:
+            raise ValueError(f"Unknown attack skill: {skill}")
+        position = self.index.get(attacker)
+        if position is None:
+            self.index[attacker] = len(self.attackers)
+            self.attackers.append(attacker)
+            self.targets.append(target)
+            self.skills.append(SKILL_INDEX[skill])
+            self.attacker_slots.append(self.slot(attacker))
+            self.target_slots.append(self.slot(target))
+            self.class_multipliers.append(class_damage_multiplier(attacker.char_class))
+        else:
+            self.targets[position] = target
+            self.skills[position] = SKILL_INDEX[skill]
+            self.target_slots[position] = self.slot(target)
+
+    def resolve(self):
+        """Resolve every queued attack and send the combat messages
+
+        Returns a list of (attacker, target, damage) for each attack that
+        was made, with damage 0 for a miss.
+        """
+        if not self.attackers:
+            return []
+        attackers, targets, skills = self.attackers, self.targets, self.skills
+        attacker_slots, target_slots = self.attacker_slots, self.target_slots
+        class_multipliers = self.class_multipliers
+        self.clear()
+
+        if HAS_NUMPY and self.vitals is not None:
+            # A player who detached since queueing may have had their slot given to someone else
+            owners = self.vitals.players
+            for slots, players in ((attacker_slots, attackers), (target_slots, targets)):
+                for i, (slot, player) in enumerate(zip(slots, players)):
+                    if slot < 0 or owners[slot] is not player:
+                        slots[i] = self.slot(player)
+            attacker_slots = np.array(attacker_slots, dtype=np.int64)
+            target_slots = np.array(target_slots, dtype=np.int64)
+            batch = attacker_slots.min() >= 0 and target_slots.min() >= 0
+        else:
+            batch = False
+
+        if batch:
+            resolved = self.resolve_batch(attackers, targets, np.array(skills, dtype=np.int64),
+                                          attacker_slots, target_slots,
+                                          np.array(class_multipliers, dtype=np.float64))
+        else:
+            resolved = self.resolve_each(attackers, targets, skills)
+        attackers, targets, skills, damages, slain = resolved
+
+        if self.notify:
+            for attacker, target, skill, damage, killed in zip(attackers, targets, skills, damages, slain):
+                self.report(attacker, target, SKILL_NAMES[skill], damage, killed)
+        return list(zip(attackers, targets, damages))
+
+    def resolve_each(self, attackers, targets, skills):
+        """Resolve attacks one at a time on the player objects"""
+        rng = self.python_rng
+        attacks = []
+        for attacker, target, skill in zip(attackers, targets, skills):
+            if attacker.health <= 0 or target.health <= 0:
+                continue
+            # Fall back to a plain attack when there isn't enough mana for the skill
+            skill_data = ATTACK_SKILLS[SKILL_NAMES[skill]]
+            if skill_data["mana_cost"] and not attacker.use_mana(skill_data["mana_cost"]):
+                skill = SKILL_INDEX["Attack"]
+                skill_data = ATTACK_SKILLS["Attack"]
+
+            damage = 0
+            if rng.random() < hit_chance(attacker.dexterity, target.dexterity):
+                multiplier = skill_multiplier(SKILL_NAMES[skill], attacker.char_class)
+                stat = getattr(attacker, skill_data["stat"])
+                roll = rng.randint(1, DAMAGE_DIE)
+                damage = attack_damage(stat, roll, multiplier, target.constitution)
+            attacks.append((attacker, target, skill, damage))
+
+        totals = {}
+        for _, target, _, damage in attacks:
+            if damage:
+                totals[target] = totals.get(target, 0) + damage
+        for target, damage in totals.items():
+            target.take_damage(damage)
+
+        # Credit a kill to the first attacker that hit the target this tick
+        slain = []
+        credited = set()
+        for _, target, _, damage in attacks:
+            killed = damage > 0 and target not in credited and target.health == 0
+            if killed:
+                credited.add(target)
+            slain.append(killed)
+
+        if not attacks:
+            return [], [], [], [], []
+        attackers, targets, skills, damages = (list(column) for column in zip(*attacks))
+        return attackers, targets, skills, damages, slain
+
+    def resolve_batch(self, attackers, targets, skills, attacker_slots, target_slots, multiplier):
+        """Resolve attacks as vector operations on VitalsStore columns"""
+        columns = self.vitals.columns
+        health = columns['health']
+        mana = columns['mana']
+
+        with self.vitals.lock:
+            alive = (health[attacker_slots] > 0) & (health[target_slots] > 0)
+            if not alive.all():
+                keep = np.flatnonzero(alive)
+                attacker_slots, target_slots = attacker_slots[keep], target_slots[keep]
+                skills, multiplier = skills[keep], multiplier[keep]
+                keep = keep.tolist()
+                attackers = [attackers[i] for i in keep]
+                targets = [targets[i] for i in keep]
+            count = len(attackers)
+
+            # Fall back to a plain attack when there isn't enough mana for the skill;
+            # each attacker appears once, so the fancy-indexed update is safe
+            costs = self.skill_costs[skills]
+            affordable = mana[attacker_slots] >= costs
+            mana[attacker_slots] -= np.where(affordable, costs, 0)
+            skills = np.where(affordable, skills, SKILL_INDEX["Attack"])
+
+            stat = np.empty(count, dtype=np.int64)
+            for skill_number in np.unique(skills).tolist():
+                mask = skills == skill_number
+                multiplier[mask] *= ATTACK_SKILLS[SKILL_NAMES[skill_number]]["multiplier"]
+                stat[mask] = columns[self.skill_stats[skill_number]][attacker_slots[mask]]
+
+            rng = self.numpy_rng
+            chance = np.clip(BASE_HIT_CHANCE + (columns['dexterity'][attacker_slots] - columns['dexterity'][target_slots])
+                             * HIT_CHANCE_PER_DEXTERITY, MIN_HIT_CHANCE, MAX_HIT_CHANCE)
+            hits = rng.random(count) < chance
+            rolls = rng.integers(1, DAMAGE_DIE + 1, count)
+            damage = ((stat // 2 + rolls) * multiplier).astype(np.int64) - columns['constitution'][target_slots] // 4
+            damage = np.where(hits, np.maximum(1, damage), 0)
+
+            # Several attackers may share a target, so total the damage per slot
+            totals = np.bincount(target_slots, weights=damage, minlength=len(health)).astype(np.int64)
+            np.maximum(health - totals, 0, out=health)
+
+            # Credit a kill to the first attacker that hit the target this tick
+            died = (damage > 0) & (health[target_slots] == 0)
+            slain = np.zeros(count, dtype=bool)
+            _, first = np.unique(target_slots[died], return_index=True)
+            slain[np.flatnonzero(died)[first]] = True
+
+        return attackers, targets, skills.tolist(), damage.tolist(), slain.tolist()
+
+    def report(self, attacker, target, skill, damage, slain):
+        """Tell both sides what happened"""
+        if damage == 0:
+            self.notify(attacker, f"Your attack on {target.name} misses.")
+            self.notify(target, f"{attacker.name}'s attack misses you.")
+            return
+
+        using = "" if skill == "Attack" else f" with {skill}"
+        self.notify(attacker, f"You hit {target.name}{using} for {damage} damage.")
+        self.notify(target, f"{attacker.name} hits you{using} for {damage} damage.")
+
+        if slain:
+            self.notify(attacker, f"You have slain {target.name}!")
+            self.notify(target, f"You have been slain by {attacker.name}!")
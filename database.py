@@ -8,12 +8,147 @@ Licensed under the MIT License - see LICENSE file for details
 
 import json
 import os
-from datetime import datetime
+import csv
+import heapq
+import itertools
+import bisect
+import gc
+import threading
+import time
+from datetime import datetime, timedelta
+from leaderboard import IndexableSkipList, Leaderboard
+from names import NameIndex, name_key
+
+# Fields written by export_players; password hashes are never exported
+EXPORT_FIELDS = [
+    'name', 'race', 'char_class', 'level', 'experience',
+    'health', 'max_health', 'mana', 'max_mana', 'location',
+    'created_at', 'last_login'
+]
+
+# Seconds the background writer waits after a save, so a burst of saves is written once
+WRITE_DELAY = 1.0
+
+# Sort keys accepted by iter_sorted_players; usernames are name_key(name), the name index's order
+SORT_KEYS = {
+    'name': lambda item: item[0],
+    'race': lambda item: item[1].get('race', ''),
+    'class': lambda item: item[1].get('char_class', ''),
+    'level': lambda item: item[1].get('level', 1),
+    'experience': lambda item: item[1].get('experience', 0),
+    'created_at': lambda item: item[1].get('created_at', ''),
+    'last_login': lambda item: item[1].get('last_login', ''),
+}
+
+def created_timestamp(player_data):
+    """Get a player's creation time as a number, or 0 if it is missing or invalid"""
+    try:
+        return datetime.fromisoformat(player_data.get('created_at', '')).timestamp()
+    except ValueError:
+        return 0
+
+def login_timestamp(player_data):
+    """Get a player's last login as a number, None if missing or 0 if invalid"""
+    last_login = player_data.get('last_login', '')
+    if not last_login:
+        return None
+    try:
+        return datetime.fromisoformat(last_login).timestamp()
+    except ValueError:
+        # Invalid dates sort first so cleanup treats them as expired
+        return 0
+
+# Scores tracked by Database.leaderboards
+LEADERBOARD_METRICS = {
+    'level': lambda player_data: player_data.get('level', 1),
+    'experience': lambda player_data: player_data.get('experience', 0),
+    'created_at': created_timestamp,
+}
+
+def player_filter(race=None, char_class=None, min_level=None, max_level=None):
+    """Build a test for player records matching the given filters"""
+    race = race.lower() if race else None
+    char_class = char_class.lower() if char_class else None
+    
+    def matches(player_data):
+        if race and player_data.get('race', '').lower() != race:
+            return False
+        if char_class and player_data.get('char_class', '').lower() != char_class:
+            return False
+        level = player_data.get('level', 1)
+        if min_level is not None and level < min_level:
+            return False
+        return max_level is None or level <= max_level
+    return matches
+
+def level_range(level):
+    """Get the five-level band a level falls in, such as '6-10'"""
+    low = (level - 1) // 5 * 5 + 1
+    return f"{low}-{low + 4}"
+
+class PopulationStats:
+    """Race, class and level counts kept up to date as players come and go"""
+    
+    def __init__(self):
+        self.total_players = 0
+        self.total_level = 0
+        self.races = {}
+        self.classes = {}
+        self.level_distribution = {}
+    
+    def count(self, counts, key, delta):
+        """Adjust one histogram entry, dropping it when it reaches zero"""
+        value = counts.get(key, 0) + delta
+        if value:
+            counts[key] = value
+        else:
+            del counts[key]
+    
+    def add(self, race, char_class, level, delta=1):
+        """Count a player in (or out, with delta=-1)"""
+        self.total_players += delta
+        self.total_level += level * delta
+        self.count(self.races, race, delta)
+        self.count(self.classes, char_class, delta)
+        self.count(self.level_distribution, level_range(level), delta)
+    
+    def remove(self, race, char_class, level):
+        """Count a player out"""
+        self.add(race, char_class, level, -1)
+    
+    def export(self):
+        """Get the statistics in the format of Database.export_player_stats"""
+        return {
+            'total_players': self.total_players,
+            'races': dict(self.races),
+            'classes': dict(self.classes),
+            'level_distribution': dict(self.level_distribution),
+            'average_level': self.total_level / self.total_players if self.total_players else 0
+        }
+
+def stats_key(player_data):
+    """Get the (race, class, level) a player is counted under in PopulationStats"""
+    return (player_data.get('race', 'Unknown'), player_data.get('char_class', 'Unknown'),
+            player_data.get('level', 1))
+
+def atomic_write_json(path, data, indent=None):
+    """Write JSON to path so readers only ever see a complete file"""
+    temp_file = f"{path}.tmp"
+    with open(temp_file, 'w') as f:
+        json.dump(data, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, path)
 
 class Database:
     def __init__(self, db_file="players.json"):
         self.db_file = db_file
         self.players = {}
+        self.lock = threading.RLock()
+        self.write_lock = threading.Lock()  # One writer of the file at a time
+        self.dirty = None  # Set by saves once start_writer has been called
+        self.save_sequence = 0     # Saves made so far
+        self.written_sequence = 0  # Saves included in the file as last written
         self.load_players()
     
     def load_players(self):
@@ -29,142 +164,455 @@ class Database:
         else:
             print("No existing player database found, creating new one")
             self.players = {}
+        if any(name_key(username) != username for username in self.players):
+            # Files written before names were casefolded used lower()
+            self.players = self.rekey_players(self.players)
+        self.rebuild_indexes()
     
-    def save_players(self):
-        """Save all player data to JSON file"""
+    def rekey_players(self, players):
+        """Key records by name_key, renaming any that would collide
+
+        Names that lower() kept apart, such as "Straße" and "STRASSE",
+        share a casefolded key. The record already stored under the key
+        keeps it and the others get a numbered name rather than being
+        overwritten; each rename is reported so it can be passed on.
+        """
+        # Records already under their casefolded key go first, so they are the ones kept
+        ordered = sorted(players.items(), key=lambda item: name_key(item[0]) != item[0])
+        rekeyed = {}
+        for username, player_data in ordered:
+            key = name_key(username)
+            if key in rekeyed:
+                name = player_data.get('name', username)
+                number = 2
+                while name_key(f"{name}{number}") in players or name_key(f"{name}{number}") in rekeyed:
+                    number += 1
+                player_data = dict(player_data, name=f"{name}{number}", renamed_from=name)
+                key = name_key(player_data['name'])
+                print(f"Warning: {name} collides with {rekeyed[name_key(username)].get('name')}; "
+                      f"renamed to {player_data['name']}")
+            rekeyed[key] = player_data
+        return rekeyed
+    
+    def rebuild_indexes(self):
+        """Rebuild every index from the loaded player records
+
+        The indexes are millions of small objects for a large player file;
+        the cyclic garbage collector is paused while they are built, since
+        none of them can be garbage and repeated full collections over the
+        growing heap would otherwise dominate the build time.
+        """
+        gc_enabled = gc.isenabled()
+        gc.disable()
         try:
-            # Create backup of existing file
-            if os.path.exists(self.db_file):
-                backup_file = f"{self.db_file}.backup"
-                os.rename(self.db_file, backup_file)
-            
-            with open(self.db_file, 'w') as f:
-                json.dump(self.players, f, indent=2)
-            
-            # Remove backup if save was successful
-            backup_file = f"{self.db_file}.backup"
-            if os.path.exists(backup_file):
-                os.remove(backup_file)
+            with self.lock:
+                self.names = NameIndex.from_keys(self.players)
+                
+                self.leaderboards = {
+                    metric: Leaderboard.from_scores({username: score(player_data)
+                                                     for username, player_data in self.players.items()})
+                    for metric, score in LEADERBOARD_METRICS.items()
+                }
+                
+                self.level_buckets = {}  # level -> set of usernames
+                self.player_levels = {}  # username -> level they are bucketed under
+                for username, player_data in self.players.items():
+                    self.bucket_player(username, player_data.get('level', 1))
+                self.bucket_levels = sorted(self.level_buckets)
                 
-        except IOError as e:
-            print(f"Error saving player database: {e}")
-            # Restore backup if save failed
-            backup_file = f"{self.db_file}.backup"
-            if os.path.exists(backup_file):
-                os.rename(backup_file, self.db_file)
+                self.stats = PopulationStats()
+                self.stats_keys = {}  # username -> (race, class, level) they are counted under
+                for username, player_data in self.players.items():
+                    key = stats_key(player_data)
+                    self.stats.add(*key)
+                    self.stats_keys[username] = key
+                
+                self.login_times = {}  # username -> last login timestamp
+                for username, player_data in self.players.items():
+                    timestamp = login_timestamp(player_data)
+                    if timestamp is not None:
+                        self.login_times[username] = timestamp
+                # (timestamp, username) pairs in order, in a skip list so a save updates it in O(log n)
+                self.login_index = IndexableSkipList.from_sorted(
+                    sorted((timestamp, username) for username, timestamp in self.login_times.items()))
+        finally:
+            if gc_enabled:
+                gc.enable()
+    
+    def index_player(self, username, player_data):
+        """Add or update a player record in every index"""
+        self.names.add(username)
+        
+        for metric, score in LEADERBOARD_METRICS.items():
+            self.leaderboards[metric].update(username, score(player_data))
+        
+        level = player_data.get('level', 1)
+        if self.player_levels.get(username) != level:
+            self.unbucket_player(username)
+            if level not in self.level_buckets:
+                bisect.insort(self.bucket_levels, level)
+            self.bucket_player(username, level)
+        
+        key = stats_key(player_data)
+        old_key = self.stats_keys.get(username)
+        if key != old_key:
+            if old_key is not None:
+                self.stats.remove(*old_key)
+            self.stats.add(*key)
+            self.stats_keys[username] = key
+        
+        timestamp = login_timestamp(player_data)
+        old_timestamp = self.login_times.get(username)
+        if timestamp != old_timestamp:
+            if old_timestamp is not None:
+                self.unindex_login(username)
+            if timestamp is not None:
+                self.login_index.insert((timestamp, username))
+                self.login_times[username] = timestamp
+    
+    def unindex_player(self, username):
+        """Remove a player from every index"""
+        self.names.remove(username)
+        for leaderboard in self.leaderboards.values():
+            leaderboard.remove(username)
+        self.unbucket_player(username)
+        self.unindex_login(username)
+        key = self.stats_keys.pop(username, None)
+        if key is not None:
+            self.stats.remove(*key)
+    
+    def bucket_player(self, username, level):
+        """Put a player in the bucket for their level"""
+        self.level_buckets.setdefault(level, set()).add(username)
+        self.player_levels[username] = level
+    
+    def unbucket_player(self, username):
+        """Take a player out of their level bucket, dropping the bucket if it empties"""
+        level = self.player_levels.pop(username, None)
+        if level is None:
+            return
+        bucket = self.level_buckets[level]
+        bucket.discard(username)
+        if not bucket:
+            del self.level_buckets[level]
+            del self.bucket_levels[bisect.bisect_left(self.bucket_levels, level)]
+    
+    def unindex_login(self, username):
+        """Take a player out of the last-login index"""
+        timestamp = self.login_times.pop(username, None)
+        if timestamp is not None:
+            self.login_index.remove((timestamp, username))
+    
+    def update_progress(self, player):
+        """Bring an online player's record and indexes up to date after they gain experience
+
+        The stored record is replaced with the player's current state, so
+        leaderboards, level buckets and stats never disagree with it. It is
+        written to the file with the next save, like any other change.
+        """
+        username = name_key(player.name)
+        with self.lock:
+            stored = self.players.get(username)
+            if stored is not None:
+                player_data = player.to_dict()
+                if 'last_saved' in stored:
+                    player_data['last_saved'] = stored['last_saved']
+                self.players[username] = player_data
+                self.index_player(username, player_data)
+    
+    def save_players(self):
+        """Save all player data to JSON file
+
+        Once start_writer has been called this only marks the database
+        dirty, and the writer thread writes it shortly afterwards.
+        """
+        with self.lock:
+            self.save_sequence += 1
+        if self.dirty is not None:
+            self.dirty.set()
+            return
+        self.write_file()
+    
+    def write_file(self):
+        """Write a snapshot of every record to the JSON file
+
+        The lock is only held to copy the dict, so saves and lookups carry
+        on while the file is written.
+        """
+        with self.write_lock:
+            with self.lock:
+                sequence = self.save_sequence
+                players = dict(self.players)
+            try:
+                atomic_write_json(self.db_file, players, indent=2)
+            except (IOError, OSError) as e:
+                print(f"Error saving player database: {e}")
+                return
+            self.written_sequence = sequence
+    
+    def start_writer(self, delay=WRITE_DELAY):
+        """Write the file from a background thread from now on
+
+        Saves then cost a dict update and reindex on the caller's thread,
+        and a burst of them is written to the file once. Call flush() on
+        shutdown to write anything still pending.
+        """
+        self.dirty = threading.Event()
+        writer_thread = threading.Thread(target=self.run_writer, args=(self.dirty, delay))
+        writer_thread.daemon = True
+        writer_thread.start()
+    
+    def run_writer(self, dirty, delay):
+        while True:
+            dirty.wait()
+            time.sleep(delay)
+            dirty.clear()
+            self.write_file()
+    
+    def flush(self):
+        """Write any saves the background writer has not written yet
+
+        Waits for a write already in progress, then writes again unless
+        that write included every save, so nothing saved before the call
+        is lost however the writer thread is interrupted afterwards.
+        """
+        with self.write_lock:
+            pending = self.written_sequence < self.save_sequence
+        if pending:
+            self.write_file()
+    
+    def snapshot(self):
+        """Return a point-in-time copy of all player records
+
+        Records are replaced rather than modified when saved, so a shallow
+        copy taken under the lock is consistent and cheap enough to take
+        while the server is running.
+        """
+        with self.lock:
+            return dict(self.players)
     
     def get_player(self, username):
         """Get player data by username"""
-        return self.players.get(username.lower())
+        return self.players.get(name_key(username))
     
     def save_player(self, player_data):
         """Save or update a player's data"""
-        username = player_data['name'].lower()
+        username = name_key(player_data['name'])
         player_data['last_saved'] = datetime.now().isoformat()
-        self.players[username] = player_data
-        self.save_players()
+        with self.lock:
+            self.players[username] = player_data
+            self.index_player(username, player_data)
+            self.save_players()
         print(f"Player {player_data['name']} saved to database")
     
+    def save_many(self, records):
+        """Save or update many players' data with a single write of the database file"""
+        saved_at = datetime.now().isoformat()
+        with self.lock:
+            for player_data in records:
+                username = name_key(player_data['name'])
+                player_data['last_saved'] = saved_at
+                self.players[username] = player_data
+                self.index_player(username, player_data)
+            if records:
+                self.save_players()
+        print(f"Saved {len(records)} players to database")
+    
     def delete_player(self, username):
         """Delete a player from the database"""
-        username = username.lower()
-        if username in self.players:
-            del self.players[username]
-            self.save_players()
-            return True
+        username = name_key(username)
+        with self.lock:
+            if username in self.players:
+                del self.players[username]
+                self.unindex_player(username)
+                self.save_players()
+                return True
         return False
     
     def player_exists(self, username):
         """Check if a player exists in the database"""
-        return username.lower() in self.players
+        return name_key(username) in self.players
+    
+    def find_players(self, partial, limit=10):
+        """Get stored players matching a partial name
+
+        An exact match is returned on its own; otherwise up to limit
+        players whose names start with partial, in name order.
+        """
+        with self.lock:
+            return [self.players[username] for username in self.names.resolve(partial, limit)]
     
     def get_all_players(self):
         """Get all player data"""
         return self.players
     
+    def iter_players(self, race=None, char_class=None, min_level=None, max_level=None):
+        """Yield (username, player_data) pairs matching the given filters
+
+        Walks a snapshot, so it is safe from any thread while players are
+        being saved; only the dict is copied, never the records.
+        """
+        matches = player_filter(race, char_class, min_level, max_level)
+        for username, player_data in self.snapshot().items():
+            if matches(player_data):
+                yield username, player_data
+    
+    def iter_players_by_name(self, descending=False, **filters):
+        """Yield (username, player_data) pairs matching the filters in name order
+
+        Streams from a copy of the name index's keys, so only one record
+        is looked at a time. Players deleted meanwhile are skipped.
+        """
+        matches = player_filter(**filters)
+        with self.lock:
+            keys = list(self.names.keys)
+        for username in reversed(keys) if descending else keys:
+            player_data = self.players.get(username)
+            if player_data is not None and matches(player_data):
+                yield username, player_data
+    
+    def iter_sorted_players(self, sort_by='name', descending=False, offset=0, limit=None, **filters):
+        """Yield one page of filtered players in sorted order
+
+        Name order is streamed from the name index. Other orders hold only
+        offset + limit entries in a bounded heap when given a limit; with
+        no limit they have no index to follow and sort every match.
+        """
+        if sort_by not in SORT_KEYS:
+            raise ValueError(f"Unknown sort key: {sort_by}")
+        if offset < 0 or (limit is not None and limit < 0):
+            raise ValueError("Offset and limit can't be negative")
+        if sort_by == 'name':
+            stop = None if limit is None else offset + limit
+            yield from itertools.islice(self.iter_players_by_name(descending, **filters), offset, stop)
+            return
+        key = SORT_KEYS[sort_by]
+        matches = self.iter_players(**filters)
+        
+        if limit is not None:
+            select = heapq.nlargest if descending else heapq.nsmallest
+            page = select(offset + limit, matches, key=key)[offset:]
+        else:
+            page = sorted(matches, key=key, reverse=descending)[offset:]
+        
+        for username, player_data in page:
+            yield username, player_data
+    
+    def export_players(self, stream, fmt='jsonl', **filters):
+        """Stream matching players to a file object as JSONL or CSV
+
+        Returns the number of players written.
+        """
+        if fmt == 'csv':
+            writer = csv.DictWriter(stream, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            write = writer.writerow
+        elif fmt == 'jsonl':
+            def write(record):
+                stream.write(json.dumps(record) + '\n')
+        else:
+            raise ValueError(f"Unknown export format: {fmt}")
+        
+        count = 0
+        for username, player_data in self.iter_players(**filters):
+            record = {field: player_data.get(field) for field in EXPORT_FIELDS}
+            if record['name'] is None:
+                record['name'] = username
+            write(record)
+            count += 1
+        return count
+    
     def get_player_count(self):
         """Get total number of players"""
         return len(self.players)
     
     def get_players_by_level(self, min_level=None, max_level=None):
-        """Get players within a level range"""
-        filtered_players = {}
-        for username, player_data in self.players.items():
-            level = player_data.get('level', 1)
-            if min_level is not None and level < min_level:
-                continue
-            if max_level is not None and level > max_level:
-                continue
-            filtered_players[username] = player_data
-        return filtered_players
+        """Get players within a level range
+
+        Only the level buckets inside the range are visited.
+        """
+        with self.lock:
+            levels = self.bucket_levels
+            start = 0 if min_level is None else bisect.bisect_left(levels, min_level)
+            stop = len(levels) if max_level is None else bisect.bisect_right(levels, max_level)
+            filtered_players = {}
+            for level in levels[start:stop]:
+                for username in self.level_buckets[level]:
+                    filtered_players[username] = self.players[username]
+            return filtered_players
     
     def get_top_players(self, limit=10, sort_by='level'):
         """Get top players sorted by specified criteria"""
-        players_list = list(self.players.items())
-        
-        if sort_by == 'level':
-            players_list.sort(key=lambda x: x[1].get('level', 1), reverse=True)
-        elif sort_by == 'experience':
-            players_list.sort(key=lambda x: x[1].get('experience', 0), reverse=True)
-        elif sort_by == 'created_at':
-            players_list.sort(key=lambda x: x[1].get('created_at', ''), reverse=True)
-        
-        return dict(players_list[:limit])
+        if sort_by not in LEADERBOARD_METRICS:
+            raise ValueError(f"Unknown leaderboard: {sort_by}")
+        with self.lock:
+            top = self.leaderboards[sort_by].top(limit)
+            return {username: self.players[username] for _, username, _ in top}
+    
+    def get_rank(self, username, sort_by='level'):
+        """Get a player's 1-based rank by the specified criteria, or None"""
+        with self.lock:
+            return self.leaderboards[sort_by].rank(name_key(username))
+    
+    def get_players_around(self, username, count=2, sort_by='level'):
+        """Get (rank, player_data) for up to count players either side of a player"""
+        with self.lock:
+            nearby = self.leaderboards[sort_by].around(name_key(username), count)
+            return [(rank, self.players[name]) for rank, name, _ in nearby]
+    
+    def get_inactive_players(self, days_inactive=30):
+        """Get usernames of players who haven't logged in for specified days
+
+        The last-login index is sorted, so this takes the entries before
+        the cutoff and costs O(log n + inactive players) rather than a
+        parse of every record. Invalid last login dates are included.
+        """
+        cutoff = (datetime.now() - timedelta(days=days_inactive)).timestamp()
+        with self.lock:
+            stop = self.login_index.bisect_left((cutoff,))
+            return [username for _, username in self.login_index.slice(0, stop)]
     
     def cleanup_old_players(self, days_inactive=30):
-        """Remove players who haven't logged in for specified days"""
-        from datetime import datetime, timedelta
-        
-        cutoff_date = datetime.now() - timedelta(days=days_inactive)
-        players_to_remove = []
-        
-        for username, player_data in self.players.items():
-            last_login = player_data.get('last_login', '')
-            if last_login:
-                try:
-                    login_date = datetime.fromisoformat(last_login)
-                    if login_date < cutoff_date:
-                        players_to_remove.append(username)
-                except ValueError:
-                    # Invalid date format, consider for removal
-                    players_to_remove.append(username)
-        
-        for username in players_to_remove:
-            del self.players[username]
+        """Remove players who haven't logged in for specified days
+
+        The expired players are a prefix of the last-login index, so it is
+        cut once, and the name index and leaderboards drop them in one pass
+        each. A large cleanup rebuilds the leaderboards, so the garbage
+        collector is paused for it as in rebuild_indexes.
+        """
+        cutoff = (datetime.now() - timedelta(days=days_inactive)).timestamp()
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with self.lock:
+                stop = self.login_index.bisect_left((cutoff,))
+                players_to_remove = [username for _, username in self.login_index.remove_first(stop)]
+                for username in players_to_remove:
+                    del self.players[username]
+                    del self.login_times[username]
+                    self.unbucket_player(username)
+                    key = self.stats_keys.pop(username, None)
+                    if key is not None:
+                        self.stats.remove(*key)
+                
+                if players_to_remove:
+                    self.names.remove_many(players_to_remove)
+                    for leaderboard in self.leaderboards.values():
+                        leaderboard.remove_many(players_to_remove)
+        finally:
+            if gc_enabled:
+                gc.enable()
         
         if players_to_remove:
             self.save_players()
             print(f"Removed {len(players_to_remove)} inactive players")
-        
         return len(players_to_remove)
     
     def export_player_stats(self):
-        """Export basic statistics about players"""
-        stats = {
-            'total_players': len(self.players),
-            'races': {},
-            'classes': {},
-            'level_distribution': {},
-            'average_level': 0
-        }
-        
-        total_level = 0
-        for player_data in self.players.values():
-            # Race stats
-            race = player_data.get('race', 'Unknown')
-            stats['races'][race] = stats['races'].get(race, 0) + 1
-            
-            # Class stats
-            char_class = player_data.get('char_class', 'Unknown')
-            stats['classes'][char_class] = stats['classes'].get(char_class, 0) + 1
-            
-            # Level stats
-            level = player_data.get('level', 1)
-            total_level += level
-            level_range = f"{(level-1)//5*5+1}-{(level-1)//5*5+5}"
-            stats['level_distribution'][level_range] = stats['level_distribution'].get(level_range, 0) + 1
-        
-        if len(self.players) > 0:
-            stats['average_level'] = total_level / len(self.players)
-        
-        return stats
+        """Export basic statistics about players
+
+        The counts are kept up to date as players are saved and deleted,
+        so this only copies the histograms and never walks the records.
+        """
+        with self.lock:
+            return self.stats.export()
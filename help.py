@@ -0,0 +1,285 @@
+"""
+Help system for PyPeake MUD
+Pre-rendered help on commands, races, classes, skills and items
+
+Every entry is rendered once when the index is built, and an inverted
+keyword index maps each word to the entries containing it, so a lookup
+or search only touches the entries it returns.
+
+Copyright (c) 2025 PyPeake MUD
+Licensed under the MIT License - see LICENSE file for details
+"""
+
+import importlib.util
+import os
+import re
+import sys
+
+GAME_COMMANDS = {
+    "stats": {
+        "usage": "stats",
+        "summary": "View your character stats",
+        "description": "Shows your level, experience, health, mana and the six core attributes."
+    },
+    "look": {
+        "usage": "look",
+        "summary": "Look around your current location",
+        "description": "Describes the place you are standing and the ways out of it."
+    },
+    "who": {
+        "usage": "who",
+        "summary": "See who else is online",
+        "description": "Lists every other player in the game with their level, race and class."
+    },
+    "inventory": {
+        "usage": "inventory",
+        "summary": "See what you are carrying",
+        "description": "Lists the items you carry and their total weight. 'inv' and 'i' work too."
+    },
+    "examine": {
+        "usage": "examine <item>",
+        "summary": "Look closely at something you carry",
+        "description": "Describes an item in your inventory. Any word of the item's name, or its start, is enough."
+    },
+    "say": {
+        "usage": "say <message>",
+        "summary": "Say something to other players",
+        "description": "Speaks on the global channel, so every player who hasn't left it hears you."
+    },
+    "tell": {
+        "usage": "tell <name> <message>",
+        "summary": "Talk privately to a player (the start of a name is enough)",
+        "description": "Sends a private message to one online player. If the start of a name matches "
+                       "more than one player you are asked which one you meant."
+    },
+    "finger": {
+        "usage": "finger <name>",
+        "summary": "Look up any player, online or not",
+        "description": "Shows a player's level, race and class, and when they were last seen."
+    },
+    "chat": {
+        "usage": "chat <channel> <message>",
+        "summary": "Talk on a channel (race, class, global or guild:<name>)",
+        "description": "Posts on a chat channel you are in. 'race' and 'class' stand for your own "
+                       "race and class channels."
+    },
+    "channels": {
+        "usage": "channels / join <channel> / leave <channel> / history <channel>",
+        "summary": "Manage your channels",
+        "description": "Lists your channels, joins the global channel, a guild channel or your own race "
+                       "or class channel, leaves one, or shows a channel's recent messages. Server "
+                       "announcements can't be left."
+    },
+    "top": {
+        "usage": "top [level|experience|created_at]",
+        "summary": "See the leaderboard",
+        "description": "Shows the highest ranked players by level (the default), experience or age."
+    },
+    "rank": {
+        "usage": "rank [level|experience|created_at]",
+        "summary": "See your rank and who is near you",
+        "description": "Shows your position on a leaderboard and the players just above and below you."
+    },
+    "help": {
+        "usage": "help [topic] / help search <words>",
+        "summary": "Read about commands, races, classes, skills and items",
+        "description": "With no topic, lists every topic. 'help search' finds topics mentioning all "
+                       "of the words given."
+    },
+    "quit": {
+        "usage": "quit",
+        "summary": "Leave the game",
+        "description": "Saves your character and disconnects."
+    }
+}
+
+# Words too common to be worth indexing
+STOP_WORDS = {"the", "and", "for", "with", "you", "your", "are", "but", "not", "its", "this", "that", "from"}
+
+WORD = re.compile(r"[a-z0-9]+")
+
+# Where each category of help comes from: (module, attribute holding the data)
+SOURCES = {
+    'command': ('help', 'GAME_COMMANDS'),
+    'race': ('races', 'RACES'),
+    'class': ('classes', 'CLASSES'),
+    'item': ('items', 'ITEMS'),
+}
+
+CATEGORY_HEADINGS = {
+    'command': "Commands",
+    'race': "Races",
+    'class': "Classes",
+    'skill': "Skills",
+    'item': "Items",
+}
+
+def topic_key(title):
+    """Normalize a topic title for lookups"""
+    return ' '.join(title.casefold().split())
+
+def keywords(text):
+    """The distinct indexable words in a piece of text"""
+    return {word for word in WORD.findall(text.casefold()) if len(word) > 2 and word not in STOP_WORDS}
+
+def render_command(name, command):
+    return f"{command['usage']}\n{command['summary']}.\n\n{command['description']}\n"
+
+def render_skill(skill, class_names):
+    return f"{skill}\nA starting skill of: {', '.join(sorted(class_names))}\n"
+
+def command_summary(commands):
+    """The command list shown when a player enters the game"""
+    lines = ["\n=== Game Commands ==="]
+    lines += [f"- {command['usage']}: {command['summary']}" for command in commands.values()]
+    return '\n'.join(lines)
+
+class HelpEntry:
+    """One pre-rendered help topic"""
+
+    __slots__ = ('key', 'title', 'category', 'text', 'words', 'fingerprint')
+
+    def __init__(self, title, category, text, fingerprint):
+        self.key = topic_key(title)
+        self.title = title
+        self.category = category
+        self.text = f"=== {title} ({category}) ===\n{text}"
+        self.words = keywords(f"{title} {text}")
+        self.fingerprint = fingerprint  # repr of the data it was rendered from
+
+class HelpIndex:
+    """Every help entry, keyed by topic, with an inverted keyword index
+
+    refresh re-reads the data modules whose files changed on disk and
+    re-renders only the entries whose data differs, so help can be
+    updated while the server runs. The running game keeps using the data
+    it was started with.
+    """
+
+    def __init__(self):
+        self.entries = {}   # topic key -> HelpEntry
+        self.postings = {}  # keyword -> set of topic keys
+        self.modules = {}   # module name -> (module the data came from, its file's modification time)
+        self.topic_list = None
+        self.summary = None
+        self.refresh(reload=False)
+
+    def module_data(self, module_name, attribute, reload):
+        """Get a data module and its data, reading the module afresh if reload is set and its file changed"""
+        module, mtime = self.modules.get(module_name, (None, None))
+        if module is None:
+            module = sys.modules.get(module_name) or importlib.import_module(module_name)
+            mtime = os.path.getmtime(module.__file__)
+        elif reload and os.path.getmtime(module.__file__) != mtime:
+            spec = importlib.util.spec_from_file_location(f"{module_name}_help", module.__file__)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            mtime = os.path.getmtime(module.__file__)
+        self.modules[module_name] = (module, mtime)
+        return module, getattr(module, attribute)
+
+    def compile(self, reload):
+        """Yield (title, category, fingerprint, render) for every topic"""
+        modules = {}
+        for category, (module_name, attribute) in SOURCES.items():
+            modules[category] = self.module_data(module_name, attribute, reload)
+
+        module, commands = modules['command']
+        self.commands = commands
+        for name, command in commands.items():
+            yield name, 'command', repr(command), lambda name=name, command=command: render_command(name, command)
+        module, races = modules['race']
+        for name, race in races.items():
+            yield name, 'race', repr(race), lambda name=name, module=module: module.get_race_description(name)
+        module, classes = modules['class']
+        skills = {}
+        for name, char_class in classes.items():
+            yield name, 'class', repr(char_class), lambda name=name, module=module: module.get_class_description(name)
+            for skill in char_class.get('starting_skills', []):
+                skills.setdefault(skill, set()).add(name)
+        for skill, class_names in skills.items():
+            yield skill, 'skill', repr(sorted(class_names)), \
+                lambda skill=skill, class_names=class_names: render_skill(skill, class_names)
+        module, items = modules['item']
+        for template_id, item in items.items():
+            yield item['name'], 'item', repr(item), \
+                lambda template_id=template_id, module=module: module.get_item_description(template_id)
+
+    def refresh(self, reload=True):
+        """Bring the index up to date, returning counts of added, updated and removed topics"""
+        counts = {'added': 0, 'updated': 0, 'removed': 0}
+        seen = set()
+        for title, category, fingerprint, render in self.compile(reload):
+            key = topic_key(title)
+            if key in seen:
+                continue  # The first source to use a title wins, e.g. a command over an item
+            seen.add(key)
+            entry = self.entries.get(key)
+            if entry is not None and entry.category == category and entry.fingerprint == fingerprint:
+                continue
+            counts['updated' if entry is not None else 'added'] += 1
+            if entry is not None:
+                self.unindex(entry)
+            self.index(HelpEntry(title, category, render(), fingerprint))
+
+        for key in [key for key in self.entries if key not in seen]:
+            self.unindex(self.entries[key])
+            counts['removed'] += 1
+        if any(counts.values()):
+            self.topic_list = None
+            self.summary = None
+        return counts
+
+    def index(self, entry):
+        self.entries[entry.key] = entry
+        for word in entry.words:
+            self.postings.setdefault(word, set()).add(entry.key)
+
+    def unindex(self, entry):
+        del self.entries[entry.key]
+        for word in entry.words:
+            keys = self.postings[word]
+            keys.discard(entry.key)
+            if not keys:
+                del self.postings[word]
+
+    def topic(self, title):
+        """The entry for a topic, or None"""
+        return self.entries.get(topic_key(title))
+
+    def search(self, text):
+        """Entries containing every word of text, sorted by title
+
+        Starts from the rarest word's postings, so the cost follows the
+        number of matches rather than the number of entries.
+        """
+        words = keywords(text)
+        if not words:
+            return []
+        postings = sorted((self.postings.get(word, set()) for word in words), key=len)
+        matches = set(postings[0])
+        for keys in postings[1:]:
+            matches &= keys
+            if not matches:
+                break
+        return sorted((self.entries[key] for key in matches), key=lambda entry: entry.key)
+
+    def command_summary(self):
+        """The command list shown on entering the game, rendered once until the index changes"""
+        if self.summary is None:
+            self.summary = command_summary(self.commands)
+        return self.summary
+
+    def topics(self):
+        """Every topic grouped by category, rendered once until the index changes"""
+        if self.topic_list is None:
+            categories = {}
+            for entry in self.entries.values():
+                categories.setdefault(entry.category, []).append(entry.title)
+            text = "=== Help Topics ===\n"
+            for category, heading in CATEGORY_HEADINGS.items():
+                if category in categories:
+                    text += f"{heading}: {', '.join(sorted(categories[category]))}\n"
+            text += "Type 'help <topic>' or 'help search <words>'."
+            self.topic_list = text
+        return self.topic_list
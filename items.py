@@ -0,0 +1,307 @@
+"""
+Item definitions for PyPeake MUD
+Item templates, and the compact item instances players carry
+
+Templates hold everything that is the same for every copy of an item and
+are shared, like RACES and CLASSES. An instance is only a template id, a
+quantity and, for the rare item that has changed, a small state dict.
+
+Copyright (c) 2025 PyPeake MUD
+Licensed under the MIT License - see LICENSE file for details
+"""
+
+ITEMS = {
+    "short_sword": {
+        "name": "Short Sword",
+        "description": "A plain, well-balanced blade favoured by new adventurers.",
+        "type": "weapon",
+        "weight": 3,
+        "value": 10,
+        "max_stack": 1,
+        "stat_bonuses": {"strength": 1}
+    },
+
+    "dagger": {
+        "name": "Dagger",
+        "description": "Short and sharp, easily hidden in a boot or sleeve.",
+        "type": "weapon",
+        "weight": 1,
+        "value": 4,
+        "max_stack": 1,
+        "stat_bonuses": {"dexterity": 1}
+    },
+
+    "oak_staff": {
+        "name": "Oak Staff",
+        "description": "A staff of seasoned oak, carved with faint runes.",
+        "type": "weapon",
+        "weight": 4,
+        "value": 8,
+        "max_stack": 1,
+        "stat_bonuses": {"intelligence": 1}
+    },
+
+    "shortbow": {
+        "name": "Shortbow",
+        "description": "A light bow of yew and sinew.",
+        "type": "weapon",
+        "weight": 2,
+        "value": 12,
+        "max_stack": 1,
+        "stat_bonuses": {"dexterity": 1}
+    },
+
+    "war_axe": {
+        "name": "War Axe",
+        "description": "A heavy, notched axe that has seen many battles.",
+        "type": "weapon",
+        "weight": 6,
+        "value": 14,
+        "max_stack": 1,
+        "stat_bonuses": {"strength": 2}
+    },
+
+    "wooden_shield": {
+        "name": "Wooden Shield",
+        "description": "A round shield of banded oak planks.",
+        "type": "armor",
+        "weight": 5,
+        "value": 6,
+        "max_stack": 1,
+        "stat_bonuses": {"constitution": 1}
+    },
+
+    "leather_armor": {
+        "name": "Leather Armor",
+        "description": "Boiled leather, stiff but dependable.",
+        "type": "armor",
+        "weight": 8,
+        "value": 15,
+        "max_stack": 1,
+        "stat_bonuses": {"constitution": 1}
+    },
+
+    "holy_symbol": {
+        "name": "Holy Symbol",
+        "description": "A silver pendant blessed at the temple.",
+        "type": "trinket",
+        "weight": 0,
+        "value": 20,
+        "max_stack": 1,
+        "stat_bonuses": {"wisdom": 1}
+    },
+
+    "lute": {
+        "name": "Lute",
+        "description": "A travel-worn lute that still keeps its tune.",
+        "type": "trinket",
+        "weight": 3,
+        "value": 18,
+        "max_stack": 1,
+        "stat_bonuses": {"charisma": 1}
+    },
+
+    "lockpicks": {
+        "name": "Lockpicks",
+        "description": "A roll of slender picks and tension wrenches.",
+        "type": "tool",
+        "weight": 0,
+        "value": 10,
+        "max_stack": 1,
+        "stat_bonuses": {}
+    },
+
+    "arrow": {
+        "name": "Arrow",
+        "description": "A goose-fletched arrow.",
+        "type": "ammunition",
+        "weight": 0,
+        "value": 1,
+        "max_stack": 99,
+        "stat_bonuses": {}
+    },
+
+    "healing_potion": {
+        "name": "Healing Potion",
+        "description": "A red draught that closes wounds.",
+        "type": "consumable",
+        "weight": 0,
+        "value": 25,
+        "max_stack": 20,
+        "stat_bonuses": {}
+    },
+
+    "mana_potion": {
+        "name": "Mana Potion",
+        "description": "A blue draught that clears and restores the mind.",
+        "type": "consumable",
+        "weight": 0,
+        "value": 25,
+        "max_stack": 20,
+        "stat_bonuses": {}
+    },
+
+    "ration": {
+        "name": "Travel Ration",
+        "description": "Dried meat, hard bread and a wedge of cheese.",
+        "type": "consumable",
+        "weight": 1,
+        "value": 2,
+        "max_stack": 20,
+        "stat_bonuses": {}
+    },
+
+    "torch": {
+        "name": "Torch",
+        "description": "A pitch-soaked torch that burns for an hour.",
+        "type": "tool",
+        "weight": 1,
+        "value": 1,
+        "max_stack": 10,
+        "stat_bonuses": {}
+    }
+}
+
+# Template for instances whose item has since been removed from ITEMS
+UNKNOWN_ITEM = {
+    "name": "Strange Object",
+    "description": "You can't make out what this is.",
+    "type": "unknown",
+    "weight": 0,
+    "value": 0,
+    "max_stack": 1,
+    "stat_bonuses": {}
+}
+
+# Every new character gets these, plus their class's kit
+COMMON_STARTING_ITEMS = [("ration", 3), ("torch", 1), ("healing_potion", 2)]
+
+STARTING_ITEMS = {
+    "Warrior": [("short_sword", 1), ("wooden_shield", 1), ("leather_armor", 1)],
+    "Mage": [("oak_staff", 1), ("mana_potion", 3)],
+    "Rogue": [("dagger", 1), ("lockpicks", 1), ("leather_armor", 1)],
+    "Cleric": [("holy_symbol", 1), ("wooden_shield", 1), ("mana_potion", 1)],
+    "Ranger": [("shortbow", 1), ("arrow", 40), ("dagger", 1)],
+    "Paladin": [("short_sword", 1), ("wooden_shield", 1), ("holy_symbol", 1)],
+    "Barbarian": [("war_axe", 1), ("leather_armor", 1)],
+    "Bard": [("lute", 1), ("dagger", 1)]
+}
+
+# Each template id mapped to itself, so loaded instances can share one copy of the string
+TEMPLATE_IDS = {template_id: template_id for template_id in ITEMS}
+
+def canonical_id(template_id):
+    """The shared copy of a template id, so instances loaded from JSON don't each hold their own string"""
+    return TEMPLATE_IDS.get(template_id, template_id)
+
+class Item:
+    """One stack of an item a player carries"""
+
+    __slots__ = ('template_id', 'quantity', 'state')
+
+    def __init__(self, template_id, quantity=1, state=None):
+        self.template_id = template_id
+        self.quantity = quantity
+        self.state = state  # None, or a small dict for e.g. durability or an engraving
+
+    @property
+    def template(self):
+        return ITEMS.get(self.template_id, UNKNOWN_ITEM)
+
+    @property
+    def name(self):
+        return self.template['name']
+
+    def to_record(self):
+        """Encode as 'id' or 'id*quantity', with the state alongside in a list if there is any
+
+        Strings keep the saved file small even with indented JSON.
+        """
+        record = self.template_id if self.quantity == 1 else f"{self.template_id}*{self.quantity}"
+        return record if self.state is None else [record, self.state]
+
+    @classmethod
+    def from_record(cls, record):
+        """Decode a record written by to_record"""
+        state = None
+        if isinstance(record, list):
+            record, state = record
+        template_id, _, quantity = record.partition('*')
+        return cls(canonical_id(template_id), int(quantity) if quantity else 1, state)
+
+    def __str__(self):
+        return self.name if self.quantity == 1 else f"{self.name} x{self.quantity}"
+
+class Inventory:
+    """The items a player carries"""
+
+    __slots__ = ('items',)
+
+    def __init__(self, items=None):
+        self.items = items if items is not None else []
+
+    @classmethod
+    def from_records(cls, records):
+        return cls([Item.from_record(record) for record in records])
+
+    def to_records(self):
+        return [item.to_record() for item in self.items]
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, template_id, quantity=1, state=None):
+        """Add items, topping up existing plain stacks before starting new ones"""
+        template_id = canonical_id(template_id)
+        max_stack = ITEMS.get(template_id, UNKNOWN_ITEM)['max_stack']
+        if state is None:
+            for item in self.items:
+                if quantity <= 0:
+                    return
+                if item.template_id == template_id and item.state is None and item.quantity < max_stack:
+                    added = min(quantity, max_stack - item.quantity)
+                    item.quantity += added
+                    quantity -= added
+        while quantity > 0:
+            stack = min(quantity, max_stack)
+            self.items.append(Item(template_id, stack, state))
+            quantity -= stack
+
+    def remove(self, item, quantity=1):
+        """Take some of a stack, dropping the stack once it is empty"""
+        item.quantity -= quantity
+        if item.quantity <= 0:
+            self.items.remove(item)
+
+    def find(self, word):
+        """The first item with a word in its name starting with word, ignoring case"""
+        word = word.casefold()
+        for item in self.items:
+            if item.template_id.startswith(word) or any(part.startswith(word) for part in item.name.casefold().split()):
+                return item
+        return None
+
+    def weight(self):
+        return sum(item.template['weight'] * item.quantity for item in self.items)
+
+def starting_inventory(char_class):
+    """Records for a new character's inventory"""
+    inventory = Inventory()
+    for template_id, quantity in COMMON_STARTING_ITEMS + STARTING_ITEMS.get(char_class, []):
+        inventory.add(template_id, quantity)
+    return inventory.to_records()
+
+def get_item_description(template_id):
+    """Get detailed description of an item"""
+    item = ITEMS.get(template_id)
+    if item is None:
+        return "Unknown item"
+    description = f"{item['name']}\n{item['description']}\n\n"
+    description += f"Type: {item['type'].title()}  Weight: {item['weight']}  Value: {item['value']} gold\n"
+    for stat, modifier in item['stat_bonuses'].items():
+        sign = "+" if modifier >= 0 else ""
+        description += f"- {stat.title()}: {sign}{modifier}\n"
+    return description
@@ -11,22 +11,55 @@ import sys
 import os
 import subprocess
 import argparse
-from database import Database
+import contextlib
+from database import Database, SORT_KEYS, LEADERBOARD_METRICS
+from backup import BACKUP_DIR, create_backup, restore_players
+from admin import ADMIN_SOCKET, AdminError, admin_request
+from names import name_key
+from recorder import replay_recording
 
-def start_server(host='localhost', port=4000):
+def non_negative_int(value):
+    """argparse type for counts that can't be negative"""
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must be 0 or more, not {number}")
+    return number
+
+def run_script(*args):
+    """Run another of the game's scripts with this Python, until it exits or Ctrl+C"""
+    # Arguments are passed as a list, never through a shell, so no value needs quoting
+    with contextlib.suppress(KeyboardInterrupt):
+        subprocess.run([sys.executable, *(str(arg) for arg in args)])
+
+def start_server(host='localhost', port=4000, record=None):
     """Start the MUD server"""
     print(f"Starting PyPeake MUD Server on {host}:{port}")
-    os.system(f"python mud_server.py")
+    record_option = ["--record", record] if record else []
+    run_script("mud_server.py", "--host", host, "--port", port, *record_option)
 
-def start_client(host='localhost', port=4000):
-    """Start the MUD client"""
+def start_client(host='localhost', port=4000, script=None):
+    """Start the MUD client, or play a script through it"""
     print(f"Connecting to PyPeake MUD at {host}:{port}")
-    os.system(f"python client.py {host} {port}")
+    if script:
+        run_script("client.py", host, port, "--script", script)
+    else:
+        run_script("client.py", host, port)
+
+def query_server(args, command, **params):
+    """Send a request to the running server's admin socket
+
+    Returns None when no server is running or --offline was given, in
+    which case callers read players.json directly instead.
+    """
+    if args.offline:
+        return None
+    return admin_request(command, args.admin_socket, **params)
 
-def show_stats():
+def show_stats(args):
     """Show database statistics"""
-    db = Database()
-    stats = db.export_player_stats()
+    stats = query_server(args, 'stats')
+    if stats is None:
+        stats = Database().export_player_stats()
     
     print("=== PyPeake MUD Statistics ===")
     print(f"Total Players: {stats['total_players']}")
@@ -47,63 +80,366 @@ def show_stats():
         percentage = (count / stats['total_players']) * 100 if stats['total_players'] > 0 else 0
         print(f"  Level {level_range}: {count} ({percentage:.1f}%)")
 
-def list_players():
-    """List all players"""
-    db = Database()
-    players = db.get_all_players()
+def player_filters(args):
+    """Build Database filter keyword arguments from parsed options"""
+    return {
+        'race': args.race,
+        'char_class': args.char_class,
+        'min_level': args.min_level,
+        'max_level': args.max_level,
+    }
+
+def list_players(args):
+    """List players one page at a time"""
+    records = query_server(args, 'players', sort_by=args.sort, descending=args.desc,
+                           offset=args.offset, limit=args.limit, **player_filters(args))
+    if records is not None:
+        page = [(name_key(record['name']), record) for record in records]
+    else:
+        db = Database()
+        try:
+            page = db.iter_sorted_players(
+                sort_by=args.sort,
+                descending=args.desc,
+                offset=args.offset,
+                limit=args.limit,
+                **player_filters(args)
+            )
+        except ValueError as e:
+            print(e)
+            return
+    
+    shown = 0
+    for username, player_data in page:
+        if shown == 0:
+            print("=== All Players ===")
+            print(f"{'Name':<15} {'Race':<10} {'Class':<12} {'Level':<5} {'Created':<19}")
+            print("-" * 70)
+        
+        name = player_data.get('name', username)
+        race = player_data.get('race', 'Unknown')
+        char_class = player_data.get('char_class', 'Unknown')
+        level = player_data.get('level', 1)
+        created = player_data.get('created_at', 'Unknown')[:19]  # Trim to date/time only
+        
+        print(f"{name:<15} {race:<10} {char_class:<12} {level:<5} {created:<19}")
+        shown += 1
     
-    if not players:
+    if shown == 0:
         print("No players found in database")
+
+def show_top_players(args):
+    """Show the leaderboard for a metric"""
+    metric = 'level' if args.sort == 'name' else args.sort
+    if metric not in LEADERBOARD_METRICS:
+        print(f"No leaderboard for '{metric}'. Choose from: {', '.join(LEADERBOARD_METRICS)}")
         return
     
-    print("=== All Players ===")
-    print(f"{'Name':<15} {'Race':<10} {'Class':<12} {'Level':<5} {'Created':<19}")
-    print("-" * 70)
+    records = query_server(args, 'top', limit=args.limit or 10, sort_by=metric)
+    if records is not None:
+        top = [(name_key(record['name']), record) for record in records]
+    else:
+        top = Database().get_top_players(args.limit or 10, metric).items()
     
-    for username, player_data in sorted(players.items()):
+    print(f"=== Top Players by {metric} ===")
+    print(f"{'Rank':<5} {'Name':<15} {'Race':<10} {'Class':<12} {'Level':<5} {'Experience':<10}")
+    print("-" * 62)
+    for rank, (username, player_data) in enumerate(top, 1):
         name = player_data.get('name', username)
         race = player_data.get('race', 'Unknown')
         char_class = player_data.get('char_class', 'Unknown')
         level = player_data.get('level', 1)
-        created = player_data.get('created_at', 'Unknown')[:19]  # Trim to date/time only
-        
-        print(f"{name:<15} {race:<10} {char_class:<12} {level:<5} {created:<19}")
+        experience = player_data.get('experience', 0)
+        print(f"{rank:<5} {name:<15} {race:<10} {char_class:<12} {level:<5} {experience:<10}")
 
-def backup_database():
-    """Create a backup of the player database"""
-    import shutil
-    from datetime import datetime
+def show_online_players(args):
+    """Show who is connected to the running server"""
+    roster = query_server(args, 'online')
+    if roster is None:
+        print("No server is running")
+        return
+    
+    print(f"=== Online Players ({len(roster)}) ===")
+    for player in roster:
+        print(f"{player['name']:<15} {player['race']:<10} {player['char_class']:<12} "
+              f"{player['level']:<5} {player['location']}")
+
+def save_online_players(args):
+    """Make the running server save every online player now"""
+    count = query_server(args, 'save')
+    if count is None:
+        print("No server is running")
+        return
+    print(f"Server saved {count} online players")
+
+def kick_player(args):
+    """Disconnect a player from the running server"""
+    if not args.player:
+        print("Give the player to kick with --player NAME")
+        return
+    kicked = query_server(args, 'kick', name=args.player)
+    if kicked is None:
+        print("No server is running")
+    elif kicked:
+        print(f"Kicked {args.player}")
+    else:
+        print(f"{args.player} is not online")
+
+def show_metrics(args):
+    """Show how busy the running server's game thread is"""
+    metrics = query_server(args, 'metrics')
+    if metrics is None:
+        print("No server is running")
+        return
+    
+    print("=== Game Thread ===")
+    print(f"Commands waiting: {metrics['pending']}")
+    print(f"Last batch: {metrics['queue_depth']} commands in {metrics['batch_ms']:.2f} ms")
+    print(f"Largest batch: {metrics['max_queue_depth']} commands, slowest {metrics['max_batch_ms']:.2f} ms")
+    print(f"Commands run: {metrics['commands']}")
+    print(f"World ticks: {metrics['ticks']}, last {metrics['tick_ms']:.2f} ms, slowest {metrics['max_tick_ms']:.2f} ms")
+
+def show_channels(args):
+    """Show message counts for the running server's chat channels"""
+    channels = query_server(args, 'channels')
+    if channels is None:
+        print("No server is running")
+        return
+    
+    print(f"{'Channel':<24} {'Listening':<10} {'Published':<10} {'Delivered':<10} {'Dropped':<8}")
+    print("-" * 66)
+    for name, counts in channels.items():
+        print(f"{name:<24} {counts['subscribers']:<10} {counts['published']:<10} "
+              f"{counts['delivered']:<10} {counts['dropped']:<8}")
+
+def announce(args):
+    """Post a server announcement to every online player"""
+    if not args.message:
+        print("Give the announcement with --message TEXT")
+        return
+    reached = query_server(args, 'announce', message=args.message)
+    if reached is None:
+        print("No server is running")
+        return
+    print(f"Announcement sent to {reached} players")
+
+def reload_help(args):
+    """Have the running server pick up edits to the race, class, item and command help"""
+    counts = query_server(args, 'reload_help')
+    if counts is None:
+        print("No server is running")
+        return
+    print(f"Help topics: {counts['added']} added, {counts['updated']} updated, {counts['removed']} removed")
+
+def show_npcs(args):
+    """Show how the running server's NPC scheduler is keeping up"""
+    report = query_server(args, 'npcs')
+    if report is None:
+        print("No server is running")
+        return
+    
+    print(f"NPCs: {report['npcs']} ({report['awake']} awake, {report['asleep']} asleep)")
+    print(f"Thoughts: {report['thinks']} run, {report['late']} late by {report['skipped']} ticks in all "
+          f"(up to {report['max_late_seconds']:.1f} s)")
+    print(f"Budget: {report['budget_ms']:.1f} ms per tick, last tick {report['tick_ms']:.2f} ms, "
+          f"slowest {report['max_tick_ms']:.2f} ms, {report['exhausted_ticks']} of {report['ticks']} ticks ran out")
+
+def format_bytes(size):
+    """A byte count in the largest unit that keeps it readable"""
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+def show_memory(args):
+    """Show where the running server's memory goes, or control allocation tracing"""
+    limit = args.limit or 10
+    result = query_server(args, 'memory', action=args.action, limit=limit)
+    if result is None:
+        print("No server is running")
+        return
+    
+    if args.action == 'report':
+        print("=== Memory by subsystem ===")
+        for name, size in sorted(result['subsystems'].items(), key=lambda item: item[1], reverse=True):
+            print(f"  {name:<18} {format_bytes(size):>12}")
+        print(f"  {'total':<18} {format_bytes(result['total']):>12}")
+        print(f"\n{result['online_players']} online, {result['stored_players']} stored players")
+        print(f"{result['threads']} threads, {format_bytes(result['thread_stacks_reserved'])} of stack reserved")
+        print("\n=== Largest sessions ===")
+        for session in result['largest_sessions']:
+            print(f"  {session['player'] or '(logging in)':<15} {session['address']:<24} "
+                  f"{format_bytes(session['bytes']):>12} {session['queued_messages']} queued")
+        tracing = result['tracing']
+        if tracing['tracing']:
+            print(f"\nTracing: {format_bytes(tracing['traced_bytes'])} traced, "
+                  f"{format_bytes(tracing['tracemalloc_overhead'])} tracing overhead")
+    elif args.action == 'top':
+        for stat in result:
+            print(f"{format_bytes(stat['bytes']):>12} {stat['blocks']:>8} blocks  {stat['location']}")
+    elif args.action == 'diff':
+        for stat in result:
+            print(f"{format_bytes(stat['size_diff']):>12} {stat['count_diff']:>+8} blocks  {stat['location']}")
+    else:
+        state = "on" if result['tracing'] else "off"
+        print(f"Allocation tracing is {state} ({format_bytes(result['traced_bytes'])} traced)")
+
+def replay(args):
+    """Replay a recording against a local in-process server and report command latency"""
+    if not args.recording:
+        print("Give the recording with --recording FILE")
+        return
+    speed = None if args.speed == 'max' else float(args.speed)
+    
+    print(f"Replaying {args.recording} at {'max speed' if speed is None else f'{speed:g}x'}...")
+    report = replay_recording(args.recording, speed)
+    if not report:
+        print("The recording has no commands")
+        return
+    
+    print(f"{'Command':<12} {'Count':<8} {'Mean ms':<9} {'p50 ms':<9} {'p99 ms':<9} {'Max ms':<9}")
+    print("-" * 58)
+    for command, stats in report.items():
+        print(f"{command[:12]:<12} {stats['count']:<8} {stats['mean_ms']:<9.3f} {stats['p50_ms']:<9.3f} "
+              f"{stats['p99_ms']:<9.3f} {stats['max_ms']:<9.3f}")
+
+def export_players(args):
+    """Export players as JSONL or CSV to a file or stdout"""
+    # Keep database status messages out of exported data on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        db = Database()
+    
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            count = db.export_players(f, args.format, **player_filters(args))
+        print(f"Exported {count} players to: {args.output}")
+    else:
+        db.export_players(sys.stdout, args.format, **player_filters(args))
+
+def backup_database(args):
+    """Create a full or incremental backup of the player database"""
+    backup_dir, incremental = args.backup_dir, args.incremental
+    
+    # A running server backs up its in-memory records, which may be newer than players.json
+    backup = query_server(args, 'backup', backup_dir=os.path.abspath(backup_dir), incremental=incremental)
+    if backup is not None:
+        print(f"Database backed up to: {backup['file']} ({backup['type']}, {backup['count']} players)")
+        return
     
     if not os.path.exists('players.json'):
         print("No player database found to backup")
         return
     
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_filename = f"players_backup_{timestamp}.json"
+    # The server replaces players.json atomically, so this always reads
+    # a complete, consistent copy even with --offline while it is running
+    db = Database()
+    backup_filename, backup_type, count = create_backup(db.snapshot(), backup_dir, incremental)
+    print(f"Database backed up to: {os.path.join(backup_dir, backup_filename)} ({backup_type}, {count} players)")
+
+def restore_database(backup_dir=BACKUP_DIR, target=None, admin_socket=ADMIN_SOCKET):
+    """Restore the player database from a backup chain
+
+    Refused while a server is running: it holds every record in memory
+    and would write them back over the restored file.
+    """
+    try:
+        running = admin_request('metrics', admin_socket) is not None
+    except AdminError:
+        running = True  # Something is answering on the admin socket
+    if running:
+        print("Restore refused: a server is running. Stop it first, then restore.")
+        return
+    try:
+        players = restore_players(backup_dir, target)
+    except (ValueError, IOError) as e:
+        print(f"Restore failed: {e}")
+        return
     
-    shutil.copy2('players.json', backup_filename)
-    print(f"Database backed up to: {backup_filename}")
+    db = Database()
+    db.players = players
+    db.save_players()
+    print(f"Restored {len(players)} players from {backup_dir}")
 
 def main():
     """Main launcher function"""
     parser = argparse.ArgumentParser(description='PyPeake MUD Launcher')
-    parser.add_argument('command', choices=['server', 'client', 'stats', 'players', 'backup'], 
+    parser.add_argument('command', choices=['server', 'client', 'stats', 'players', 'top', 'online', 'save', 'kick', 'metrics',
+                                            'channels', 'announce', 'replay', 'reload-help', 'memory', 'npcs',
+                                            'export', 'backup', 'restore'], 
                        help='Command to execute')
     parser.add_argument('--host', default='localhost', help='Server host (default: localhost)')
     parser.add_argument('--port', type=int, default=4000, help='Server port (default: 4000)')
+    parser.add_argument('--limit', type=non_negative_int, help='Maximum number of players to list')
+    parser.add_argument('--offset', type=non_negative_int, default=0, help='Number of players to skip (default: 0)')
+    parser.add_argument('--sort', default='name', choices=sorted(SORT_KEYS), help='Sort players by field (default: name)')
+    parser.add_argument('--desc', action='store_true', help='Sort in descending order')
+    parser.add_argument('--race', help='Only include players of this race')
+    parser.add_argument('--class', dest='char_class', help='Only include players of this class')
+    parser.add_argument('--min-level', type=int, help='Only include players at or above this level')
+    parser.add_argument('--max-level', type=int, help='Only include players at or below this level')
+    parser.add_argument('--format', default='jsonl', choices=['jsonl', 'csv'], help='Export format (default: jsonl)')
+    parser.add_argument('--output', help='Export file (default: stdout)')
+    parser.add_argument('--incremental', action='store_true', help='Only back up players changed since the last backup')
+    parser.add_argument('--backup-dir', default=BACKUP_DIR, help=f'Backup directory (default: {BACKUP_DIR})')
+    parser.add_argument('--backup', help='Backup file to restore up to (default: latest)')
+    parser.add_argument('--player', help='Player to kick')
+    parser.add_argument('--message', help='Announcement to send')
+    parser.add_argument('--record', help='Record players\' input to this file (server)')
+    parser.add_argument('--recording', help='Recording to replay')
+    parser.add_argument('--script', help='Commands for the client to play and time, or - for stdin (client)')
+    parser.add_argument('--speed', default='max',
+                        help='Replay speed: a multiple of real time, or max for no waiting (default: max)')
+    parser.add_argument('--action', default='report', choices=['report', 'start', 'top', 'diff', 'stop'],
+                        help='Memory action: report, or start, top, diff and stop allocation tracing (default: report)')
+    parser.add_argument('--offline', action='store_true', help='Read players.json even if the server is running')
+    parser.add_argument('--admin-socket', default=ADMIN_SOCKET, help=f'Server admin socket (default: {ADMIN_SOCKET})')
     
     args = parser.parse_args()
     
+    try:
+        run_command(args)
+    except AdminError as e:
+        print(f"Server error: {e}")
+
+def run_command(args):
+    """Run the chosen launcher command"""
     if args.command == 'server':
-        start_server(args.host, args.port)
+        start_server(args.host, args.port, args.record)
     elif args.command == 'client':
-        start_client(args.host, args.port)
+        start_client(args.host, args.port, args.script)
     elif args.command == 'stats':
-        show_stats()
+        show_stats(args)
     elif args.command == 'players':
-        list_players()
+        list_players(args)
+    elif args.command == 'top':
+        show_top_players(args)
+    elif args.command == 'online':
+        show_online_players(args)
+    elif args.command == 'save':
+        save_online_players(args)
+    elif args.command == 'kick':
+        kick_player(args)
+    elif args.command == 'metrics':
+        show_metrics(args)
+    elif args.command == 'channels':
+        show_channels(args)
+    elif args.command == 'announce':
+        announce(args)
+    elif args.command == 'replay':
+        replay(args)
+    elif args.command == 'reload-help':
+        reload_help(args)
+    elif args.command == 'memory':
+        show_memory(args)
+    elif args.command == 'npcs':
+        show_npcs(args)
+    elif args.command == 'export':
+        export_players(args)
     elif args.command == 'backup':
-        backup_database()
+        backup_database(args)
+    elif args.command == 'restore':
+        restore_database(args.backup_dir, args.backup, args.admin_socket)
 
 if __name__ == "__main__":
     if len(sys.argv) == 1:
@@ -113,12 +449,39 @@ if __name__ == "__main__":
         print("  python launcher.py client    - Connect as a client")
         print("  python launcher.py stats     - Show database statistics")
         print("  python launcher.py players   - List all players")
+        print("  python launcher.py top       - Show the leaderboard (--sort level|experience|created_at)")
+        print("  python launcher.py online    - Show who is connected to the running server")
+        print("  python launcher.py save      - Make the running server save online players")
+        print("  python launcher.py kick      - Disconnect a player (--player NAME)")
+        print("  python launcher.py metrics   - Show command queue depth and game thread timings")
+        print("  python launcher.py channels  - Show chat channel message counts")
+        print("  python launcher.py announce  - Announce to every player (--message TEXT)")
+        print("  python launcher.py replay    - Replay a recording and report command latency")
+        print("  python launcher.py reload-help - Reload in-game help after editing races, classes or items")
+        print("  python launcher.py memory    - Show memory by subsystem (--action start|top|diff|stop to trace)")
+        print("  python launcher.py npcs      - Show NPC thoughts run, put off and late under the time budget")
+        print("  python launcher.py export    - Export players as JSONL or CSV")
         print("  python launcher.py backup    - Backup player database")
+        print("  python launcher.py restore   - Restore player database from backups")
         print("\nOptions:")
         print("  --host HOST    Server hostname (default: localhost)")
         print("  --port PORT    Server port (default: 4000)")
+        print("  --limit N / --offset N / --sort FIELD [--desc]   Page through players")
+        print("  --race RACE / --class CLASS / --min-level N / --max-level N   Filter players")
+        print("  --format jsonl|csv / --output FILE   Export options")
+        print("  --incremental / --backup-dir DIR / --backup FILE   Backup and restore options")
+        print("  --offline      Read players.json even if the server is running")
+        print("  --record FILE / --recording FILE / --speed N|max   Record input and replay it")
+        print("  --script FILE  Play commands through the client and report round trip times")
+        print("\nstats, players, top and backup ask the running server when there is one.")
         print("\nExamples:")
         print("  python launcher.py server")
         print("  python launcher.py client --host 192.168.1.100 --port 4000")
+        print("  python launcher.py players --sort level --desc --limit 20 --race Elf")
+        print("  python launcher.py export --format csv --output players.csv")
+        print("  python launcher.py backup --incremental")
+        print("  python launcher.py server --record traffic.rec")
+        print("  python launcher.py replay --recording traffic.rec --speed 10")
+        print("  python launcher.py client --script smoke.txt")
     else:
         main()
@@ -0,0 +1,266 @@
+"""
+Leaderboards for PyPeake MUD
+Ranked player lists with O(log n) updates and rank lookups
+
+Copyright (c) 2025 PyPeake MUD
+Licensed under the MIT License - see LICENSE file for details
+"""
+
+import random
+
+MAX_LEVELS = 32
+
+# remove_many rebuilds the list when removing more than 1/REBUILD_SHARE of it
+REBUILD_SHARE = 5
+
+class SkipNode:
+    __slots__ = ('value', 'next', 'width')
+
+    def __init__(self, value, levels):
+        self.value = value
+        self.next = [None] * levels
+        self.width = [1] * levels
+
+class IndexableSkipList:
+    """A sorted list with O(log n) insert, remove, rank and position lookups
+
+    Each forward link records how many items it skips, which is what
+    lets rank() and node_at() run in logarithmic time.
+    """
+
+    def __init__(self):
+        self.head = SkipNode(None, MAX_LEVELS)
+        self.levels = 1
+        self.size = 0
+        self.random = random.Random()
+
+    def __len__(self):
+        return self.size
+
+    @classmethod
+    def from_sorted(cls, values):
+        """Build a skip list from already sorted values in O(n)"""
+        skiplist = cls()
+        last = [skiplist.head] * MAX_LEVELS
+        last_position = [0] * MAX_LEVELS
+        position = 0
+        for value in values:
+            position += 1
+            levels = skiplist.random_levels()
+            node = SkipNode(value, levels)
+            for level in range(levels):
+                last[level].next[level] = node
+                last[level].width[level] = position - last_position[level]
+                last[level] = node
+                last_position[level] = position
+            skiplist.levels = max(skiplist.levels, levels)
+        # Links off the end count the distance to one past the last item
+        for level in range(MAX_LEVELS):
+            last[level].width[level] = position + 1 - last_position[level]
+        skiplist.size = position
+        return skiplist
+
+    def random_levels(self):
+        """Pick a node height, each extra level with probability 1/2"""
+        bits = self.random.getrandbits(MAX_LEVELS - 1)
+        # One more than the number of trailing zero bits
+        return (bits & -bits).bit_length() or MAX_LEVELS
+
+    def insert(self, value):
+        """Add a value in sorted position"""
+        chain = [None] * MAX_LEVELS
+        steps_at_level = [0] * MAX_LEVELS
+        node = self.head
+        for level in range(MAX_LEVELS - 1, -1, -1):
+            while node.next[level] is not None and node.next[level].value < value:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        levels = self.random_levels()
+        self.levels = max(self.levels, levels)
+        new_node = SkipNode(value, levels)
+        steps = 0
+        for level in range(levels):
+            prev = chain[level]
+            new_node.next[level] = prev.next[level]
+            prev.next[level] = new_node
+            new_node.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(levels, MAX_LEVELS):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, value):
+        """Remove a value, raising KeyError if it is not present"""
+        chain = [None] * MAX_LEVELS
+        node = self.head
+        for level in range(MAX_LEVELS - 1, -1, -1):
+            while node.next[level] is not None and node.next[level].value < value:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        if target is None or target.value != value:
+            raise KeyError(value)
+
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), MAX_LEVELS):
+            chain[level].width[level] -= 1
+        self.size -= 1
+
+    def rank(self, value):
+        """Get the zero-based position of a value, raising KeyError if absent"""
+        position = 0
+        node = self.head
+        for level in range(MAX_LEVELS - 1, -1, -1):
+            while node.next[level] is not None and node.next[level].value < value:
+                position += node.width[level]
+                node = node.next[level]
+        node = node.next[0]
+        if node is None or node.value != value:
+            raise KeyError(value)
+        return position
+
+    def node_at(self, index):
+        """Get the node at a zero-based position"""
+        if not 0 <= index < self.size:
+            raise IndexError(index)
+        node = self.head
+        index += 1
+        for level in range(MAX_LEVELS - 1, -1, -1):
+            while node.next[level] is not None and node.width[level] <= index:
+                index -= node.width[level]
+                node = node.next[level]
+        return node
+
+    def bisect_left(self, value):
+        """Count the values less than value, which is where it would be inserted"""
+        position = 0
+        node = self.head
+        for level in range(MAX_LEVELS - 1, -1, -1):
+            while node.next[level] is not None and node.next[level].value < value:
+                position += node.width[level]
+                node = node.next[level]
+        return position
+
+    def remove_first(self, count):
+        """Remove the first count values and return them
+
+        The head is relinked once per level past the removed prefix, so
+        this costs O(log n + count) rather than count separate removals.
+        """
+        count = min(count, self.size)
+        values = self.slice(0, count)
+        position = 0
+        node = self.head
+        for level in range(MAX_LEVELS - 1, -1, -1):
+            while node.next[level] is not None and position + node.width[level] <= count:
+                position += node.width[level]
+                node = node.next[level]
+            # node is the last one at this level inside the prefix, or the head
+            self.head.width[level] = position + node.width[level] - count
+            self.head.next[level] = node.next[level]
+        self.size -= count
+        return values
+
+    def slice(self, start, stop):
+        """Get the values from position start up to (not including) stop"""
+        start = max(0, start)
+        stop = min(stop, self.size)
+        if start >= stop:
+            return []
+        node = self.node_at(start)
+        values = []
+        for _ in range(stop - start):
+            values.append(node.value)
+            node = node.next[0]
+        return values
+
+    def __iter__(self):
+        node = self.head.next[0]
+        while node is not None:
+            yield node.value
+            node = node.next[0]
+
+class Leaderboard:
+    """Players ranked by one score, highest first
+
+    Ties are broken by name so every player has a stable position.
+    top() and around() cost O(log n + k), rank() costs O(log n).
+    """
+
+    def __init__(self):
+        self.entries = IndexableSkipList()
+        self.scores = {}  # username -> score
+
+    def __len__(self):
+        return len(self.entries)
+
+    @classmethod
+    def from_scores(cls, scores):
+        """Build a leaderboard from a {username: score} dict with one sort"""
+        leaderboard = cls()
+        leaderboard.scores = dict(scores)
+        leaderboard.entries = IndexableSkipList.from_sorted(
+            sorted((-score, username) for username, score in scores.items()))
+        return leaderboard
+
+    def update(self, username, score):
+        """Set a player's score"""
+        old_score = self.scores.get(username)
+        if old_score == score:
+            return
+        if old_score is not None:
+            self.entries.remove((-old_score, username))
+        self.entries.insert((-score, username))
+        self.scores[username] = score
+
+    def remove(self, username):
+        """Take a player off the leaderboard"""
+        score = self.scores.pop(username, None)
+        if score is not None:
+            self.entries.remove((-score, username))
+
+    def remove_many(self, usernames):
+        """Take many players off the leaderboard
+
+        Rebuilding costs O(n) but a few microseconds a node, several
+        removals' worth of O(log n) each, so it only pays once a good share
+        of the board is going; fewer players are removed one at a time.
+        """
+        removed = {username: self.scores.pop(username) for username in usernames if username in self.scores}
+        if len(removed) * REBUILD_SHARE < len(self.entries):
+            for username, score in removed.items():
+                self.entries.remove((-score, username))
+        elif removed:
+            self.entries = IndexableSkipList.from_sorted(
+                entry for entry in self.entries if entry[1] not in removed)
+
+    def rank(self, username):
+        """Get a player's 1-based rank, or None if they are not ranked"""
+        score = self.scores.get(username)
+        if score is None:
+            return None
+        return self.entries.rank((-score, username)) + 1
+
+    def top(self, count=10):
+        """Get the best count players as (rank, username, score)"""
+        return self.page(0, count)
+
+    def around(self, username, count=2):
+        """Get up to count players either side of a player, including them"""
+        rank = self.rank(username)
+        if rank is None:
+            return []
+        return self.page(rank - 1 - count, rank + count)
+
+    def page(self, start, stop):
+        """Get players by zero-based position as (rank, username, score)"""
+        start = max(0, start)
+        return [(start + i + 1, username, -negated_score)
+                for i, (negated_score, username) in enumerate(self.entries.slice(start, stop))]
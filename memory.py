@@ -0,0 +1,236 @@
+"""
+Memory accounting for PyPeake MUD
+Attributes the server's live memory to its parts and finds what is growing
+
+Two tools, both only run when an admin asks:
+
+- subsystem_report walks the server's objects and sums their sizes per
+  subsystem (players, sessions, output buffers, channels, ...), and
+  database_report estimates the database cache and its indexes from a
+  sample. Neither needs anything switched on beforehand.
+- AllocationTracer wraps tracemalloc. Tracing is off until started, so
+  it costs nothing in normal running; once started, snapshots can be
+  diffed to see which lines of code hold more memory than before.
+
+Copyright (c) 2025 PyPeake MUD
+Licensed under the MIT License - see LICENSE file for details
+"""
+
+import itertools
+import random
+import sys
+import threading
+import tracemalloc
+import types
+
+# Objects shared by everything, which would otherwise be counted by whoever reaches them first
+SKIPPED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+                 types.MethodType, types.CodeType, threading.Thread)
+
+# Thread stacks are reserved outside the Python heap; this is the usual Linux default
+DEFAULT_STACK_SIZE = 8 * 1024 * 1024
+
+# Database records and index entries measured to estimate the rest
+DATABASE_SAMPLE = 1000
+
+def deep_size(root, seen=None, skipped=SKIPPED_TYPES):
+    """Total sys.getsizeof of an object and everything reachable from it
+
+    Objects in seen are not counted again, and everything counted is
+    added to seen, so several calls sharing one set never count an
+    object twice.
+    """
+    if seen is None:
+        seen = set()
+    total = 0
+    stack = [root]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, skipped):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)) or type(obj).__name__ == 'deque':
+            stack.extend(obj)
+        else:
+            attributes = getattr(obj, '__dict__', None)
+            if attributes is not None:
+                stack.append(attributes)
+            for cls in type(obj).__mro__:
+                for slot in getattr(cls, '__slots__', ()):
+                    if hasattr(obj, slot):
+                        stack.append(getattr(obj, slot))
+    return total
+
+def sample_entries(container, sample_size=DATABASE_SAMPLE):
+    """Up to sample_size entries of a container, in O(sample_size)
+
+    Lists are sampled at random. Dicts can't be indexed, so their first
+    entries are taken, each as a list of its key and value.
+    """
+    if isinstance(container, dict):
+        return [list(item) for item in itertools.islice(container.items(), sample_size)]
+    return [[container[i]] for i in random.sample(range(len(container)), min(sample_size, len(container)))]
+
+def estimate_size(container_bytes, count, sample, skipped=SKIPPED_TYPES):
+    """Estimated bytes of a container of count entries, scaled up from a sample of them"""
+    if not sample:
+        return container_bytes
+    seen = set()
+    sampled = sum(deep_size(part, seen, skipped) for entry in sample for part in entry)
+    return container_bytes + sampled * count // len(sample)
+
+def skiplist_size(skiplist, sample_size=DATABASE_SAMPLE):
+    """Estimated bytes of an index's skip list from its first nodes
+
+    Nodes link to each other, so each is measured on its own: the node,
+    its link lists and its (score or timestamp, username) value without
+    the name.
+    """
+    node, measured, sampled = skiplist.head.next[0], 0, 0
+    while node is not None and measured < sample_size:
+        sampled += (sys.getsizeof(node) + sys.getsizeof(node.next) + sys.getsizeof(node.width)
+                    + deep_size(node.value, None, SKIPPED_TYPES + (str,)))
+        measured += 1
+        node = node.next[0]
+    return sampled * len(skiplist) // measured if measured else 0
+
+def database_report(db, sample_size=DATABASE_SAMPLE):
+    """Estimated bytes held by the database cache and its indexes
+
+    Run off the game thread: the lock is held only while a sample of the
+    records and of each index is taken, which costs O(sample_size) however
+    many players there are, and the samples are measured and scaled up
+    after it is released. Usernames are counted once, with the cache; the
+    indexes that hold them again are measured without their strings.
+    """
+    with db.lock:
+        cache = (sys.getsizeof(db.players), len(db.players), sample_entries(db.players, sample_size))
+        indexes = [(sys.getsizeof(index), len(index), sample_entries(index, sample_size))
+                   for index in [db.player_levels, db.stats_keys, db.login_times]
+                   + [leaderboard.scores for leaderboard in db.leaderboards.values()]]
+        fixed_bytes = sys.getsizeof(db.names.keys) + sum(sys.getsizeof(bucket) for bucket in db.level_buckets.values())
+        skiplists = [db.login_index] + [leaderboard.entries for leaderboard in db.leaderboards.values()]
+    shared = SKIPPED_TYPES + (str,)
+    index_bytes = fixed_bytes + sum(estimate_size(*index, skipped=shared) for index in indexes)
+    # Nodes are read without the lock; a save moving one mid-walk only nudges the estimate
+    index_bytes += sum(skiplist_size(skiplist, sample_size) for skiplist in skiplists)
+    return {
+        'database_cache': estimate_size(*cache),
+        'database_indexes': index_bytes,
+    }
+
+def server_report(server, top_sessions=5):
+    """subsystem_report from the game thread, with the database estimated on this one"""
+    report = server.call(subsystem_report, server, top_sessions)
+    report['subsystems'].update(database_report(server.db))
+    report['total'] = sum(report['subsystems'].values())
+    return report
+
+def subsystem_report(server, top_sessions=5):
+    """Bytes held by each part of a running server, plus its largest sessions
+
+    Run on the game thread, since it walks game state. Subsystems are
+    measured in order, each skipping anything already counted, so shared
+    objects (a player's name in both a session and an index) count once.
+    The database is left to database_report, which estimates it without
+    holding up the game thread.
+    """
+    db = server.db
+    # Nannies point back at the server and players at the vitals store; never walk into those from a subsystem
+    seen = {id(server), id(db), id(server.vitals), id(server.combat)}
+    report = {}
+
+    sessions = list(server.players) + list(server.nannies)
+    players = {session: deep_size(server.players.get(session), seen) for session in sessions}
+    report['players'] = sum(players.values())
+    report['detached_players'] = deep_size(server.detached, seen)
+    connections = {session: deep_size(session, seen) for session in sessions}
+    report['connections'] = sum(connections.values()) + deep_size(server.nannies, seen)
+    pending = {session: deep_size(server.outbox.get(session), seen) for session in sessions}
+    report['output_buffers'] = sum(pending.values()) + deep_size(server.outbox, seen)
+    report['channels'] = deep_size(server.channels, seen)
+
+    if server.vitals is not None:
+        # NumPy arrays report their buffers through nbytes; the slot list only holds references
+        report['vitals'] = sum(column.nbytes for column in server.vitals.columns.values()) + \
+            sys.getsizeof(server.vitals.players)
+    report['npcs'] = deep_size(server.npcs, seen)
+    report['timers'] = deep_size(server.timers, seen)
+    report['help'] = deep_size(server.help, seen)
+
+    sizes = {session: players[session] + connections[session] + pending[session] for session in sessions}
+    largest = sorted(sessions, key=sizes.get, reverse=True)[:top_sessions]
+    threads = threading.active_count()
+    return {
+        'subsystems': report,
+        'total': sum(report.values()),
+        'threads': threads,
+        # Virtual address space; only the pages a thread touches count towards RSS
+        'thread_stacks_reserved': threads * (threading.stack_size() or DEFAULT_STACK_SIZE),
+        'stored_players': len(db.players),
+        'online_players': len(server.players),
+        'largest_sessions': [{
+            'address': str(session.address),
+            'player': server.players[session].name if session in server.players else None,
+            'bytes': sizes[session],
+            'queued_messages': session.backlog(),
+        } for session in largest],
+    }
+
+class AllocationTracer:
+    """Start, snapshot and diff tracemalloc on demand"""
+
+    def __init__(self):
+        self.baseline = None
+
+    def start(self, frames=1):
+        """Start tracing allocations and take the baseline snapshot"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.baseline = tracemalloc.take_snapshot()
+        return self.status()
+
+    def stop(self):
+        """Stop tracing and drop the snapshots, returning the memory to the server"""
+        tracemalloc.stop()
+        self.baseline = None
+        return self.status()
+
+    def status(self):
+        current, peak = tracemalloc.get_traced_memory()
+        return {'tracing': tracemalloc.is_tracing(), 'traced_bytes': current, 'peak_bytes': peak,
+                'tracemalloc_overhead': tracemalloc.get_tracemalloc_memory()}
+
+    def top(self, limit=10):
+        """The lines of code holding the most traced memory"""
+        snapshot = self.snapshot()
+        return [{'location': str(stat.traceback), 'bytes': stat.size, 'blocks': stat.count}
+                for stat in snapshot.statistics('lineno')[:limit]]
+
+    def diff(self, limit=10, rebase=False):
+        """The lines whose traced memory changed most since the baseline
+
+        With rebase the current snapshot becomes the new baseline, so
+        repeated calls show growth between calls.
+        """
+        if self.baseline is None:
+            raise ValueError("Tracing is not running; start it first")
+        snapshot = self.snapshot()
+        changes = snapshot.compare_to(self.baseline, 'lineno')
+        if rebase:
+            self.baseline = snapshot
+        return [{'location': str(stat.traceback), 'size_diff': stat.size_diff, 'bytes': stat.size,
+                 'count_diff': stat.count_diff}
+                for stat in changes[:limit]]
+
+    def snapshot(self):
+        if not tracemalloc.is_tracing():
+            raise ValueError("Tracing is not running; start it first")
+        # Leave out tracemalloc's own bookkeeping
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ])
@@ -7,273 +7,683 @@ Copyright (c) 2025 PyPeake MUD
 Licensed under the MIT License - see LICENSE file for details
 """
 
+import argparse
 import socket
 import threading
+import queue
+from concurrent.futures import Future
 import json
-import hashlib
 import os
+import time
 from datetime import datetime
-from player import Player
-from races import RACES
-from classes import CLASSES
-from database import Database
+from database import Database, LEADERBOARD_METRICS
+from nanny import Nanny
+from timers import TimerHeap
+from ratelimit import RateLimiter
+from vitals import HAS_NUMPY, VitalsStore, regenerate_players
+from combat import CombatEngine
+from auth import AuthBusy, PasswordHasher, ResumeTokens, needs_rehash
+from admin import ADMIN_SOCKET, HAS_UNIX_SOCKETS, AdminServer
+from session import MSG_DONTWAIT, SocketSession
+from names import NameIndex, name_key
+from items import get_item_description
+from help import HelpIndex
+from recorder import InputRecorder
+from npcs import NPCScheduler
+from websocket import PING_INTERVAL, WEBSOCKET_PORT, WebSocketSession
+from channels import (ADMIN_CHANNEL, GLOBAL_CHANNEL, GUILD_PREFIX, ChannelHub,
+                      class_channel, race_channel)
+
+# Seconds between world ticks (regeneration and other periodic updates)
+TICK_INTERVAL = 5.0
+
+# Connection timeouts in seconds
+LOGIN_TIMEOUT = 120    # Time allowed to finish logging in or creating a character
+IDLE_TIMEOUT = 1800    # Time allowed between commands once in the game
+WRITE_TIMEOUT = 30     # Time a single send may stall on a slow client
+RESUME_GRACE = 300     # Time a dropped player is kept in memory for a quick reconnect
+RESUME_TOKEN_LIFETIME = 86400  # Time a login's resume token is good for; it must outlast the session
+
+# Rate limits as (tokens per second, burst size)
+COMMAND_RATE = (5, 20)            # Commands per session
+SAY_BYTES_RATE = (200, 2000)      # Broadcast bytes per session
+CONNECTION_RATE = (0.2, 10)       # New connections per address
+LOGIN_ATTEMPT_RATE = (0.1, 5)     # Password attempts per address
+
+# Channel messages are dropped for a session with this many messages waiting to be written
+MAX_OUTPUT_BACKLOG = 500
+
+# Lines one connection may have waiting for the game thread before it stops being read
+MAX_QUEUED_LINES = 20
+
+# Password hashing pool; logins beyond the queue limit are told to retry
+HASH_WORKERS = min(4, os.cpu_count() or 1)
+MAX_PENDING_HASHES = 64
 
 class MUDServer:
-    def __init__(self, host='localhost', port=4000):
+    """The game itself, played over Session objects
+
+    start_server serves telnet clients over TCP and browser clients over
+    WebSockets. Each connection has a reader thread,
+    which runs the login menus and then posts every line it reads to the
+    command queue, and a writer thread for its output. A single game
+    thread drains the queue and runs world ticks, so players, the world
+    and sessions are only ever changed from that one thread. Output made
+    while handling a batch is buffered and handed to the sessions at the
+    end of the batch.
+
+    The same game logic can be driven without sockets or threads through
+    open_session, handle_line, flush_output and close_session, as the
+    simulation module does.
+    """
+    
+    def __init__(self, host='localhost', port=4000, login_timeout=LOGIN_TIMEOUT,
+                 idle_timeout=IDLE_TIMEOUT, write_timeout=WRITE_TIMEOUT, resume_grace=RESUME_GRACE,
+                 admin_socket=ADMIN_SOCKET, db_file="players.json", clock=time.monotonic, seed=None,
+                 record=None, websocket_port=WEBSOCKET_PORT):
         self.host = host
         self.port = port
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.players = {}  # Connected players
-        self.db = Database()
+        self.socket = None
+        self.websocket_port = websocket_port  # None to serve only the telnet port
+        self.websocket_socket = None
+        self.players = {}  # Session -> player, for everyone in the game
+        self.player_sessions = {}  # Normalized player name -> session
+        self.online_names = NameIndex()  # Normalized names of players in the game, for prefix lookups
+        self.nannies = {}  # Session -> Nanny, for sessions still logging in
+        self.outbox = {}  # Session -> messages produced since the last flush
+        self.channels = ChannelHub(self.deliver_channel_message)
+        self.help = HelpIndex()
+        
+        # Commands for the game thread, and how busy it is
+        self.commands = queue.SimpleQueue()
+        self.game_thread = None
+        self.metrics = {
+            'queue_depth': 0,       # Commands waiting when the last batch started
+            'max_queue_depth': 0,
+            'commands': 0,          # Commands run since startup
+            'batch_ms': 0.0,        # Time spent on the last batch of commands
+            'max_batch_ms': 0.0,
+            'ticks': 0,
+            'tick_ms': 0.0,         # Time spent on the last world tick
+            'max_tick_ms': 0.0,
+            'tick_errors': 0,       # World ticks that raised; the game thread carries on
+        }
+        self.db = Database(db_file)
+        
+        # Login, idle and write deadlines for every connection
+        self.login_timeout = login_timeout
+        self.idle_timeout = idle_timeout
+        self.write_timeout = write_timeout
+        self.timers = TimerHeap(clock)
+        
+        # Players whose connection dropped, kept for reattaching with a resume token
+        self.resume_grace = resume_grace
+        # The detached timer, not the token, limits resuming to the grace period after a drop
+        self.resume_tokens = ResumeTokens(RESUME_TOKEN_LIFETIME, clock)
+        self.detached = {}
+        
+        # Vitals of online players in NumPy columns, when NumPy is installed
+        self.vitals = VitalsStore() if HAS_NUMPY else None
+        
+        # Attacks queued during a tick are resolved together
+        self.combat = CombatEngine(self.vitals, notify=self.send_to_player, seed=seed)
+        
+        # NPCs think on world ticks, within a time budget, while players are near them
+        self.npcs = NPCScheduler(notify=self.send_to_sessions, clock=clock, seed=seed)
+        self.npcs.populate()
+        
+        # Flood protection per session and per source address
+        self.command_limiter = RateLimiter(*COMMAND_RATE, clock=clock)
+        self.say_limiter = RateLimiter(*SAY_BYTES_RATE, clock=clock)
+        self.connection_limiter = RateLimiter(*CONNECTION_RATE, clock=clock)
+        self.login_limiter = RateLimiter(*LOGIN_ATTEMPT_RATE, clock=clock)
+        
+        # Slow password hashing runs here instead of on client threads
+        self.hasher = PasswordHasher(HASH_WORKERS, MAX_PENDING_HASHES)
+        
+        # Local control socket for launcher.py and other admin tools
+        self.admin = AdminServer(self, admin_socket) if admin_socket and HAS_UNIX_SOCKETS else None
+        self.kicked = set()  # Sessions disconnected by an admin, not kept for resuming
+        
+        # Optional recording of in-game input, for replaying as a workload
+        self.recorder = InputRecorder(record, clock) if record else None
         
     def start_server(self):
         """Start the MUD server"""
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.socket.bind((self.host, self.port))
         self.socket.listen(5)
         print(f"PyPeake MUD Server started on {self.host}:{self.port}")
         print("Waiting for connections...")
         
+        reaper_thread = threading.Thread(target=self.reap_expired_sessions)
+        reaper_thread.daemon = True
+        reaper_thread.start()
+        
+        self.db.start_writer()
+        
+        self.game_thread = threading.Thread(target=self.run_game)
+        self.game_thread.daemon = True
+        self.game_thread.start()
+        
+        if self.admin is not None:
+            self.admin.start()
+        
+        if self.websocket_port:
+            self.websocket_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.websocket_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.websocket_socket.bind((self.host, self.websocket_port))
+            self.websocket_socket.listen(5)
+            print(f"WebSocket clients can connect to ws://{self.host}:{self.websocket_port}/")
+            websocket_thread = threading.Thread(target=self.accept_connections,
+                                                args=(self.websocket_socket, self.handle_websocket_client))
+            websocket_thread.daemon = True
+            websocket_thread.start()
+        
         try:
-            while True:
-                client_socket, address = self.socket.accept()
-                print(f"New connection from {address}")
-                
-                # Create a new thread for each client
-                client_thread = threading.Thread(
-                    target=self.handle_client,
-                    args=(client_socket, address)
-                )
-                client_thread.daemon = True
-                client_thread.start()
-                
+            self.accept_connections(self.socket, self.handle_client)
         except KeyboardInterrupt:
             print("\nShutting down server...")
             self.socket.close()
+            if self.websocket_socket is not None:
+                self.websocket_socket.close()
+            if self.admin is not None:
+                self.admin.close()
+            if self.recorder is not None:
+                self.call(self.recorder.close)  # On the game thread, which may be mid-write
+            self.db.flush()
+    
+    def accept_connections(self, listener, handler):
+        """Accept connections on a listening socket, handling each on its own thread"""
+        while True:
+            client_socket, address = listener.accept()
+            if not self.connection_limiter.allow(address[0]):
+                print(f"Refused connection from {address}: too many connections")
+                try:
+                    client_socket.send(b"Too many connections from your address. Try again later.\n", MSG_DONTWAIT)
+                except OSError:
+                    pass
+                client_socket.close()
+                continue
+            print(f"New connection from {address}")
+            
+            # Create a new thread for each client
+            client_thread = threading.Thread(
+                target=handler,
+                args=(client_socket, address)
+            )
+            client_thread.daemon = True
+            client_thread.start()
     
     def handle_client(self, client_socket, address):
         """Handle individual client connections"""
+        self.run_session(SocketSession(client_socket, address))
+    
+    def handle_websocket_client(self, client_socket, address):
+        """Handle a browser connection: the WebSocket handshake, then the usual session"""
+        session = WebSocketSession(client_socket, address)
         try:
-            self.send_welcome(client_socket)
-            player = self.login_process(client_socket)
-            
-            if player:
-                self.players[client_socket] = player
-                self.send_message(client_socket, f"Welcome to PyPeake, {player.name}!")
-                self.game_loop(client_socket, player)
-            
-        except Exception as e:
-            print(f"Error handling client {address}: {e}")
-        finally:
-            if client_socket in self.players:
-                player = self.players[client_socket]
-                print(f"Player {player.name} disconnected")
-                del self.players[client_socket]
+            client_socket.settimeout(self.login_timeout)
+            session.handshake()
+            client_socket.settimeout(None)
+        except (ConnectionError, OSError) as e:
+            print(f"WebSocket handshake with {address} failed: {e}")
             client_socket.close()
+            return
+        self.timers.schedule((session, 'ping'), PING_INTERVAL)
+        self.run_session(session)
     
-    def send_welcome(self, client_socket):
-        """Send welcome message to new connections"""
-        welcome_msg = """
-╔══════════════════════════════════════╗
-║           Welcome to PyPeake         ║
-║        A Python Text Adventure       ║
-╚══════════════════════════════════════╝
-
-Choose an option:
-1. Login
-2. Create New Character
-3. Quit
+    def run_session(self, session):
+        """Read from one connection until it quits or drops
 
-Enter your choice (1-3): """
+        Logging in may wait on password hashing, so the login menus run
+        here rather than on the game thread. After that every line is
+        posted to the game thread, with at most MAX_QUEUED_LINES of them
+        waiting at once.
+        """
+        writer_thread = threading.Thread(target=self.write_output, args=(session,))
+        writer_thread.daemon = True
+        writer_thread.start()
         
-        self.send_message(client_socket, welcome_msg)
+        try:
+            player = self.login_process(session)
+            if player is not None:
+                self.post(self.enter_game, session, player)
+                queued = threading.BoundedSemaphore(MAX_QUEUED_LINES)
+                while True:
+                    line = self.receive_message(session)
+                    # A client flooding input waits here, and TCP pushes back on it, instead of growing the queue
+                    queued.acquire()
+                    self.post(self.handle_input, session, line, queued)
+        except (ConnectionError, OSError):
+            pass
+        except Exception as e:
+            print(f"Error handling client {session.address}: {e}")
+        self.post(self.close_session, session)
     
-    def login_process(self, client_socket):
-        """Handle the login process"""
+    def login_process(self, session):
+        """Run the login and character creation menus on the connection's thread"""
+        self.timers.schedule((session, 'input'), self.login_timeout)
+        nanny = Nanny(self, session.address)
+        for message in nanny.start():
+            session.send(message)
+        while not nanny.finished:
+            messages = nanny.feed(self.receive_message(session))
+            while nanny.waiting is not None:
+                # Only this connection waits for its password to be checked
+                messages += nanny.continue_login()
+            for message in messages:
+                session.send(message)
+        return nanny.player
+    
+    def write_output(self, session):
+        """Write a connection's output on its own thread until it closes"""
         while True:
+            data = session.next_output()
+            if data is None:
+                break
+            self.timers.schedule((session, 'write'), self.write_timeout)
             try:
-                response = self.receive_message(client_socket).strip()
-                
-                if response == '1':
-                    return self.login_existing_player(client_socket)
-                elif response == '2':
-                    return self.create_new_player(client_socket)
-                elif response == '3':
-                    self.send_message(client_socket, "Goodbye!")
-                    return None
-                else:
-                    self.send_message(client_socket, "Invalid choice. Please enter 1, 2, or 3: ")
-                    
-            except:
-                return None
-    
-    def login_existing_player(self, client_socket):
-        """Handle existing player login"""
-        self.send_message(client_socket, "Username: ")
-        username = self.receive_message(client_socket).strip()
-        
-        self.send_message(client_socket, "Password: ")
-        password = self.receive_message(client_socket).strip()
-        
-        player_data = self.db.get_player(username)
-        if player_data and self.verify_password(password, player_data['password_hash']):
-            player = Player.from_dict(player_data)
-            self.send_message(client_socket, f"Login successful! Welcome back, {player.name}.")
-            return player
-        else:
-            self.send_message(client_socket, "Invalid username or password. Returning to main menu...\n")
-            self.send_welcome(client_socket)
-            return None
+                session.write(data)
+            except OSError:
+                break
+            finally:
+                self.timers.cancel((session, 'write'))
+        session.shutdown()
     
-    def create_new_player(self, client_socket):
-        """Handle new player creation"""
-        # Get username
-        while True:
-            self.send_message(client_socket, "Enter desired username: ")
-            username = self.receive_message(client_socket).strip()
-            
-            if len(username) < 3:
-                self.send_message(client_socket, "Username must be at least 3 characters long.\n")
-                continue
-            
-            if self.db.get_player(username):
-                self.send_message(client_socket, "Username already exists. Please choose another.\n")
-                continue
-            
-            break
+    def post(self, function, *args):
+        """Queue a call to run on the game thread"""
+        self.commands.put((function, args))
+    
+    def call(self, function, *args):
+        """Run a function on the game thread and wait for its result
+
+        Runs it directly when already on the game thread, or when there
+        is no game thread (such as in a simulation).
+        """
+        if self.game_thread is None or threading.current_thread() is self.game_thread:
+            return function(*args)
+        future = Future()
+        
+        def run():
+            try:
+                future.set_result(function(*args))
+            except Exception as e:
+                future.set_exception(e)
         
-        # Get password
+        self.post(run)
+        return future.result()
+    
+    def run_game(self, tick_interval=TICK_INTERVAL):
+        """The game thread: run queued commands as they arrive and a world tick every tick_interval"""
+        next_tick = time.monotonic() + tick_interval
         while True:
-            self.send_message(client_socket, "Enter password: ")
-            password = self.receive_message(client_socket).strip()
-            
-            if len(password) < 4:
-                self.send_message(client_socket, "Password must be at least 4 characters long.\n")
-                continue
-            
-            self.send_message(client_socket, "Confirm password: ")
-            confirm_password = self.receive_message(client_socket).strip()
-            
-            if password != confirm_password:
-                self.send_message(client_socket, "Passwords don't match. Please try again.\n")
-                continue
+            try:
+                command = self.commands.get(timeout=max(0, next_tick - time.monotonic()))
+            except queue.Empty:
+                command = None
+            if command is not None:
+                self.run_commands(command)
             
-            break
-        
-        # Race selection
-        race = self.select_race(client_socket)
-        if not race:
-            return None
-        
-        # Class selection
-        char_class = self.select_class(client_socket)
-        if not char_class:
-            return None
+            if time.monotonic() >= next_tick:
+                start = time.perf_counter()
+                try:
+                    self.world_tick()
+                    self.flush_output()
+                except Exception as e:
+                    # One bad tick must not end the game thread, or every call() would wait forever
+                    print(f"Error running world tick: {e}")
+                    self.metrics['tick_errors'] += 1
+                elapsed = (time.perf_counter() - start) * 1000
+                self.metrics['ticks'] += 1
+                self.metrics['tick_ms'] = elapsed
+                self.metrics['max_tick_ms'] = max(self.metrics['max_tick_ms'], elapsed)
+                next_tick += tick_interval
+    
+    def run_commands(self, first):
+        """Run a command and everything queued behind it as one batch, then deliver the output"""
+        start = time.perf_counter()
+        batch = [first]
+        # Only take what is queued now, so a flood of input cannot starve the world tick
+        for _ in range(self.commands.qsize()):
+            try:
+                batch.append(self.commands.get_nowait())
+            except queue.Empty:
+                break
         
-        # Create the player
-        password_hash = self.hash_password(password)
-        player = Player(username, password_hash, race, char_class)
+        for function, args in batch:
+            try:
+                function(*args)
+            except Exception as e:
+                print(f"Error running {getattr(function, '__name__', function)}: {e}")
+        try:
+            self.flush_output()
+        except Exception as e:
+            print(f"Error delivering output: {e}")
         
-        # Save to database
-        self.db.save_player(player.to_dict())
+        elapsed = (time.perf_counter() - start) * 1000
+        metrics = self.metrics
+        metrics['queue_depth'] = len(batch)
+        metrics['max_queue_depth'] = max(metrics['max_queue_depth'], len(batch))
+        metrics['commands'] += len(batch)
+        metrics['batch_ms'] = elapsed
+        metrics['max_batch_ms'] = max(metrics['max_batch_ms'], elapsed)
+    
+    def get_metrics(self):
+        """Get a copy of the game thread metrics, with the current queue depth"""
+        return dict(self.metrics, pending=self.commands.qsize())
+    
+    def handle_input(self, session, line, queued=None):
+        """Run a line from a connection in the game, closing the session if the player quit
+
+        queued is the connection's semaphore of waiting lines, released
+        here so its reader can queue another.
+        """
+        try:
+            if session not in self.players:
+                return  # Already closed
+            try:
+                keep_open = self.handle_line(session, line)
+            except Exception as e:
+                print(f"Error handling client {session.address}: {e}")
+                self.close_session(session)
+                return
+            if not keep_open:
+                self.close_session(session, quit_game=True)
+        finally:
+            if queued is not None:
+                queued.release()
+    
+    def open_session(self, session):
+        """Start the login menus for a new session"""
+        self.timers.schedule((session, 'input'), self.login_timeout)
+        nanny = Nanny(self, session.address)
+        self.nannies[session] = nanny
+        for message in nanny.start():
+            self.send_message(session, message)
+    
+    def handle_line(self, session, line):
+        """Handle one line of input from a session
+
+        Returns False once the session has quit.
+        """
+        nanny = self.nannies.get(session)
+        if nanny is not None:
+            for message in nanny.feed(line):
+                self.send_message(session, message)
+            return self.settle_nanny(session, nanny)
         
-        self.send_message(client_socket, f"\nCharacter created successfully!")
-        self.send_message(client_socket, f"Name: {player.name}")
-        self.send_message(client_socket, f"Race: {player.race}")
-        self.send_message(client_socket, f"Class: {player.char_class}")
-        self.send_message(client_socket, f"Health: {player.health}/{player.max_health}")
-        self.send_message(client_socket, f"Mana: {player.mana}/{player.max_mana}")
+        player = self.players.get(session)
+        if player is None:
+            return False
+        self.timers.schedule((session, 'input'), self.idle_timeout)
+        if self.recorder is not None:
+            self.recorder.line(session, line)
+        return self.handle_command(session, player, line.strip().lower())
+    
+    def settle_nanny(self, session, nanny):
+        """Act on where a nanny got to: still waiting, still in the menus, or done
+
+        A nanny waiting on password hashing is resumed from the game
+        thread once the hash is ready, so nothing here blocks on it.
+        Returns False if the session quit from the menus.
+        """
+        if nanny.waiting is not None:
+            nanny.waiting.add_done_callback(lambda _: self.post(self.resume_nanny, session, nanny))
+            return True
+        if not nanny.finished:
+            return True
+        del self.nannies[session]
+        if nanny.player is None:
+            return False
+        self.enter_game(session, nanny.player)
+        return True
+    
+    def resume_nanny(self, session, nanny):
+        """Carry on a login once its password hash is ready"""
+        if self.nannies.get(session) is not nanny:
+            return  # The connection closed while it waited
+        for message in nanny.continue_login():
+            self.send_message(session, message)
+        if not self.settle_nanny(session, nanny):
+            self.close_session(session, quit_game=True)
+    
+    def enter_game(self, session, player):
+        """Put a logged in player into the world"""
+        if self.vitals is not None:
+            self.vitals.attach(player)
+        player.progress_listener = self.db.update_progress
+        self.players[session] = player
+        self.player_sessions[name_key(player.name)] = session
+        self.online_names.add(player.name)
+        if self.recorder is not None:
+            self.recorder.join(session, player)
+        self.timers.schedule((session, 'input'), self.idle_timeout)
+        for channel in (GLOBAL_CHANNEL, ADMIN_CHANNEL, race_channel(player.race), class_channel(player.char_class)):
+            self.channels.subscribe(channel, session)
         
+        self.send_message(session, f"Welcome to PyPeake, {player.name}!")
+        token = self.resume_tokens.issue(player.name)
+        self.send_message(session, f"Resume token: {token}")
+        self.send_message(session, "If you are disconnected, enter 'resume <token>' at the main menu to pick up where you left off.")
+        self.send_message(session, self.help.command_summary())
+        self.send_message(session, "\nYou are standing in the Town Square.")
+        self.send_message(session, "> ")
+    
+    def close_session(self, session, quit_game=False):
+        """Clean up after a session ends, saving its player
+
+        A player whose connection dropped, rather than quitting, is held
+        for the resume grace period.
+        """
+        self.timers.cancel((session, 'input'))
+        self.timers.cancel((session, 'write'))
+        self.timers.cancel((session, 'ping'))
+        self.command_limiter.discard(session)
+        self.say_limiter.discard(session)
+        self.nannies.pop(session, None)
+        self.channels.unsubscribe_all(session)
+        self.flush_session(session)
+        if session in self.players:
+            player = self.players[session]
+            print(f"Player {player.name} disconnected")
+            del self.players[session]
+            if self.recorder is not None:
+                self.recorder.leave(session, quit_game)
+            if self.player_sessions.get(name_key(player.name)) is session:
+                del self.player_sessions[name_key(player.name)]
+                self.online_names.remove(player.name)
+            if self.vitals is not None:
+                self.vitals.detach(player)
+            self.db.save_player(player.to_dict())
+            if not quit_game and session not in self.kicked:
+                self.detach_player(player)
+        self.kicked.discard(session)
+        session.close()
+    
+    def detach_player(self, player):
+        """Keep a dropped player in memory for the resume grace period"""
+        username = name_key(player.name)
+        self.detached[username] = player
+        self.timers.schedule((username, 'detached'), self.resume_grace)
+    
+    def resume_player(self, token):
+        """Reattach a detached player by resume token, or return None"""
+        return self.call(self.take_detached_player, token)
+    
+    def take_detached_player(self, token):
+        """Remove and return the detached player a resume token belongs to"""
+        username = self.resume_tokens.verify(token)
+        if username is None:
+            return None
+        player = self.detached.pop(username, None)
+        if player is not None:
+            self.timers.cancel((username, 'detached'))
         return player
     
-    def select_race(self, client_socket):
-        """Handle race selection"""
-        while True:
-            race_list = "\n=== Choose Your Race ===\n"
-            for i, (race_name, race_data) in enumerate(RACES.items(), 1):
-                race_list += f"{i}. {race_name}\n"
-                race_list += f"   Description: {race_data['description']}\n"
-                race_list += f"   Bonuses: {', '.join(race_data['bonuses'])}\n\n"
-            
-            race_list += "Enter your choice (1-{}): ".format(len(RACES))
-            self.send_message(client_socket, race_list)
-            
-            try:
-                choice = int(self.receive_message(client_socket).strip())
-                if 1 <= choice <= len(RACES):
-                    race_name = list(RACES.keys())[choice - 1]
-                    return race_name
-                else:
-                    self.send_message(client_socket, "Invalid choice. Please try again.\n")
-            except ValueError:
-                self.send_message(client_socket, "Please enter a valid number.\n")
-            except:
-                return None
-    
-    def select_class(self, client_socket):
-        """Handle class selection"""
+    def claim_player(self, username):
+        """Stop holding a detached player because they logged in normally"""
+        self.call(self.release_detached_player, username)
+    
+    def release_detached_player(self, username):
+        """Drop a detached player without saving them again"""
+        username = name_key(username)
+        if self.detached.pop(username, None) is not None:
+            self.timers.cancel((username, 'detached'))
+    
+    def world_tick(self):
+        """Apply one tick of periodic world updates"""
+        self.combat.resolve()
+        self.regenerate()
+        self.npcs.tick(self.observers())
+        if self.recorder is not None:
+            self.recorder.flush()
+    
+    def observers(self):
+        """The sessions in the game, grouped by their player's location"""
+        observers = {}
+        for session, player in self.players.items():
+            observers.setdefault(player.location, []).append(session)
+        return observers
+    
+    def regenerate(self):
+        """Regenerate health and mana for every online player"""
+        if self.vitals is not None:
+            self.vitals.regenerate()
+        else:
+            regenerate_players(list(self.players.values()))
+    
+    def award_experience(self, awards):
+        """Give experience to many players at once, e.g. a party or world event
+
+        awards maps each Player to the experience they earn. Level ups,
+        including jumps of several levels, are announced to each player
+        and every affected record is saved in one database write.
+        """
+        records = []
+        for player, amount in awards.items():
+            message = player.gain_experience(amount)
+            if message:
+                self.send_to_player(player, message)
+            records.append(player.to_dict())
+        self.db.save_many(records)
+        return len(records)
+    
+    def save_online_players(self):
+        """Save every online player in one database write"""
+        records = [player.to_dict() for player in list(self.players.values())]
+        self.db.save_many(records)
+        return len(records)
+    
+    def kick_player(self, name):
+        """Disconnect an online player without keeping them for resuming
+
+        Returns True if the player was online.
+        """
+        session = self.player_sessions.get(name_key(name))
+        if session is None:
+            return False
+        print(f"Kicking {name}")
+        self.kicked.add(session)
+        session.interrupt("\nYou have been disconnected by an administrator.\n")
+        return True
+    
+    def reap_expired_sessions(self):
+        """Close connections whose login, idle or write deadline has passed"""
         while True:
-            class_list = "\n=== Choose Your Class ===\n"
-            for i, (class_name, class_data) in enumerate(CLASSES.items(), 1):
-                class_list += f"{i}. {class_name}\n"
-                class_list += f"   Description: {class_data['description']}\n"
-                class_list += f"   Primary Stat: {class_data['primary_stat']}\n"
-                class_list += f"   Starting Skills: {', '.join(class_data['starting_skills'])}\n\n"
-            
-            class_list += "Enter your choice (1-{}): ".format(len(CLASSES))
-            self.send_message(client_socket, class_list)
-            
-            try:
-                choice = int(self.receive_message(client_socket).strip())
-                if 1 <= choice <= len(CLASSES):
-                    class_name = list(CLASSES.keys())[choice - 1]
-                    return class_name
-                else:
-                    self.send_message(client_socket, "Invalid choice. Please try again.\n")
-            except ValueError:
-                self.send_message(client_socket, "Please enter a valid number.\n")
-            except:
-                return None
-    
-    def game_loop(self, client_socket, player):
-        """Main game loop for connected players"""
-        self.send_message(client_socket, "\n=== Game Commands ===")
-        self.send_message(client_socket, "- stats: View your character stats")
-        self.send_message(client_socket, "- look: Look around your current location")
-        self.send_message(client_socket, "- who: See who else is online")
-        self.send_message(client_socket, "- say <message>: Say something to other players")
-        self.send_message(client_socket, "- quit: Leave the game")
-        self.send_message(client_socket, "\nYou are standing in the Town Square.")
-        self.send_message(client_socket, "> ")
+            self.post(self.handle_expired, self.timers.wait_expired())
+    
+    def handle_expired(self, expired):
+        """Act on a batch of expired (key, kind) timers"""
+        for key, kind in expired:
+            if kind == 'detached':
+                self.detached.pop(key, None)
+            elif kind == 'ping':
+                self.keep_alive(key)
+            else:
+                self.expire_session(key, kind)
+    
+    def keep_alive(self, session):
+        """Ping a WebSocket client, disconnecting it if the last ping went unanswered"""
+        if session.ping():
+            self.timers.schedule((session, 'ping'), PING_INTERVAL)
+        else:
+            print("Closing WebSocket connection that stopped answering pings")
+            session.interrupt()
+    
+    def expire_session(self, session, kind):
+        """Disconnect a timed out client
+
+        Interrupting the session wakes the client's thread from any blocked
+        receive or send, and its normal cleanup then saves the player.
+        """
+        if kind == 'write':
+            reason = "stalled on output"
+        elif session in self.players:
+            reason = "was idle too long"
+        else:
+            reason = "took too long to log in"
+        print(f"Closing connection that {reason}")
+        session.interrupt(None if kind == 'write' else "\nConnection timed out.\n")
+    
+    def handle_command(self, session, player, command):
+        """Run one game command
+
+        Returns False if the player quit.
+        """
+        if not command:
+            return True
         
-        while True:
-            try:
-                command = self.receive_message(client_socket).strip().lower()
-                
-                if not command:
-                    continue
-                
-                if command == 'quit':
-                    self.send_message(client_socket, "Goodbye!")
-                    break
-                elif command == 'stats':
-                    self.show_stats(client_socket, player)
-                elif command == 'look':
-                    self.look_around(client_socket, player)
-                elif command == 'who':
-                    self.show_online_players(client_socket)
-                elif command.startswith('say '):
-                    message = command[4:]
-                    self.broadcast_say(client_socket, player, message)
-                else:
-                    self.send_message(client_socket, "Unknown command. Type 'quit' to leave.")
-                
-                self.send_message(client_socket, "> ")
-                
-            except:
-                break
+        if not self.command_limiter.allow(session):
+            self.send_message(session, "You are sending commands too quickly. Command ignored.")
+            return True
+        
+        if command == 'quit':
+            self.send_message(session, "Goodbye!")
+            return False
+        elif command == 'stats':
+            self.show_stats(session, player)
+        elif command == 'look':
+            self.look_around(session, player)
+        elif command == 'who':
+            self.show_online_players(session)
+        elif command == 'help' or command.startswith('help '):
+            self.show_help(session, command[5:].strip())
+        elif command in ('inventory', 'inv', 'i'):
+            self.show_inventory(session, player)
+        elif command.startswith('examine '):
+            self.examine_item(session, player, command[8:].strip())
+        elif command == 'top' or command.startswith('top '):
+            self.show_leaderboard(session, command[4:].strip() or 'level')
+        elif command == 'rank' or command.startswith('rank '):
+            self.show_rank(session, player, command[5:].strip() or 'level')
+        elif command.startswith('say '):
+            message = command[4:]
+            self.broadcast_say(session, player, message)
+        elif command.startswith('tell '):
+            name, _, message = command[5:].strip().partition(' ')
+            self.tell(session, player, name, message.strip())
+        elif command.startswith('finger '):
+            self.finger(session, command[7:].strip())
+        elif command.startswith('chat '):
+            channel, _, message = command[5:].strip().partition(' ')
+            self.chat(session, player, channel, message.strip())
+        elif command == 'channels':
+            self.show_channels(session)
+        elif command.startswith('join '):
+            self.join_channel(session, player, command[5:].strip())
+        elif command.startswith('leave '):
+            self.leave_channel(session, player, command[6:].strip())
+        elif command.startswith('history '):
+            self.show_channel_history(session, player, command[8:].strip())
+        else:
+            self.send_message(session, "Unknown command. Type 'quit' to leave.")
+        
+        self.send_message(session, "> ")
+        return True
     
-    def show_stats(self, client_socket, player):
+    def show_stats(self, session, player):
         """Display player stats"""
         stats = f"""
 === Character Stats ===
@@ -295,9 +705,85 @@ Attributes:
 
 Experience: {player.experience}
 """
-        self.send_message(client_socket, stats)
+        self.send_message(session, stats)
+    
+    def format_ranking(self, rank, player_data, metric):
+        """Format one leaderboard line"""
+        line = f"#{rank} {player_data['name']} (Level {player_data.get('level', 1)} {player_data.get('race')} {player_data.get('char_class')})"
+        if metric == 'experience':
+            line += f" - {player_data.get('experience', 0)} exp"
+        elif metric == 'created_at':
+            line += f" - joined {player_data.get('created_at', '')[:10]}"
+        return line
+    
+    def show_leaderboard(self, session, metric):
+        """Show the top players by a metric"""
+        if metric not in LEADERBOARD_METRICS:
+            self.send_message(session, f"Unknown leaderboard. Choose from: {', '.join(LEADERBOARD_METRICS)}")
+            return
+        
+        board = f"=== Top Players by {metric} ===\n"
+        for rank, (_, player_data) in enumerate(self.db.get_top_players(10, metric).items(), 1):
+            board += self.format_ranking(rank, player_data, metric) + "\n"
+        self.send_message(session, board)
     
-    def look_around(self, client_socket, player):
+    def show_rank(self, session, player, metric):
+        """Show a player's rank and the players around them"""
+        if metric not in LEADERBOARD_METRICS:
+            self.send_message(session, f"Unknown leaderboard. Choose from: {', '.join(LEADERBOARD_METRICS)}")
+            return
+        
+        rank = self.db.get_rank(player.name, metric)
+        if rank is None:
+            self.send_message(session, "You are not on the leaderboard yet.")
+            return
+        
+        board = f"You are ranked #{rank} of {self.db.get_player_count()} by {metric}.\n"
+        for nearby_rank, player_data in self.db.get_players_around(player.name, 2, metric):
+            board += self.format_ranking(nearby_rank, player_data, metric) + "\n"
+        self.send_message(session, board)
+    
+    def show_help(self, session, topic):
+        """Show the topic list, one topic, or the topics matching a search"""
+        if not topic:
+            self.send_message(session, self.help.topics())
+            return
+        
+        entry = self.help.topic(topic)
+        if entry is not None:
+            self.send_message(session, entry.text)
+            return
+        
+        words = topic[7:] if topic.startswith('search ') else topic
+        matches = self.help.search(words)
+        if len(matches) == 1:
+            self.send_message(session, matches[0].text)
+        elif matches:
+            self.send_message(session, f"Topics about {words}: {', '.join(entry.title for entry in matches)}")
+        else:
+            self.send_message(session, f"No help found for {words}.")
+    
+    def show_inventory(self, session, player):
+        """List what a player is carrying"""
+        if not len(player.inventory):
+            self.send_message(session, "You are carrying nothing.")
+            return
+        
+        inventory = "=== Inventory ===\n"
+        for item in player.inventory:
+            inventory += f"- {item}\n"
+        inventory += f"Total weight: {player.inventory.weight()}"
+        self.send_message(session, inventory)
+    
+    def examine_item(self, session, player, word):
+        """Describe an item the player carries"""
+        item = player.inventory.find(word)
+        if item is None:
+            self.send_message(session, f"You aren't carrying anything called {word}.")
+            return
+        self.send_message(session, get_item_description(item.template_id))
+    
+    def look_around(self, session, player):
         """Show current location description"""
         description = """
 You are standing in the Town Square of PyPeake.
@@ -305,55 +791,239 @@ A bustling center of activity with merchants, adventurers, and townsfolk.
 To the north lies the Great Forest, to the south the Rolling Hills.
 The Adventurer's Guild stands prominently to the east.
 """
-        self.send_message(client_socket, description)
+        npcs = self.npcs.present(player.location)
+        if npcs:
+            description += f"You see {', '.join(npc.name for npc in npcs)}.\n"
+        self.send_message(session, description)
     
-    def show_online_players(self, client_socket):
+    def show_online_players(self, session):
         """Show list of online players"""
         if not self.players:
-            self.send_message(client_socket, "No other players are currently online.")
+            self.send_message(session, "No other players are currently online.")
             return
         
         player_list = "=== Online Players ===\n"
-        for socket, player in self.players.items():
-            if socket != client_socket:
+        for other, player in list(self.players.items()):
+            if other is not session:
                 player_list += f"- {player.name} (Level {player.level} {player.race} {player.char_class})\n"
         
         if player_list == "=== Online Players ===\n":
             player_list += "No other players are currently online."
         
-        self.send_message(client_socket, player_list)
+        self.send_message(session, player_list)
     
-    def broadcast_say(self, sender_socket, sender_player, message):
-        """Broadcast a say message to all players in the area"""
-        say_message = f"{sender_player.name} says: {message}"
+    def broadcast_say(self, sender_session, sender_player, message):
+        """Broadcast a say message to everyone on the global channel"""
+        if not self.say_limiter.allow(sender_session, len(message.encode('utf-8'))):
+            self.send_message(sender_session, "You are talking too much. Wait a moment before speaking again.")
+            return
         
-        for socket, player in self.players.items():
-            if socket != sender_socket:
-                self.send_message(socket, say_message)
+        self.channels.publish(GLOBAL_CHANNEL, f"{sender_player.name} says: {message}", exclude=sender_session)
+        self.send_message(sender_session, f"You say: {message}")
+    
+    def tell(self, session, player, partial, message):
+        """Send a private message to an online player named by a partial name"""
+        if not partial or not message:
+            self.send_message(session, "Usage: tell <name> <message>")
+            return
+        matches = self.online_names.resolve(partial)
+        if not matches:
+            self.send_message(session, f"No one called {partial} is online.")
+            return
+        if len(matches) > 1:
+            names = ', '.join(self.players[self.player_sessions[key]].name for key in matches)
+            self.send_message(session, f"Which player do you mean: {names}?")
+            return
+        if not self.say_limiter.allow(session, len(message.encode('utf-8'))):
+            self.send_message(session, "You are talking too much. Wait a moment before speaking again.")
+            return
         
-        self.send_message(sender_socket, f"You say: {message}")
+        target = self.player_sessions[matches[0]]
+        self.send_message(target, f"{player.name} tells you: {message}")
+        self.send_message(session, f"You tell {self.players[target].name}: {message}")
     
-    def send_message(self, client_socket, message):
-        """Send a message to a client"""
-        try:
-            client_socket.send((message + '\n').encode('utf-8'))
-        except:
-            pass
+    def finger(self, session, partial):
+        """Show what is known about any player, online or stored, by partial name"""
+        matches = self.db.find_players(partial)
+        if not matches:
+            self.send_message(session, f"There is no player called {partial}.")
+            return
+        if len(matches) > 1:
+            names = ', '.join(player_data['name'] for player_data in matches)
+            self.send_message(session, f"Which player do you mean: {names}?")
+            return
+        
+        player_data = matches[0]
+        online = name_key(player_data['name']) in self.player_sessions
+        info = f"=== {player_data['name']} ===\n"
+        info += f"Level {player_data.get('level', 1)} {player_data.get('race', '')} {player_data.get('char_class', '')}\n"
+        if online:
+            info += "Online now\n"
+        else:
+            info += f"Last seen: {(player_data.get('last_login') or 'never')[:16].replace('T', ' ')}\n"
+        self.send_message(session, info)
+    
+    def resolve_channel(self, player, name):
+        """Turn the race and class shortcuts into a player's own channel names"""
+        if name == 'race':
+            return race_channel(player.race)
+        if name == 'class':
+            return class_channel(player.char_class)
+        return name
+    
+    def chat(self, session, player, name, message):
+        """Publish a message on a channel the player is in"""
+        channel = self.resolve_channel(player, name)
+        if not message:
+            self.send_message(session, "Usage: chat <channel> <message>")
+        elif channel == ADMIN_CHANNEL:
+            self.send_message(session, "Only the server can post on the admin channel.")
+        elif not self.channels.is_subscribed(channel, session):
+            self.send_message(session, f"You are not on the {channel} channel.")
+        elif not self.say_limiter.allow(session, len(message.encode('utf-8'))):
+            self.send_message(session, "You are talking too much. Wait a moment before speaking again.")
+        else:
+            self.channels.publish(channel, f"[{channel}] {player.name}: {message}")
+    
+    def show_channels(self, session):
+        """List the channels a player is in"""
+        channel_list = "=== Your Channels ===\n"
+        for name in self.channels.channels_of(session):
+            channel_list += f"- {name} ({len(self.channels.channels[name].subscribers)} listening)\n"
+        self.send_message(session, channel_list)
+    
+    def join_channel(self, session, player, name):
+        """Join the global channel, a guild channel or back into the player's own race or class channel
+
+        Catches the player up on the channel's history.
+        """
+        channel = self.resolve_channel(player, name)
+        own = (GLOBAL_CHANNEL, race_channel(player.race), class_channel(player.char_class))
+        if channel not in own and not (channel.startswith(GUILD_PREFIX) and len(channel) > len(GUILD_PREFIX)):
+            self.send_message(session, "You can join the global channel, your race or class channel, "
+                                       "or a guild channel (guild:<name>).")
+            return
+        self.channels.subscribe(channel, session)
+        self.send_message(session, f"You join the {channel} channel.")
+        for line in self.channels.recent(channel, 10):
+            self.send_message(session, line)
     
-    def receive_message(self, client_socket):
+    def leave_channel(self, session, player, name):
+        """Stop listening to a channel"""
+        channel = self.resolve_channel(player, name)
+        if channel == ADMIN_CHANNEL:
+            self.send_message(session, "Server announcements can't be turned off.")
+        elif self.channels.unsubscribe(channel, session):
+            self.send_message(session, f"You leave the {channel} channel.")
+        else:
+            self.send_message(session, f"You are not on the {channel} channel.")
+    
+    def show_channel_history(self, session, player, name):
+        """Show the recent messages on a channel the player is in"""
+        channel = self.resolve_channel(player, name)
+        if not self.channels.is_subscribed(channel, session):
+            self.send_message(session, f"You are not on the {channel} channel.")
+            return
+        history = self.channels.recent(channel)
+        self.send_message(session, "\n".join([f"=== Recent messages on {channel} ==="] + history))
+    
+    def announce(self, message):
+        """Post a server announcement to every player"""
+        return self.channels.publish(ADMIN_CHANNEL, f"[{ADMIN_CHANNEL}] {message}")
+    
+    def deliver_channel_message(self, session, data):
+        """Queue an encoded channel message for a session, unless its output is backed up"""
+        if len(self.outbox.get(session, ())) + session.backlog() >= MAX_OUTPUT_BACKLOG:
+            return False
+        self.send_message(session, data)
+        return True
+    
+    def send_message(self, session, message):
+        """Send a message to a client at the end of the current batch"""
+        messages = self.outbox.get(session)
+        if messages is None:
+            self.outbox[session] = [message]
+        else:
+            messages.append(message)
+    
+    def flush_session(self, session):
+        """Hand one session's buffered output to it"""
+        for message in self.outbox.pop(session, ()):
+            try:
+                session.send(message)
+            except OSError:
+                break
+    
+    def flush_output(self):
+        """Hand every session's buffered output to it"""
+        outbox, self.outbox = self.outbox, {}
+        for session, messages in outbox.items():
+            for message in messages:
+                try:
+                    session.send(message)
+                except OSError:
+                    break
+    
+    def send_to_sessions(self, sessions, message):
+        """Send the same message to several sessions"""
+        for session in sessions:
+            self.send_message(session, message)
+    
+    def send_to_player(self, player, message):
+        """Send a message to an online player, wherever they are connected"""
+        session = self.player_sessions.get(name_key(player.name))
+        if session is not None:
+            self.send_message(session, message)
+    
+    def receive_message(self, session):
         """Receive a message from a client"""
-        return client_socket.recv(1024).decode('utf-8').strip()
+        return session.receive()
     
     def hash_password(self, password):
-        """Hash a password for secure storage"""
-        return hashlib.sha256(password.encode()).hexdigest()
+        """Start hashing a password for secure storage, returning a future of the hash
+
+        Raises AuthBusy if the hashing pool is full.
+        """
+        return self.hasher.hash(password)
     
     def verify_password(self, password, hash_value):
-        """Verify a password against its hash"""
-        return hashlib.sha256(password.encode()).hexdigest() == hash_value
+        """Start verifying a password against its hash, returning a future of the result
+
+        Raises AuthBusy if the hashing pool is full.
+        """
+        return self.hasher.verify(password, hash_value)
+    
+    def upgrade_password_hash(self, player, password):
+        """Rehash a player's password in the background if it uses an outdated scheme or cost"""
+        if not needs_rehash(player.password_hash):
+            return
+        try:
+            future = self.hash_password(password)
+        except AuthBusy:
+            return  # Try again on a quieter login
+        future.add_done_callback(lambda _: self.post(self.save_upgraded_hash, player, future))
+    
+    def save_upgraded_hash(self, player, future):
+        """Store a player's rehashed password once it is ready"""
+        if future.exception() is not None:
+            print(f"Upgrading password hash for {player.name} failed: {future.exception()}")
+            return
+        player.password_hash = future.result()
+        self.db.save_player(player.to_dict())
+        print(f"Upgraded password hash for {player.name}")
 
 if __name__ == "__main__":
-    server = MUDServer()
+    parser = argparse.ArgumentParser(description='PyPeake MUD Server')
+    parser.add_argument('--host', default='localhost', help='Address to listen on (default: localhost)')
+    parser.add_argument('--port', type=int, default=4000, help='Port to listen on (default: 4000)')
+    parser.add_argument('--websocket-port', type=int, default=WEBSOCKET_PORT,
+                        help=f'Port for browser clients, 0 to disable (default: {WEBSOCKET_PORT})')
+    parser.add_argument('--record', help='Record players\' input to this file for replaying later')
+    args = parser.parse_args()
+    if args.record and os.path.exists(args.record):
+        parser.error(f"{args.record} already exists; choose a new file for the recording")
+    
+    server = MUDServer(args.host, args.port, record=args.record, websocket_port=args.websocket_port)
     try:
         server.start_server()
     except KeyboardInterrupt:
@@ -0,0 +1,257 @@
+"""
+Login and character creation for PyPeake MUD
+A per-connection state machine driven one input line at a time
+
+Copyright (c) 2025 PyPeake MUD
+Licensed under the MIT License - see LICENSE file for details
+"""
+
+from player import Player
+from races import RACES
+from classes import CLASSES
+from auth import DUMMY_HASH, AuthBusy
+
+WELCOME_MESSAGE = """
+╔══════════════════════════════════════╗
+║           Welcome to PyPeake         ║
+║        A Python Text Adventure       ║
+╚══════════════════════════════════════╝
+
+Choose an option:
+1. Login
+2. Create New Character
+3. Quit
+(Or enter 'resume <token>' to reconnect)
+
+Enter your choice (1-3): """
+
+BUSY_MESSAGE = "The server is busy with other logins. Please try again in a moment.\n"
+
+def build_race_menu():
+    """Render the race selection menu"""
+    race_list = "\n=== Choose Your Race ===\n"
+    for i, (race_name, race_data) in enumerate(RACES.items(), 1):
+        race_list += f"{i}. {race_name}\n"
+        race_list += f"   Description: {race_data['description']}\n"
+        race_list += f"   Bonuses: {', '.join(race_data['bonuses'])}\n\n"
+    race_list += "Enter your choice (1-{}): ".format(len(RACES))
+    return race_list
+
+def build_class_menu():
+    """Render the class selection menu"""
+    class_list = "\n=== Choose Your Class ===\n"
+    for i, (class_name, class_data) in enumerate(CLASSES.items(), 1):
+        class_list += f"{i}. {class_name}\n"
+        class_list += f"   Description: {class_data['description']}\n"
+        class_list += f"   Primary Stat: {class_data['primary_stat']}\n"
+        class_list += f"   Starting Skills: {', '.join(class_data['starting_skills'])}\n\n"
+    class_list += "Enter your choice (1-{}): ".format(len(CLASSES))
+    return class_list
+
+# The menus never change while the server runs, so render them once
+RACE_MENU = build_race_menu()
+CLASS_MENU = build_class_menu()
+RACE_NAMES = list(RACES.keys())
+CLASS_NAMES = list(CLASSES.keys())
+
+# Nanny states
+MENU = 'menu'
+LOGIN_USERNAME = 'login_username'
+LOGIN_PASSWORD = 'login_password'
+NEW_USERNAME = 'new_username'
+NEW_PASSWORD = 'new_password'
+CONFIRM_PASSWORD = 'confirm_password'
+SELECT_RACE = 'select_race'
+SELECT_CLASS = 'select_class'
+HASHING = 'hashing'
+PLAYING = 'playing'
+CLOSED = 'closed'
+
+class Nanny:
+    """Walks one connection through login or character creation
+
+    The nanny never reads or writes a socket. Each input line goes to
+    feed(), which returns the messages to send back, so the same code
+    serves a thread per connection or a single event loop. A connection
+    part way through sign-up costs only this small record.
+
+    Password hashing never blocks feed(): the nanny starts it, sets
+    waiting to its future and ignores input until the owner calls
+    continue_login() once the future is done.
+    """
+    __slots__ = ('server', 'address', 'state', 'username', 'password', 'race', 'player', 'waiting', 'continuation')
+
+    def __init__(self, server, address=None):
+        self.server = server
+        self.address = address
+        self.state = MENU
+        self.username = None
+        self.password = None
+        self.race = None
+        self.player = None
+        self.waiting = None  # Future of a password hash the nanny is waiting on
+        self.continuation = None
+
+    @property
+    def finished(self):
+        """True once the connection has logged in or chosen to quit"""
+        return self.state in (PLAYING, CLOSED)
+
+    def start(self):
+        """Get the messages to send when the connection opens"""
+        return [WELCOME_MESSAGE]
+
+    def feed(self, line):
+        """Handle one line of input and return the messages to send back"""
+        handler = getattr(self, f"handle_{self.state}")
+        return handler(line.strip())
+
+    def wait_for(self, future, continuation):
+        """Pause until future is done; continue_login() then calls continuation with its result"""
+        self.waiting = future
+        self.continuation = continuation
+        self.state = HASHING
+        return []
+
+    def continue_login(self):
+        """Finish the step that was waiting on password hashing, returning the messages to send"""
+        future, continuation = self.waiting, self.continuation
+        self.waiting = self.continuation = None
+        return continuation(future.result())
+
+    def handle_hashing(self, line):
+        return []  # Input typed while a password is being checked is dropped
+
+    def handle_menu(self, line):
+        if line == '1':
+            self.state = LOGIN_USERNAME
+            return ["Username: "]
+        elif line == '2':
+            self.state = NEW_USERNAME
+            return ["Enter desired username: "]
+        elif line == '3':
+            self.state = CLOSED
+            return ["Goodbye!"]
+        elif line.lower().startswith('resume '):
+            return self.resume(line[7:])
+        return ["Invalid choice. Please enter 1, 2, or 3: "]
+
+    def resume(self, token):
+        # Reattaches the live player object, skipping the password check and database load
+        player = self.server.resume_player(token)
+        if player is None:
+            return ["That resume token is invalid or has expired.\n", WELCOME_MESSAGE]
+        self.player = player
+        self.state = PLAYING
+        return [f"Session resumed. Welcome back, {player.name}."]
+
+    def handle_login_username(self, line):
+        self.username = line
+        self.state = LOGIN_PASSWORD
+        return ["Password: "]
+
+    def handle_login_password(self, line):
+        if not self.server.login_limiter.allow(self.address):
+            self.state = MENU
+            return ["Too many login attempts. Please wait a while and try again.\n", WELCOME_MESSAGE]
+
+        player_data = self.server.db.get_player(self.username)
+        # Unknown names are checked against a dummy hash so they fail no faster than a wrong password
+        stored_hash = player_data['password_hash'] if player_data else DUMMY_HASH
+        try:
+            future = self.server.verify_password(line, stored_hash)
+        except AuthBusy:
+            self.state = MENU
+            return [BUSY_MESSAGE, WELCOME_MESSAGE]
+        return self.wait_for(future, lambda verified: self.finish_login(verified and bool(player_data), line, player_data))
+
+    def finish_login(self, verified, password, player_data):
+        if verified:
+            self.server.claim_player(self.username)
+            self.player = Player.from_dict(player_data)
+            self.server.upgrade_password_hash(self.player, password)
+            self.state = PLAYING
+            return [f"Login successful! Welcome back, {self.player.name}."]
+
+        self.state = MENU
+        return ["Invalid username or password. Returning to main menu...\n", WELCOME_MESSAGE]
+
+    def handle_new_username(self, line):
+        if len(line) < 3:
+            return ["Username must be at least 3 characters long.\n", "Enter desired username: "]
+        if self.server.db.player_exists(line):
+            return ["Username already exists. Please choose another.\n", "Enter desired username: "]
+        self.username = line
+        self.state = NEW_PASSWORD
+        return ["Enter password: "]
+
+    def handle_new_password(self, line):
+        if len(line) < 4:
+            return ["Password must be at least 4 characters long.\n", "Enter password: "]
+        self.password = line
+        self.state = CONFIRM_PASSWORD
+        return ["Confirm password: "]
+
+    def handle_confirm_password(self, line):
+        if line != self.password:
+            self.password = None
+            self.state = NEW_PASSWORD
+            return ["Passwords don't match. Please try again.\n", "Enter password: "]
+        self.state = SELECT_RACE
+        return [RACE_MENU]
+
+    def handle_select_race(self, line):
+        choice = self.parse_choice(line, len(RACE_NAMES))
+        if isinstance(choice, str):
+            return [choice, RACE_MENU]
+        self.race = RACE_NAMES[choice - 1]
+        self.state = SELECT_CLASS
+        return [CLASS_MENU]
+
+    def handle_select_class(self, line):
+        choice = self.parse_choice(line, len(CLASS_NAMES))
+        if isinstance(choice, str):
+            return [choice, CLASS_MENU]
+        char_class = CLASS_NAMES[choice - 1]
+
+        # Another connection may have taken the name while this one was choosing
+        if self.server.db.player_exists(self.username):
+            self.state = NEW_USERNAME
+            return ["Username already exists. Please choose another.\n", "Enter desired username: "]
+
+        try:
+            future = self.server.hash_password(self.password)
+        except AuthBusy:
+            self.state = SELECT_CLASS
+            return [BUSY_MESSAGE, CLASS_MENU]
+        return self.wait_for(future, lambda password_hash: self.create_character(password_hash, char_class))
+
+    def create_character(self, password_hash, char_class):
+        # The name may have been taken while the password was hashed
+        if self.server.db.player_exists(self.username):
+            self.state = NEW_USERNAME
+            return ["Username already exists. Please choose another.\n", "Enter desired username: "]
+        self.password = None
+        player = Player(self.username, password_hash, self.race, char_class)
+        self.server.db.save_player(player.to_dict())
+
+        self.player = player
+        self.state = PLAYING
+        return [
+            "\nCharacter created successfully!",
+            f"Name: {player.name}",
+            f"Race: {player.race}",
+            f"Class: {player.char_class}",
+            f"Health: {player.health}/{player.max_health}",
+            f"Mana: {player.mana}/{player.max_mana}",
+        ]
+
+    def parse_choice(self, line, count):
+        """Get a menu choice from 1 to count, or an error message"""
+        try:
+            choice = int(line)
+        except ValueError:
+            return "Please enter a valid number.\n"
+        if 1 <= choice <= count:
+            return choice
+        return "Invalid choice. Please try again.\n"
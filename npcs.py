@@ -0,0 +1,328 @@
+"""
+NPCs for PyPeake MUD
+Non-player characters, and the scheduler that runs their AI each world tick
+
+NPCs only think where a player could notice: those sharing a room with a
+player go first, then those one exit away, and the rest sleep at no cost
+until a player comes near. Thinking stops when the tick's time budget is
+spent, so a crowded world slows its NPCs down instead of delaying player
+commands. NPCs that missed their turn keep their place and go first on
+the next tick.
+
+Copyright (c) 2025 PyPeake MUD
+Licensed under the MIT License - see LICENSE file for details
+"""
+
+import bisect
+import heapq
+import itertools
+import random
+import time
+
+# Seconds of game thread time NPCs may think for in one world tick
+THINK_BUDGET = 0.010
+
+LOCATIONS = {
+    "town_square": "the Town Square",
+    "great_forest": "the Great Forest",
+    "rolling_hills": "the Rolling Hills",
+    "adventurers_guild": "the Adventurer's Guild",
+}
+
+EXITS = {
+    "town_square": ("great_forest", "rolling_hills", "adventurers_guild"),
+    "great_forest": ("town_square",),
+    "rolling_hills": ("town_square",),
+    "adventurers_guild": ("town_square",),
+}
+
+NPCS = {
+    "merchant": {
+        "name": "a merchant",
+        "location": "town_square",
+        "think_interval": 20,  # Seconds between thoughts, give or take a quarter
+        "wander_chance": 0.0,
+        "act_chance": 0.5,
+        "actions": [
+            "calls out, 'Fresh bread, warm from the oven!'",
+            "polishes a brass lantern on the stall.",
+            "haggles loudly with a customer over the price of rope."
+        ]
+    },
+
+    "town_guard": {
+        "name": "a town guard",
+        "location": "town_square",
+        "think_interval": 30,
+        "wander_chance": 0.0,
+        "act_chance": 0.3,
+        "actions": [
+            "leans on a halberd and watches the crowd.",
+            "reminds a passing youth to keep the peace."
+        ]
+    },
+
+    "stray_dog": {
+        "name": "a stray dog",
+        "location": "town_square",
+        "think_interval": 15,
+        "wander_chance": 0.2,
+        "act_chance": 0.5,
+        "actions": [
+            "sniffs around for scraps.",
+            "scratches behind one ear.",
+            "barks at a pigeon."
+        ]
+    },
+
+    "grey_wolf": {
+        "name": "a grey wolf",
+        "location": "great_forest",
+        "think_interval": 25,
+        "wander_chance": 0.0,
+        "act_chance": 0.4,
+        "actions": [
+            "howls somewhere between the trees.",
+            "pads silently through the undergrowth."
+        ]
+    },
+
+    "shepherd": {
+        "name": "a shepherd",
+        "location": "rolling_hills",
+        "think_interval": 30,
+        "wander_chance": 0.0,
+        "act_chance": 0.4,
+        "actions": [
+            "whistles to a flock of sheep.",
+            "counts the sheep, frowns, and counts again."
+        ]
+    },
+
+    "guild_clerk": {
+        "name": "the guild clerk",
+        "location": "adventurers_guild",
+        "think_interval": 40,
+        "wander_chance": 0.0,
+        "act_chance": 0.3,
+        "actions": [
+            "pins a new notice to the quest board.",
+            "stamps a stack of papers with great ceremony."
+        ]
+    }
+}
+
+# Recent tick times kept for counting the turns a late thought missed
+TICK_HISTORY = 10000
+
+# NPCs scheduled between checks of the budget while a location wakes up
+WAKE_BATCH = 256
+
+def sentence(text):
+    return text[:1].upper() + text[1:]
+
+class NPC:
+    """One non-player character in the world"""
+
+    __slots__ = ('template_id', 'location', 'next_think')
+
+    def __init__(self, template_id, location):
+        self.template_id = template_id
+        self.location = location
+        self.next_think = None  # Clock time of the next thought; only meaningful while awake
+
+    @property
+    def template(self):
+        return NPCS[self.template_id]
+
+    @property
+    def name(self):
+        return self.template['name']
+
+class NPCScheduler:
+    """Runs NPC thoughts within a time budget per tick
+
+    Every awake location has a heap of its NPCs by next thought time, so
+    a tick only touches the NPCs that are due; sleeping locations have no
+    heap at all. A location that wakes up fills its heap a batch at a
+    time out of the same budget, so a crowded room coming into view
+    spreads over several ticks too. tick is given the sessions watching
+    each location, and notify is called with the sessions watching a
+    room and a message for them whenever an NPC does something there.
+    """
+
+    def __init__(self, notify=None, clock=time.monotonic, budget=THINK_BUDGET, seed=None, timer=time.perf_counter):
+        self.notify = notify
+        self.clock = clock
+        self.budget = budget
+        self.timer = timer
+        self.rng = random.Random(seed)
+        self.npcs = []
+        self.by_location = {}  # location -> dict of the NPCs there, in arrival order
+        self.queues = {}       # awake location -> heap of (next think, sequence, NPC)
+        self.waking = {}       # awake location -> NPCs still to be put in its heap
+        self.sequence = itertools.count()
+        self.observers = {}
+        self.tick_times = []
+        self.stats = {
+            'ticks': 0,
+            'thinks': 0,
+            'late': 0,              # Thoughts that ran a tick or more after they were due
+            'skipped': 0,           # Ticks those late thoughts missed, put off by the budget
+            'max_late_seconds': 0.0,
+            'exhausted_ticks': 0,   # Ticks that ran out of budget with thoughts still due
+            'tick_ms': 0.0,
+            'max_tick_ms': 0.0,
+        }
+
+    def spawn(self, template_id, location=None):
+        npc = NPC(template_id, location or NPCS[template_id]['location'])
+        self.npcs.append(npc)
+        self.by_location.setdefault(npc.location, {})[npc] = None
+        if npc.location in self.queues:
+            self.schedule(npc, self.clock() + self.first_think(npc))
+        return npc
+
+    def populate(self):
+        """Spawn one of every NPC in its home location"""
+        for template_id in NPCS:
+            self.spawn(template_id)
+
+    def move(self, npc, location):
+        """Move an NPC, keeping its turn if it is awake in the new location"""
+        was_awake = npc.location in self.queues
+        del self.by_location[npc.location][npc]
+        npc.location = location
+        self.by_location.setdefault(location, {})[npc] = None
+        # Its entry in the old location's heap is skipped as stale
+        self.schedule(npc, npc.next_think if was_awake and npc.next_think is not None else self.clock() + self.first_think(npc))
+
+    def present(self, location):
+        """The NPCs in a location"""
+        return list(self.by_location.get(location, ()))
+
+    def first_think(self, npc):
+        # Spread out waking NPCs so they don't all think on the same tick
+        return self.rng.uniform(0, npc.template['think_interval'])
+
+    def schedule(self, npc, when):
+        queue = self.queues.get(npc.location)
+        if queue is None:
+            npc.next_think = None
+            return
+        npc.next_think = when
+        heapq.heappush(queue, (when, next(self.sequence), npc))
+
+    def tick(self, observers):
+        """Run the NPCs that are due, nearest to players first, until the budget is spent
+
+        observers maps each location with players in it to their sessions.
+        NPCs sharing a room with a player go first, then those one exit
+        away; within each, the longest overdue go first.
+        """
+        start = self.timer()
+        now = self.clock()
+        self.observers = observers
+        near = set(observers)
+        nearby = {exit for location in near for exit in EXITS.get(location, ())} - near
+        self.wake(near | nearby)
+
+        stats = self.stats
+        deadline = start + self.budget
+        if self.waking and not self.fill_queues(near, now, deadline):
+            stats['exhausted_ticks'] += 1
+        ran = 0
+        for locations in (near, nearby):
+            heads = [(self.queues[location][0][0], location) for location in locations if self.queues[location]]
+            heapq.heapify(heads)
+            while heads and heads[0][0] <= now:
+                # The first thought always runs, so a slow one can't stall the world forever
+                if ran and self.timer() >= deadline:
+                    stats['exhausted_ticks'] += 1
+                    return self.finish_tick(start, now)
+                _, location = heapq.heappop(heads)
+                queue = self.queues[location]
+                when, _, npc = heapq.heappop(queue)
+                if npc.location == location and npc.next_think == when:
+                    self.run(npc, when, now)
+                    ran += 1
+                if queue and queue[0][0] <= now:
+                    heapq.heappush(heads, (queue[0][0], location))
+        return self.finish_tick(start, now)
+
+    def run(self, npc, when, now):
+        """Let a due NPC think and schedule its next thought"""
+        stats = self.stats
+        if self.tick_times and when <= self.tick_times[-1]:
+            stats['late'] += 1
+            stats['skipped'] += len(self.tick_times) - bisect.bisect_left(self.tick_times, when)
+            stats['max_late_seconds'] = max(stats['max_late_seconds'], now - when)
+        self.think(npc)
+        interval = npc.template['think_interval']
+        self.schedule(npc, now + self.rng.uniform(0.75 * interval, 1.25 * interval))
+        stats['thinks'] += 1
+
+    def finish_tick(self, start, now):
+        self.tick_times.append(now)
+        if len(self.tick_times) >= TICK_HISTORY:
+            del self.tick_times[:TICK_HISTORY // 2]
+        elapsed = (self.timer() - start) * 1000
+        stats = self.stats
+        stats['ticks'] += 1
+        stats['tick_ms'] = elapsed
+        stats['max_tick_ms'] = max(stats['max_tick_ms'], elapsed)
+
+    def wake(self, awake):
+        """Give newly watched locations a heap and drop the heaps of locations nobody is near
+
+        Only locations changing state are touched, so sleeping NPCs cost
+        nothing. A woken location's NPCs are queued for fill_queues to
+        schedule within the budget.
+        """
+        for location in self.queues.keys() - awake:
+            del self.queues[location]
+            self.waking.pop(location, None)
+        for location in awake - self.queues.keys():
+            self.queues[location] = []
+            npcs = self.by_location.get(location)
+            if npcs:
+                self.waking[location] = list(npcs)
+
+    def fill_queues(self, near, now, deadline):
+        """Schedule waking NPCs, nearest to players first, returning False if the budget ran out first"""
+        for location in sorted(self.waking, key=lambda location: location not in near):
+            pending = self.waking[location]
+            while pending:
+                if self.timer() >= deadline:
+                    return False
+                for npc in pending[-WAKE_BATCH:]:
+                    # NPCs that wandered off since are scheduled where they went, or sleep there
+                    if npc.location == location:
+                        self.schedule(npc, now + self.first_think(npc))
+                del pending[-WAKE_BATCH:]
+            del self.waking[location]
+        return True
+
+    def think(self, npc):
+        """One AI step: maybe wander to a neighbouring room, maybe do something"""
+        template = npc.template
+        exits = EXITS.get(npc.location, ())
+        if exits and self.rng.random() < template['wander_chance']:
+            destination = self.rng.choice(exits)
+            self.tell_room(npc.location, f"{sentence(npc.name)} wanders off towards {LOCATIONS[destination]}.")
+            self.move(npc, destination)
+            self.tell_room(destination, f"{sentence(npc.name)} wanders in.")
+        elif template['actions'] and self.rng.random() < template['act_chance']:
+            self.tell_room(npc.location, f"{sentence(npc.name)} {self.rng.choice(template['actions'])}")
+
+    def tell_room(self, location, message):
+        sessions = self.observers.get(location)
+        if sessions and self.notify is not None:
+            self.notify(sessions, message)
+
+    def report(self):
+        """Scheduler counters, with how many NPCs are awake"""
+        awake = sum(len(self.by_location.get(location, ())) for location in self.queues)
+        waking = sum(len(pending) for pending in self.waking.values())
+        return dict(self.stats, npcs=len(self.npcs), awake=awake, waking=waking,
+                    asleep=len(self.npcs) - awake, budget_ms=self.budget * 1000)
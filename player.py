@@ -9,8 +9,22 @@ Licensed under the MIT License - see LICENSE file for details
 from datetime import datetime
 from races import RACES
 from classes import CLASSES
+from vitals import VitalField
+from items import Inventory, starting_inventory
 
 class Player:
+    # Stored in a VitalsStore column while the player is online, if one is in use
+    health = VitalField()
+    max_health = VitalField()
+    mana = VitalField()
+    max_mana = VitalField()
+    strength = VitalField()
+    dexterity = VitalField()
+    constitution = VitalField()
+    intelligence = VitalField()
+    wisdom = VitalField()
+    charisma = VitalField()
+    
     def __init__(self, name, password_hash, race, char_class):
         self.name = name
         self.password_hash = password_hash
@@ -43,6 +57,13 @@ class Player:
         self.location = "town_square"
         self.created_at = datetime.now().isoformat()
         self.last_login = datetime.now().isoformat()
+        
+        # Saved item records, only turned into an Inventory when something looks at it
+        self.inventory_records = starting_inventory(char_class)
+        self.loaded_inventory = None
+        
+        # Called with the player after experience changes (e.g. to update leaderboards)
+        self.progress_listener = None
     
     def apply_race_bonuses(self):
         """Apply racial attribute bonuses"""
@@ -61,22 +82,30 @@ class Player:
                     setattr(self, bonus, getattr(self, bonus) + class_data['stat_bonuses'][bonus])
     
     def gain_experience(self, amount):
-        """Add experience points and check for level up"""
+        """Add experience points and check for level up
+
+        Returns the level up message, or None if the player did not level up.
+        """
         self.experience += amount
         
         # Simple level calculation (every 1000 exp = 1 level)
         new_level = (self.experience // 1000) + 1
+        message = None
         if new_level > self.level:
-            self.level_up(new_level)
+            message = self.level_up(new_level)
+        
+        if self.progress_listener:
+            self.progress_listener(self)
+        return message
     
     def level_up(self, new_level):
-        """Handle level up"""
-        old_level = self.level
+        """Handle level up, applying the stat gains of every level passed"""
+        levels_gained = new_level - self.level
         self.level = new_level
         
         # Increase stats on level up
-        health_increase = self.constitution * 2
-        mana_increase = (self.intelligence + self.wisdom)
+        health_increase = self.constitution * 2 * levels_gained
+        mana_increase = (self.intelligence + self.wisdom) * levels_gained
         
         self.max_health += health_increase
         self.max_mana += mana_increase
@@ -105,6 +134,14 @@ class Player:
         """Restore mana points"""
         self.mana = min(self.max_mana, self.mana + amount)
     
+    @property
+    def inventory(self):
+        """The player's items, decoded from their saved records the first time they are needed"""
+        if self.loaded_inventory is None:
+            self.loaded_inventory = Inventory.from_records(self.inventory_records)
+            self.inventory_records = None
+        return self.loaded_inventory
+    
     def get_race_info(self):
         """Get information about the player's race"""
         return RACES.get(self.race, {})
@@ -134,7 +171,8 @@ class Player:
             'mana': self.mana,
             'location': self.location,
             'created_at': self.created_at,
-            'last_login': self.last_login
+            'last_login': self.last_login,
+            'inventory': self.inventory_records if self.loaded_inventory is None else self.loaded_inventory.to_records()
         }
     
     @classmethod
@@ -159,6 +197,7 @@ class Player:
         player.location = data.get('location', 'town_square')
         player.created_at = data.get('created_at', datetime.now().isoformat())
         player.last_login = datetime.now().isoformat()
+        player.inventory_records = data.get('inventory', [])
         
         return player
     
@@ -0,0 +1,73 @@
+"""
+Rate limiting module for PyPeake MUD
+Token buckets keyed by session or address
+
+Copyright (c) 2025 PyPeake MUD
+Licensed under the MIT License - see LICENSE file for details
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+class TokenBucket:
+    """Token count for one key, refilled lazily by RateLimiter"""
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, capacity, now):
+        self.tokens = capacity
+        self.updated = now
+
+class RateLimiter:
+    """A token bucket per key with a bounded number of keys
+
+    Buckets are kept in least-recently-used order. A bucket left alone for
+    capacity / rate seconds has refilled completely, so it is dropped
+    without changing any outcome. If max_keys is reached the least
+    recently used bucket is dropped early.
+    """
+
+    def __init__(self, rate, capacity, max_keys=10000, clock=time.monotonic):
+        self.clock = clock
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self.idle_expiry = capacity / rate
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def allow(self, key, amount=1):
+        """Take amount tokens from key's bucket, returning False if it is too empty"""
+        now = self.clock()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.capacity, now)
+                self.buckets[key] = bucket
+            else:
+                self.buckets.move_to_end(key)
+                bucket.tokens = min(self.capacity, bucket.tokens + (now - bucket.updated) * self.rate)
+                bucket.updated = now
+
+            self._expire(now)
+
+            if bucket.tokens >= amount:
+                bucket.tokens -= amount
+                return True
+            return False
+
+    def _expire(self, now):
+        # The oldest bucket is first, so stop at the first one still in use
+        while self.buckets:
+            oldest_key, oldest = next(iter(self.buckets.items()))
+            if len(self.buckets) <= self.max_keys and now - oldest.updated < self.idle_expiry:
+                break
+            del self.buckets[oldest_key]
+
+    def discard(self, key):
+        """Forget key's bucket, e.g. when its session ends"""
+        with self.lock:
+            self.buckets.pop(key, None)
+
+    def __len__(self):
+        return len(self.buckets)
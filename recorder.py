@@ -0,0 +1,179 @@
+"""
+Input recording and replay for PyPeake MUD
+Records what players type so real traffic can be played back as a workload
+
+A recording is an append-only binary file: a short header, then one
+fixed-size record header per event followed by its UTF-8 payload. Only
+input from players already in the game is recorded, never the login
+menus, so passwords never reach the file.
+
+Copyright (c) 2025 PyPeake MUD
+Licensed under the MIT License - see LICENSE file for details
+"""
+
+import os
+import shutil
+import struct
+import tempfile
+import time
+
+MAGIC = b"PPMREC1\n"
+
+# Seconds since the recording started, session id, event kind, payload length
+EVENT = struct.Struct('<dIBH')
+
+JOIN = 1   # Payload: name, race and class separated by tabs
+LINE = 2   # Payload: the line typed
+LEAVE = 3  # No payload; QUIT when the player typed quit
+QUIT = 4
+
+MAX_RECORDING_BYTES = 256 * 1024 * 1024  # Recording stops at this size
+
+DISCARD_EVERY = 1000  # Replayed lines between clearing the output nobody reads
+
+class InputRecorder:
+    """Appends input events to a recording file
+
+    Only the game thread calls record methods. Writes go through a
+    buffered file and are flushed once a world tick, so recording costs a
+    struct pack and a buffer append per line.
+    """
+
+    def __init__(self, path, clock=time.monotonic, max_bytes=MAX_RECORDING_BYTES):
+        self.path = path
+        self.clock = clock
+        self.max_bytes = max_bytes
+        self.session_ids = {}
+        self.next_id = 1
+        # Never overwrite an earlier recording, such as when a server is restarted with the same --record
+        self.file = open(path, 'xb', buffering=64 * 1024)
+        self.file.write(MAGIC)
+        self.size = len(MAGIC)
+        self.start = clock()
+        self.stopped = False
+
+    def write(self, session_id, kind, payload=b''):
+        if self.stopped:
+            return
+        payload = payload[:0xFFFF]
+        if self.size + EVENT.size + len(payload) > self.max_bytes:
+            print(f"Recording {self.path} reached {self.max_bytes} bytes; recording stopped")
+            self.stopped = True
+            return
+        self.file.write(EVENT.pack(self.clock() - self.start, session_id, kind, len(payload)))
+        self.file.write(payload)
+        self.size += EVENT.size + len(payload)
+
+    def join(self, session, player):
+        """Record a player entering the game"""
+        session_id = self.session_ids[session] = self.next_id
+        self.next_id += 1
+        self.write(session_id, JOIN, f"{player.name}\t{player.race}\t{player.char_class}".encode('utf-8'))
+
+    def line(self, session, line):
+        """Record a line typed by a player in the game"""
+        session_id = self.session_ids.get(session)
+        if session_id is not None:
+            self.write(session_id, LINE, line.encode('utf-8'))
+
+    def leave(self, session, quit_game=False):
+        """Record a player leaving the game"""
+        session_id = self.session_ids.pop(session, None)
+        if session_id is not None:
+            self.write(session_id, QUIT if quit_game else LEAVE)
+
+    def flush(self):
+        if not self.file.closed:
+            self.file.flush()
+
+    def close(self):
+        self.stopped = True
+        self.file.close()
+
+def read_recording(path):
+    """Yield (time, session_id, kind, payload) for every event in a recording"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a PyPeake recording")
+        while True:
+            header = f.read(EVENT.size)
+            if len(header) < EVENT.size:
+                return  # A partly written last event is ignored
+            timestamp, session_id, kind, length = EVENT.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            yield timestamp, session_id, kind, payload.decode('utf-8')
+
+def percentile(sorted_values, fraction):
+    """The value at a fraction of the way through a sorted list"""
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+def replay_recording(path, speed=None, seed=0):
+    """Play a recording against a fresh in-process server
+
+    speed is how many times faster than real time to play it, or None to
+    run every event back to back. The server's clock follows the
+    recording's timestamps whatever the speed, so ticks and timeouts
+    happen where they did originally. Returns per-command latency stats
+    in milliseconds, keyed by the command's first word.
+    """
+    from simulation import Simulation
+
+    workdir = tempfile.mkdtemp(prefix="pypeake-replay-")
+    db_file = os.path.join(workdir, "players.json")
+    sim = Simulation(db_file, seed=seed)
+    sessions = {}
+    latencies = {}
+    handled = 0
+    started = time.perf_counter()
+    try:
+        for timestamp, session_id, kind, payload in read_recording(path):
+            if speed:
+                delay = timestamp / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            if timestamp > sim.clock.now:
+                sim.advance(timestamp - sim.clock.now)
+
+            if kind == JOIN:
+                name, race, char_class = payload.split('\t')
+                sessions[session_id] = sim.join(name, race=race, char_class=char_class)
+                continue
+            session = sessions.get(session_id)
+            if session is None or session not in sim.sessions:
+                continue
+            if kind == LINE:
+                start = time.perf_counter()
+                keep_open = sim.server.handle_line(session, payload)
+                sim.server.flush_output()
+                elapsed = (time.perf_counter() - start) * 1000
+                command = payload.split(' ', 1)[0].lower() or '(blank)'
+                latencies.setdefault(command, []).append(elapsed)
+                handled += 1
+                if handled % DISCARD_EVERY == 0:
+                    for other in sim.sessions:
+                        other.take_output()
+                if not keep_open:
+                    del sessions[session_id]
+                    sim.finish(session, True)
+            else:
+                del sessions[session_id]
+                sim.finish(session, kind == QUIT)
+    finally:
+        for session in list(sim.sessions):
+            sim.finish(session, False)
+        sim.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {}
+    for command, times in sorted(latencies.items()):
+        times.sort()
+        report[command] = {
+            'count': len(times),
+            'mean_ms': sum(times) / len(times),
+            'p50_ms': percentile(times, 0.5),
+            'p99_ms': percentile(times, 0.99),
+            'max_ms': times[-1],
+        }
+    return report
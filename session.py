@@ -0,0 +1,163 @@
+"""
+Sessions for PyPeake MUD
+The connection a player types into, independent of how it is carried
+
+The server only talks to Session objects, so the same game logic runs
+over TCP sockets or over in-memory sessions driven by a script.
+
+Copyright (c) 2025 PyPeake MUD
+Licensed under the MIT License - see LICENSE file for details
+"""
+
+import queue
+import socket
+from collections import deque
+
+# Flag for sends that must never block (not available on every platform)
+MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0)
+
+class Session:
+    """One connection to the game
+
+    Subclasses implement send, receive, interrupt and close. send and
+    close never block, so the game thread can call them; receive waits
+    for input and raises ConnectionError once the other end has gone away.
+    """
+
+    def __init__(self, address=None):
+        self.address = address
+
+    def send(self, message):
+        """Queue one message for the client, as text or already encoded UTF-8"""
+        raise NotImplementedError
+
+    def backlog(self):
+        """Number of messages queued but not yet written"""
+        return 0
+
+    def receive(self):
+        """Wait for the next line of input"""
+        raise NotImplementedError
+
+    def interrupt(self, notice=None):
+        """Cut the connection from another thread, optionally telling the client why
+
+        Never blocks. Whatever is waiting in receive or send is woken up
+        with an error, and the session's normal cleanup then runs.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release the connection once queued output has been delivered"""
+
+class SocketSession(Session):
+    """A session carried over a TCP socket
+
+    Output is queued by send and written by a separate writer thread
+    calling next_output and write, so a slow client never holds up the
+    thread that produced the output.
+    """
+
+    def __init__(self, client_socket, address=None):
+        super().__init__(address[0] if address else None)
+        self.socket = client_socket
+        self.outgoing = queue.SimpleQueue()
+
+    def send(self, message):
+        self.outgoing.put(message)
+
+    def backlog(self):
+        return self.outgoing.qsize()
+
+    def next_output(self):
+        """Wait for queued output and return all of it as bytes, or None once closed"""
+        messages = [self.outgoing.get()]
+        while not self.outgoing.empty():
+            messages.append(self.outgoing.get())
+        closing = None in messages
+        if closing:
+            messages = messages[:messages.index(None)]
+        if not messages:
+            return None
+        if closing:
+            self.outgoing.put(None)  # Close after this last write
+        return self.encode(messages)
+
+    def encode(self, messages):
+        """Turn a batch of queued messages into the bytes to write"""
+        return b''.join((message if isinstance(message, bytes) else message.encode('utf-8')) + b'\n'
+                        for message in messages)
+
+    def write(self, data):
+        """Write output to the socket, blocking until the client accepts it"""
+        self.socket.sendall(data)
+
+    def receive(self):
+        data = self.socket.recv(1024)
+        if not data:
+            raise ConnectionError("Client disconnected")
+        return data.decode('utf-8').strip()
+
+    def interrupt(self, notice=None):
+        if notice:
+            try:
+                self.socket.send(notice.encode('utf-8'), MSG_DONTWAIT)
+            except OSError:
+                pass
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        self.outgoing.put(None)
+
+    def shutdown(self):
+        """Close the socket, waking a reader blocked in receive"""
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.socket.close()
+
+class MemorySession(Session):
+    """A session whose input is queued in advance and whose output is kept in a list
+
+    Nothing blocks: receive raises ConnectionError when the input runs
+    out, which a scripted client treats like hanging up.
+    """
+
+    def __init__(self, address="memory", lines=()):
+        super().__init__(address)
+        self.inbox = deque(lines)
+        self.outbox = []
+        self.closed = False
+
+    def type(self, *lines):
+        """Queue lines of input as if the player typed them"""
+        self.inbox.extend(lines)
+
+    def send(self, message):
+        if self.closed:
+            raise ConnectionError("Session closed")
+        if isinstance(message, bytes):
+            message = message.decode('utf-8')
+        self.outbox.append(message)
+
+    def receive(self):
+        if self.closed or not self.inbox:
+            raise ConnectionError("No more input")
+        return self.inbox.popleft().strip()
+
+    def interrupt(self, notice=None):
+        if notice and not self.closed:
+            self.outbox.append(notice.strip())
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+    def take_output(self):
+        """Get and clear everything sent to this session so far"""
+        output, self.outbox = self.outbox, []
+        return output
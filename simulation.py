@@ -0,0 +1,140 @@
+"""
+Simulation harness for PyPeake MUD
+Drives many scripted in-memory sessions against one server in a single thread
+
+Nothing here opens a socket or starts a thread. Time comes from a
+VirtualClock that only moves when the script advances it, and combat uses
+a fixed seed, so a run with the same script always plays out the same way.
+
+Copyright (c) 2025 PyPeake MUD
+Licensed under the MIT License - see LICENSE file for details
+"""
+
+from mud_server import MUDServer, TICK_INTERVAL
+from player import Player
+from session import MemorySession
+
+class VirtualClock:
+    """A monotonic clock that only moves when advanced"""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+class Simulation:
+    """A MUDServer played by scripted MemorySessions
+
+    The simulation itself plays the part of the game thread: the server's
+    methods are called directly and output is flushed after each step.
+    """
+
+    def __init__(self, db_file, seed=0):
+        self.clock = VirtualClock()
+        self.server = MUDServer(db_file=db_file, clock=self.clock, seed=seed, admin_socket=None)
+        self.sessions = {}  # Open sessions, in connection order
+        self.next_tick = TICK_INTERVAL
+
+    def connect(self, *lines, address="memory"):
+        """Open a session at the login menu with lines of input queued"""
+        session = MemorySession(address, lines)
+        self.sessions[session] = True
+        self.server.open_session(session)
+        self.server.flush_session(session)
+        return session
+
+    def join(self, name, *lines, race="Human", char_class="Warrior"):
+        """Open a session already in the game as a new character
+
+        Skips the login menus, and with them the password hashing that
+        would otherwise dominate a run with thousands of players.
+        """
+        session = MemorySession(name, lines)
+        self.sessions[session] = True
+        self.server.enter_game(session, Player(name, "simulated", race, char_class))
+        self.server.flush_session(session)
+        return session
+
+    def step(self):
+        """Give every session with queued input one line, returning how many ran
+
+        Sessions waiting on password hashing keep their input until the
+        hash is ready and the server has posted the login's next step.
+        """
+        handled = self.run_posted()
+        for session in list(self.sessions):
+            if session.closed:
+                self.finish(session, False)
+                continue
+            if not session.inbox or self.hashing(session):
+                continue
+            handled += 1
+            if not self.server.handle_line(session, session.receive()):
+                self.finish(session, True)
+        self.server.flush_output()
+        return handled
+
+    def run(self):
+        """Step until every queued line has been handled, returning how many ran"""
+        total = 0
+        while True:
+            handled = self.step()
+            if not handled:
+                if not any(self.hashing(session) for session in self.sessions):
+                    return total
+                # Nothing else can happen until a hash finishes and posts back
+                self.run_posted(block=True)
+            total += handled
+
+    def hashing(self, session):
+        nanny = self.server.nannies.get(session)
+        return nanny is not None and nanny.waiting is not None
+
+    def run_posted(self, block=False):
+        """Run the calls posted for the game thread, returning how many ran"""
+        commands = self.server.commands
+        ran = 0
+        if block:
+            function, args = commands.get()
+            function(*args)
+            ran += 1
+        while not commands.empty():
+            function, args = commands.get_nowait()
+            function(*args)
+            ran += 1
+        if ran:
+            self.server.flush_output()
+        return ran
+
+    def advance(self, seconds):
+        """Move the clock forward, running world ticks and expiring timers on the way"""
+        target = self.clock.now + seconds
+        while self.next_tick <= target:
+            self.clock.now = self.next_tick
+            self.server.world_tick()
+            self.next_tick += TICK_INTERVAL
+        self.clock.now = target
+        self.server.handle_expired(self.server.timers.pop_expired())
+        self.server.flush_output()
+
+        # Timed out sessions were interrupted; clean them up like dropped connections
+        for session in list(self.sessions):
+            if session.closed:
+                self.finish(session, False)
+
+    def drop(self, session):
+        """Cut a session off as if its connection was lost"""
+        self.finish(session, False)
+
+    def finish(self, session, quit_game):
+        """Close a session on the server"""
+        del self.sessions[session]
+        self.server.close_session(session, quit_game)
+
+    def close(self):
+        """Stop the server's background workers"""
+        self.server.hasher.shutdown()
@@ -10,7 +10,42 @@ from player import Player
 from races import RACES, get_race_description
 from classes import CLASSES, get_class_description
 from database import Database
+from leaderboard import IndexableSkipList, Leaderboard
+from backup import create_backup, restore_players
+from timers import TimerHeap
+from ratelimit import RateLimiter
+from nanny import Nanny
+from vitals import HAS_NUMPY, VitalsStore, health_regen, regenerate_players
+from combat import CombatEngine
+from admin import AdminError, AdminServer, admin_request
+from simulation import Simulation, VirtualClock
+from session import MemorySession
+from names import NameIndex
+from items import ITEMS, Inventory
+from help import HelpIndex
+from memory import database_report, deep_size
+from npcs import WAKE_BATCH, NPCScheduler
+from client import MUDClient
+from websocket import (CLOSE, CONTINUATION, MAX_EMPTY_FRAGMENTS, MAX_FRAGMENTS, PING, TEXT, MessageDecoder, WebSocketClient,
+                       WebSocketError, WebSocketSession, encode_frame, negotiate_deflate, read_frame)
+from recorder import LINE, QUIT, InputRecorder, read_recording, replay_recording
+from mud_server import MUDServer, TICK_INTERVAL
+from launcher import restore_database
+from auth import DUMMY_HASH, PasswordHasher, ResumeTokens, hash_password, verify_password, needs_rehash
 import os
+import io
+import contextlib
+import json
+import socket
+import struct
+import shutil
+import time
+import hashlib
+import tempfile
+import types
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import Future
 
 def test_races():
     """Test race system"""
@@ -65,6 +100,1043 @@ def test_database():
         os.remove("test_players.json")
     print("Database test completed")
 
+def test_database_paging():
+    """Test streaming iteration, paging and export"""
+    print("=== Testing Database Paging ===")
+    
+    test_db = Database("test_paging.json")
+    for i, (race, char_class) in enumerate([("Elf", "Mage"), ("Dwarf", "Warrior"), ("Elf", "Rogue")]):
+        player = Player(f"Pager{i}", "password_hash", race, char_class)
+        player.level = i + 1
+        test_db.save_player(player.to_dict())
+    
+    elves = [name for name, _ in test_db.iter_players(race="elf")]
+    assert elves == ["pager0", "pager2"]
+    
+    # Name order streams from the name index, skipping players deleted along the way
+    by_name = test_db.iter_sorted_players(descending=True)
+    assert next(by_name)[0] == "pager2"
+    test_db.delete_player("Pager1")
+    assert [name for name, _ in by_name] == ["pager0"]
+    test_db.save_player(dict(Player("Pager1", "password_hash", "Dwarf", "Warrior").to_dict(), level=2))
+    assert [name for name, _ in test_db.iter_sorted_players('name', offset=1, limit=1, race="elf")] == ["pager2"]
+    
+    page = [name for name, _ in test_db.iter_sorted_players('level', descending=True, offset=1, limit=1)]
+    assert page == ["pager1"]
+    try:
+        list(test_db.iter_sorted_players('level', offset=-1, limit=1))
+        assert False, "negative offsets should be rejected"
+    except ValueError:
+        pass
+    
+    out = io.StringIO()
+    count = test_db.export_players(out, 'jsonl', min_level=2)
+    assert count == 2
+    assert 'password_hash' not in out.getvalue()
+    
+    if os.path.exists("test_paging.json"):
+        os.remove("test_paging.json")
+    print("Database paging test completed")
+
+def test_incremental_backup():
+    """Test full and incremental backups and restoring a chain"""
+    print("=== Testing Backups ===")
+    
+    backup_dir = "test_backups"
+    players = {"alice": {"name": "Alice", "level": 1}, "bob": {"name": "Bob", "level": 1}}
+    create_backup(dict(players), backup_dir)
+    
+    players["alice"] = {"name": "Alice", "level": 2}
+    del players["bob"]
+    _, backup_type, count = create_backup(dict(players), backup_dir, incremental=True)
+    assert backup_type == 'incremental' and count == 1
+    
+    assert restore_players(backup_dir) == players
+    
+    shutil.rmtree(backup_dir)
+    print("Backup test completed")
+
+def test_timer_heap():
+    """Test deadline scheduling, postponing and cancelling"""
+    print("=== Testing Timer Heap ===")
+    
+    timers = TimerHeap()
+    timers.schedule('idle', 0)
+    timers.schedule('busy', 0)
+    timers.schedule('busy', 60)  # Activity pushes the deadline back
+    timers.schedule('gone', 0)
+    timers.cancel('gone')
+    
+    assert timers.pop_expired(time.monotonic() + 1) == ['idle']
+    assert len(timers) == 1
+    print("Timer heap test completed")
+
+def test_rate_limiter():
+    """Test token bucket limits per key"""
+    print("=== Testing Rate Limiter ===")
+    
+    limiter = RateLimiter(rate=1, capacity=3)
+    results = [limiter.allow('flooder') for _ in range(5)]
+    assert results == [True, True, True, False, False]
+    assert limiter.allow('quiet')
+    assert not limiter.allow('quiet', amount=10)
+    
+    limiter.discard('flooder')
+    assert len(limiter) == 1
+    print("Rate limiter test completed")
+
+def test_nanny():
+    """Test the login state machine without any sockets"""
+    print("=== Testing Nanny ===")
+    
+    def done(value):
+        future = Future()
+        future.set_result(value)
+        return future
+    
+    checked = []
+    
+    class FakeServer:
+        db = Database("test_nanny.json")
+        login_limiter = RateLimiter(rate=1, capacity=10)
+        hash_password = staticmethod(lambda password: done("hash:" + password))
+        verify_password = staticmethod(lambda password, hash_value: checked.append(hash_value) or
+                                       done(hash_value == "hash:" + password))
+        upgrade_password_hash = staticmethod(lambda player, password: None)
+        claim_player = staticmethod(lambda username: None)
+    
+    def feed(nanny, line):
+        messages = nanny.feed(line)
+        if nanny.waiting is not None:
+            # Hashing pauses the nanny, and input meanwhile is ignored, until it is resumed
+            assert nanny.state == 'hashing' and not messages and not nanny.feed("ignored")
+            messages = nanny.continue_login()
+        return messages
+    
+    server = FakeServer()
+    nanny = Nanny(server)
+    nanny.start()
+    for line in ["2", "NannyTest", "secret", "secret", "2", "abc", "2"]:
+        feed(nanny, line)
+    assert nanny.finished and nanny.player.race == "Elf" and nanny.player.char_class == "Mage"
+    
+    nanny = Nanny(server)
+    for line in ["1", "nannytest", "wrong"]:
+        feed(nanny, line)
+    assert not nanny.finished
+    for line in ["1", "nannytest", "secret"]:
+        feed(nanny, line)
+    assert nanny.player.name == "NannyTest"
+    
+    # An unknown name is checked against a dummy hash, taking as long as a wrong password
+    nanny = Nanny(server)
+    for line in ["1", "Nobody", "secret"]:
+        feed(nanny, line)
+    assert checked[-1] == DUMMY_HASH and not nanny.finished and nanny.state == 'menu'
+    
+    # A name taken by another connection while the password hashed is refused
+    nanny = Nanny(server)
+    for line in ["2", "Racer", "secret", "secret", "1"]:
+        feed(nanny, line)
+    nanny.feed("1")
+    assert nanny.state == 'hashing'
+    server.db.save_player(Player("Racer", "hash:other", "Human", "Warrior").to_dict())
+    assert "Username already exists" in nanny.continue_login()[0] and not nanny.finished
+    
+    if os.path.exists("test_nanny.json"):
+        os.remove("test_nanny.json")
+    print("Nanny test completed")
+
+def test_password_hashing():
+    """Test salted hashes and upgrading legacy sha256 hashes"""
+    print("=== Testing Password Hashing ===")
+    
+    stored = hash_password("secret", n=2 ** 10)
+    assert stored != hash_password("secret", n=2 ** 10)  # Salted
+    assert verify_password("secret", stored)
+    assert not verify_password("wrong", stored)
+    assert needs_rehash(stored)  # Cheaper than the server default
+    
+    legacy = hashlib.sha256(b"secret").hexdigest()
+    assert verify_password("secret", legacy)
+    assert needs_rehash(legacy)
+    
+    # A damaged record fails to match rather than crashing the login
+    for damaged in ("scrypt$16384$8$1$not-hex$00", "scrypt$lots$8$1$00$00", "pbkdf2_sha256$x$00$00", "scrypt$3$8$1$00$00"):
+        assert not verify_password("secret", damaged)
+    assert needs_rehash("scrypt$lots$8$1$00$00") and needs_rehash("scrypt")
+    assert not verify_password("", DUMMY_HASH)
+    
+    hasher = PasswordHasher(workers=1, max_pending=1)
+    assert hasher.verify("secret", legacy).result()
+    hasher.shutdown()
+    print("Password hashing test completed")
+
+def test_resume_tokens():
+    """Test signed resume tokens"""
+    print("=== Testing Resume Tokens ===")
+    
+    tokens = ResumeTokens(lifetime=60)
+    token = tokens.issue("Wanderer")
+    assert tokens.verify(token) == "wanderer"
+    assert tokens.verify(token[:-1] + ("0" if token[-1] != "0" else "1")) is None
+    assert ResumeTokens(lifetime=-1).verify(token) is None  # Different key
+    assert tokens.verify("garbage") is None
+    print("Resume token test completed")
+
+def test_vitals_store():
+    """Test vitals columns, regeneration and clamping"""
+    print("=== Testing Vitals Store ===")
+    
+    player = Player("Regen", "password_hash", "Dwarf", "Cleric")
+    player.health = 1
+    regenerate_players([player])
+    expected_health = 1 + health_regen(player.constitution)
+    assert player.health == expected_health
+    
+    if not HAS_NUMPY:
+        print("NumPy not installed, skipping vitals store checks")
+        return
+    
+    store = VitalsStore(capacity=1)
+    other = Player("Other", "password_hash", "Elf", "Mage")
+    store.attach(player)
+    store.attach(other)  # Grows the store
+    assert '_vitals' in player.__dict__ and player.health == expected_health
+    
+    other.mana = 0
+    for _ in range(1000):
+        store.regenerate()
+    assert player.health == player.max_health and other.mana == other.max_mana
+    
+    store.detach(player)
+    assert player.__dict__['health'] == player.max_health
+    assert isinstance(player.to_dict()['health'], int)
+    print("Vitals store test completed")
+
+def test_server_vitals():
+    """Test that an online player's vitals live in the server's store"""
+    print("=== Testing Server Vitals ===")
+    
+    if not HAS_NUMPY:
+        print("NumPy not installed, skipping server vitals checks")
+        return
+    
+    sim = Simulation("test_server_vitals.json")
+    session = sim.join("Mender", race="Dwarf", char_class="Cleric")
+    player = sim.server.players[session]
+    store = sim.server.vitals
+    assert player.__dict__['_vitals'] is store and 'health' not in player.__dict__
+    assert len(store) == 1 and store.players[player.__dict__['_vitals_slot']] is player
+    
+    player.health = 1
+    sim.advance(TICK_INTERVAL)  # One world tick regenerates through the store's columns
+    assert player.health == 1 + health_regen(player.constitution)
+    assert store.columns['health'][player.__dict__['_vitals_slot']] == player.health
+    
+    health = player.health
+    sim.drop(session)
+    assert len(store) == 0 and player.__dict__['health'] == health
+    assert sim.server.db.get_player("Mender")['health'] == health
+    sim.close()
+    
+    if os.path.exists("test_server_vitals.json"):
+        os.remove("test_server_vitals.json")
+    print("Server vitals test completed")
+
+def test_combat_engine():
+    """Test batched attack resolution"""
+    print("=== Testing Combat Engine ===")
+    
+    store = VitalsStore() if HAS_NUMPY else None
+    messages = []
+    engine = CombatEngine(store, notify=lambda player, message: messages.append((player.name, message)), seed=7)
+    
+    attacker = Player("Striker", "password_hash", "Orc", "Warrior")
+    target = Player("Dummy", "password_hash", "Halfling", "Bard")
+    if store is not None:
+        store.attach(attacker)
+        store.attach(target)
+    
+    target.health = 1
+    for _ in range(20):
+        engine.queue_attack(attacker, target)
+        engine.queue_attack(attacker, target, "Rage")  # Replaces the first attack
+        results = engine.resolve()
+        assert len(results) <= 1
+        if target.health == 0:
+            break
+    
+    assert target.health == 0
+    assert ("Dummy", "You have been slain by Striker!") in messages
+    assert engine.resolve() == []
+    
+    if store is not None:
+        # A target that detaches after the attack is queued keeps the blow, not whoever gets its slot
+        target.health = target.max_health
+        bystander = Player("Bystander", "password_hash", "Human", "Bard")
+        for _ in range(10):
+            engine.queue_attack(attacker, target)
+            slot = target.__dict__['_vitals_slot']
+            store.detach(target)
+            assert store.attach(bystander) == slot
+            engine.resolve()
+            store.detach(bystander)
+            store.attach(target)
+        assert bystander.health == bystander.max_health
+    print("Combat engine test completed")
+
+def test_leaderboard():
+    """Test leaderboard ranks as players are saved, level up and are deleted"""
+    print("=== Testing Leaderboard ===")
+    
+    test_db = Database("test_leaderboard.json")
+    players = []
+    for i, name in enumerate(["Alpha", "Bravo", "Charlie", "Delta"]):
+        player = Player(name, "password_hash", "Human", "Warrior")
+        player.gain_experience(i * 1000)
+        test_db.save_player(player.to_dict())
+        players.append(player)
+    
+    assert list(test_db.get_top_players(2)) == ["delta", "charlie"]
+    assert test_db.get_rank("Alpha") == 4
+    
+    players[0].progress_listener = test_db.update_progress
+    players[0].gain_experience(5000)
+    assert test_db.get_rank("alpha") == 1
+    # The stored record, level buckets and stats move with the leaderboards
+    level = players[0].level
+    assert level > 1 and test_db.get_player("Alpha")['level'] == level
+    assert "alpha" in test_db.level_buckets[level] and test_db.export_player_stats()['average_level'] == sum(player.level for player in players) / 4
+    assert [rank for rank, _ in test_db.get_players_around("Charlie", 1)] == [2, 3, 4]
+    
+    test_db.delete_player("Delta")
+    assert test_db.get_rank("Charlie") == 2
+    
+    # Cutting a prefix relinks the head, keeping every position right
+    skiplist = IndexableSkipList.from_sorted(range(100))
+    assert skiplist.remove_first(30) == list(range(30)) and len(skiplist) == 70
+    assert skiplist.bisect_left(50) == 20 and skiplist.node_at(0).value == 30 and skiplist.rank(99) == 69
+    skiplist.insert(10)
+    assert skiplist.slice(0, 3) == [10, 30, 31] and list(skiplist)[-1] == 99
+    # A few removals go one at a time, many rebuild the list; both leave the same ranks
+    for removed in (["p3", "p50"], [f"p{i}" for i in range(0, 100, 2)]):
+        board = Leaderboard.from_scores({f"p{i}": i for i in range(100)})
+        board.remove_many(removed)
+        assert len(board) == 100 - len(removed) and board.rank("p99") == 1 and board.rank(removed[0]) is None
+        assert [name for _, name, _ in board.top(2)] == (["p99", "p97"] if len(removed) > 2 else ["p99", "p98"])
+    
+    if os.path.exists("test_leaderboard.json"):
+        os.remove("test_leaderboard.json")
+    print("Leaderboard test completed")
+
+def test_secondary_indexes():
+    """Test level buckets and the last-login index"""
+    print("=== Testing Secondary Indexes ===")
+    
+    test_db = Database("test_indexes.json")
+    for i, days_ago in enumerate([0, 10, 60, 90]):
+        player = Player(f"Indexed{i}", "password_hash", "Human", "Warrior")
+        player.level = i + 1
+        player.last_login = (datetime.now() - timedelta(days=days_ago)).isoformat()
+        test_db.save_player(player.to_dict())
+    
+    assert sorted(test_db.get_players_by_level(2, 3)) == ["indexed1", "indexed2"]
+    
+    record = dict(test_db.get_player("Indexed1"), level=9)
+    test_db.save_player(record)  # Moves to a new bucket
+    assert sorted(test_db.get_players_by_level(min_level=5)) == ["indexed1"]
+    
+    assert test_db.get_inactive_players(30) == ["indexed3", "indexed2"]
+    assert test_db.cleanup_old_players(30) == 2
+    assert sorted(test_db.get_players_by_level()) == ["indexed0", "indexed1"]
+    # Every index dropped the removed players in the batch
+    assert test_db.names.keys == ["indexed0", "indexed1"] and test_db.get_inactive_players(0) == ["indexed1", "indexed0"]
+    assert list(test_db.get_top_players(10)) == ["indexed1", "indexed0"] and test_db.get_rank("Indexed2") is None
+    assert test_db.export_player_stats()['total_players'] == 2
+    
+    if os.path.exists("test_indexes.json"):
+        os.remove("test_indexes.json")
+    print("Secondary index test completed")
+
+def test_population_stats():
+    """Test running statistics as players are created, level up and are deleted"""
+    print("=== Testing Population Stats ===")
+    
+    test_db = Database("test_stats.json")
+    for name, race, char_class in [("Statsa", "Elf", "Mage"), ("Statsb", "Elf", "Rogue"), ("Statsc", "Dwarf", "Warrior")]:
+        test_db.save_player(Player(name, "password_hash", race, char_class).to_dict())
+    
+    record = dict(test_db.get_player("Statsa"), level=7)
+    test_db.save_player(record)
+    test_db.delete_player("Statsc")
+    
+    stats = test_db.export_player_stats()
+    assert stats['total_players'] == 2
+    assert stats['races'] == {"Elf": 2}
+    assert stats['classes'] == {"Mage": 1, "Rogue": 1}
+    assert stats['level_distribution'] == {"1-5": 1, "6-10": 1}
+    assert stats['average_level'] == 4
+    
+    if os.path.exists("test_stats.json"):
+        os.remove("test_stats.json")
+    print("Population stats test completed")
+
+def test_bulk_experience():
+    """Test multi-level jumps and saving many players at once"""
+    print("=== Testing Bulk Experience ===")
+    
+    stepped = Player("Stepped", "password_hash", "Human", "Warrior")
+    jumped = Player("Jumped", "password_hash", "Human", "Warrior")
+    for _ in range(3):
+        stepped.gain_experience(1000)
+    message = jumped.gain_experience(3000)
+    assert message == "Congratulations! You've reached level 4!"
+    assert jumped.level == stepped.level == 4
+    assert jumped.max_health == stepped.max_health and jumped.max_mana == stepped.max_mana
+    assert jumped.gain_experience(10) is None
+    
+    test_db = Database("test_bulk.json")
+    test_db.save_many([stepped.to_dict(), jumped.to_dict()])
+    assert test_db.get_top_players(2) == {"jumped": test_db.get_player("Jumped"),
+                                          "stepped": test_db.get_player("Stepped")}
+    assert Database("test_bulk.json").get_player_count() == 2
+    
+    if os.path.exists("test_bulk.json"):
+        os.remove("test_bulk.json")
+    print("Bulk experience test completed")
+
+def test_admin_socket():
+    """Test admin requests over a Unix socket against a stand-in server"""
+    print("=== Testing Admin Socket ===")
+    
+    class FakeServer:
+        db = Database("test_admin.json")
+        players = {}
+        call = staticmethod(lambda function, *args: function(*args))
+        
+        @staticmethod
+        def kick_player(name):
+            if name == "Broken":
+                raise RuntimeError("kick failed")
+            return name == "Online"
+    
+    server = FakeServer()
+    server.db.save_player(Player("Admined", "password_hash", "Gnome", "Mage").to_dict())
+    path = os.path.join(tempfile.mkdtemp(), "admin.sock")
+    assert admin_request('stats', path) is None  # No server running
+    
+    admin = AdminServer(server, path)
+    admin.start()
+    assert os.stat(path).st_mode & 0o777 == 0o600  # Private from the moment it is bound
+    assert admin_request('stats', path)['races'] == {"Gnome": 1}
+    records = admin_request('players', path, limit=5)
+    assert records[0]['name'] == "Admined" and 'password_hash' not in records[0]
+    assert admin_request('kick', path, name="Online") is True
+    try:
+        admin_request('shutdown', path)
+        assert False, "Unknown command accepted"
+    except AdminError:
+        pass
+    try:
+        admin_request('kick', path, name="Broken")
+        assert False, "Failed command reported success"
+    except AdminError as e:
+        assert "RuntimeError: kick failed" in str(e)
+    
+    # Restoring over a running server's file would be undone by its next save
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        restore_database(tempfile.gettempdir(), None, path)
+    assert "Restore refused" in output.getvalue()
+    admin.close()
+    assert admin_request('stats', path) is None
+    
+    # Something other than a MUD server on the socket is an AdminError, not a traceback
+    def answer(listener, reply):
+        connection, _ = listener.accept()
+        connection.recv(1024)
+        if reply:
+            connection.sendall(reply)
+        time.sleep(0.5)  # No reply at all times the request out
+        connection.close()
+    
+    for reply in (b'not json\n', None):
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        listener.listen(1)
+        answerer = threading.Thread(target=answer, args=(listener, reply))
+        answerer.start()
+        try:
+            admin_request('stats', path, timeout=0.1)
+            assert False, "Bad admin socket went unreported"
+        except AdminError:
+            pass
+        answerer.join()
+        listener.close()
+        os.remove(path)
+    
+    os.rmdir(os.path.dirname(path))
+    if os.path.exists("test_admin.json"):
+        os.remove("test_admin.json")
+    print("Admin socket test completed")
+
+def test_simulation():
+    """Test scripted in-memory sessions on a virtual clock"""
+    print("=== Testing Simulation ===")
+    
+    sim = Simulation("test_simulation.json", seed=1)
+    newcomer = sim.connect("2", "Newcomer", "secret", "secret", "1", "1", "who")
+    speaker = sim.join("Speaker", "say hello", "quit")
+    listener = sim.join("Listener")
+    sim.run()
+    
+    assert "Speaker says: hello" in listener.take_output()
+    assert any("Listener (Level 1" in message for message in newcomer.take_output())
+    assert speaker not in sim.sessions and sim.server.db.player_exists("Speaker")
+    
+    sim.advance(sim.server.idle_timeout + 1)  # Everyone left is idle
+    assert not sim.sessions and not sim.server.players
+    assert "newcomer" in sim.server.detached and "speaker" not in sim.server.detached
+    sim.close()
+    
+    if os.path.exists("test_simulation.json"):
+        os.remove("test_simulation.json")
+    print("Simulation test completed")
+
+def test_resume_after_long_session():
+    """Test resuming a player who dropped long after logging in"""
+    print("=== Testing Resume After Long Session ===")
+    
+    sim = Simulation("test_resume.json")
+    session = sim.connect("2", "Stayer", "secret", "secret", "1", "1")
+    sim.run()
+    token = next(message.split(": ", 1)[1] for message in session.take_output()
+                 if message.startswith("Resume token: "))
+    
+    sim.advance(sim.server.resume_grace + 100)  # Play for longer than the grace period
+    sim.drop(session)
+    sim.advance(sim.server.resume_grace - 1)
+    session = sim.connect(f"resume {token}", "who")
+    sim.run()
+    output = session.take_output()
+    assert "Session resumed. Welcome back, Stayer." in output and "stayer" not in sim.server.detached
+    
+    # The grace period after the drop still applies
+    sim.drop(session)
+    sim.advance(sim.server.resume_grace + 1)
+    session = sim.connect(f"resume {token}")
+    sim.run()
+    assert any("invalid or has expired" in message for message in session.take_output())
+    sim.close()
+    
+    if os.path.exists("test_resume.json"):
+        os.remove("test_resume.json")
+    print("Resume after long session test completed")
+
+def test_channels():
+    """Test chat channel subscriptions, history and announcements"""
+    print("=== Testing Channels ===")
+    
+    sim = Simulation("test_channels.json")
+    elf = sim.join("Elfie", "join guild:rangers", "chat race hello elves", "chat guild:rangers meet at dawn",
+                   race="Elf", char_class="Ranger")
+    dwarf = sim.join("Dorin", "chat race hello elves", "join guild:rangers", "leave admin", "leave race",
+                     "join race:elf", "join race", race="Dwarf")
+    sim.run()
+    
+    dwarf_output = dwarf.take_output()
+    assert "[race:dwarf] Dorin: hello elves" in dwarf_output
+    assert "[race:elf] Elfie: hello elves" not in dwarf_output
+    assert "[guild:rangers] Elfie: meet at dawn" in dwarf_output  # Caught up from history on join
+    assert "Server announcements can't be turned off." in dwarf_output
+    assert "You can join the global channel, your race or class channel, or a guild channel (guild:<name>)." \
+        in dwarf_output  # Not another race's channel
+    assert "You join the race:dwarf channel." in dwarf_output  # But back into their own after leaving it
+    assert sim.server.channels.is_subscribed("race:dwarf", dwarf)
+    assert "[race:elf] Elfie: hello elves" in elf.take_output()
+    
+    assert sim.server.announce("Reboot soon") == 2
+    sim.server.flush_output()
+    assert "[admin] Reboot soon" in elf.take_output()
+    stats = sim.server.channels.stats()
+    assert stats['guild:rangers']['subscribers'] == 2 and stats['race:dwarf']['published'] == 1
+    
+    sim.drop(elf)
+    sim.drop(dwarf)
+    assert 'guild:rangers' not in sim.server.channels.channels
+    sim.close()
+    
+    if os.path.exists("test_channels.json"):
+        os.remove("test_channels.json")
+    print("Channels test completed")
+
+def test_name_index():
+    """Test case-insensitive name lookups, tell and finger"""
+    print("=== Testing Name Index ===")
+    
+    index = NameIndex(["Alice", "Alfred", "Bob", "STRASSE"])
+    assert "ALICE" in index and "straße" in index and "Al" not in index
+    assert index.prefixed("al") == ["alfred", "alice"]
+    assert index.resolve("bob") == ["bob"] and index.resolve("z") == []
+    assert index.add("alice") is False and index.remove("Alfred") and index.prefixed("AL") == ["alice"]
+    
+    sim = Simulation("test_name_index.json")
+    sim.server.db.save_player(Player("Alderon", "password_hash", "Dwarf", "Cleric").to_dict())
+    alice = sim.join("Alice", "tell al hi", "tell ali hi there", "finger ald")
+    alfred = sim.join("Alfred")
+    sim.run()
+    
+    output = alice.take_output()
+    assert "Which player do you mean: Alfred, Alice?" in output
+    assert "You tell Alice: hi there" in output
+    assert any("Level 1 Dwarf Cleric" in message for message in output)
+    assert "Alice tells you: hi there" not in alfred.take_output()
+    assert sim.server.db.player_exists("ALDERON") and [p['name'] for p in sim.server.db.find_players("alde")] == ["Alderon"]
+    
+    sim.drop(alice)
+    assert "alice" not in sim.server.online_names
+    sim.drop(alfred)
+    sim.close()
+    
+    if os.path.exists("test_name_index.json"):
+        os.remove("test_name_index.json")
+    
+    # Files keyed by lower() can hold two names that casefold alike; loading keeps both
+    with open("test_name_index.json", 'w') as f:
+        json.dump({"straße": Player("Straße", "a", "Human", "Bard").to_dict(),
+                   "strasse": Player("STRASSE", "b", "Orc", "Warrior").to_dict()}, f)
+    test_db = Database("test_name_index.json")
+    assert test_db.get_player("strasse")['name'] == "STRASSE"
+    renamed = test_db.get_player("Straße2")
+    assert renamed['password_hash'] == "a" and renamed['renamed_from'] == "Straße"
+    assert len(test_db.players) == 2 and len(test_db.names) == 2
+    
+    if os.path.exists("test_name_index.json"):
+        os.remove("test_name_index.json")
+    print("Name index test completed")
+
+def test_input_recording():
+    """Test recording in-game input and replaying it"""
+    print("=== Testing Input Recording ===")
+    
+    sim = Simulation("test_recording.json")
+    sim.server.recorder = InputRecorder("test_recording.rec", sim.clock)
+    sim.connect("2", "Recorded", "secret", "secret", "1", "1", "who", "say hi")
+    sim.join("Other", "look")
+    sim.run()
+    sim.clock.advance(3)
+    sim.join("Late", "stats", "quit")
+    sim.run()
+    sim.server.recorder.close()
+    sim.close()
+    
+    events = list(read_recording("test_recording.rec"))
+    assert not any("secret" in payload for _, _, _, payload in events)  # Login menus are not recorded
+    assert [payload for _, _, kind, payload in events if kind == LINE] == ["look", "who", "say hi", "stats", "quit"]
+    assert events[-1][0] == 3 and events[-1][2] == QUIT
+    
+    report = replay_recording("test_recording.rec")
+    assert set(report) == {"who", "look", "say", "stats", "quit"} and report["say"]["count"] == 1
+    
+    try:
+        InputRecorder("test_recording.rec")
+        assert False, "An existing recording was overwritten"
+    except FileExistsError:
+        pass
+    assert len(list(read_recording("test_recording.rec"))) == len(events)
+    
+    for filename in ("test_recording.json", "test_recording.rec"):
+        if os.path.exists(filename):
+            os.remove(filename)
+    print("Input recording test completed")
+
+def test_websocket():
+    """Test the WebSocket handshake, compressed framing and keepalive pings"""
+    print("=== Testing WebSocket ===")
+    
+    server_socket, client_socket = socket.socketpair()
+    session = WebSocketSession(server_socket, ("websocket", 0))
+    handshake = threading.Thread(target=session.handshake)
+    handshake.start()
+    client = WebSocketClient(client_socket)
+    handshake.join()
+    assert client.deflate and session.compressed
+    
+    client.send("look\nwho")
+    assert session.receive() == "look" and session.receive() == "who"
+    
+    assert session.ping()
+    assert not session.ping()  # Still waiting for the pong
+    session.send("Welcome!")
+    session.send("Welcome!".encode('utf-8'))
+    session.write(session.next_output())
+    assert client.receive() == "Welcome!\nWelcome!\n"
+    
+    client.send("say hi")  # The client answered the ping before sending this
+    assert session.receive() == "say hi" and not session.awaiting_pong
+    session.close()
+    session.write(session.next_output())
+    assert client.receive() is None
+    client.close()
+    server_socket.close()
+    
+    offers = "permessage-deflate; server_max_window_bits=8, permessage-deflate; server_no_context_takeover"
+    assert negotiate_deflate(offers) == ("permessage-deflate; server_no_context_takeover", 15, True)
+    
+    # Fragment floods and oversized messages are refused, not buffered
+    decoder = MessageDecoder(deflate=False)
+    assert decoder.add(False, False, TEXT, b"lo") is None and decoder.add(True, False, CONTINUATION, b"ok") == "look"
+    for frames, error in ((lambda: [(False, b"x")] * (MAX_FRAGMENTS + 1), "too many frames"),
+                          (lambda: [(False, b"")] * (MAX_EMPTY_FRAGMENTS + 1), "empty continuation"),
+                          (lambda: [(False, b"x" * 40000)] * 2, "too large")):
+        decoder = MessageDecoder(deflate=False)
+        try:
+            for i, (fin, payload) in enumerate(frames()):
+                decoder.add(fin, False, CONTINUATION if i else TEXT, payload)
+            assert False, f"Expected {error}"
+        except WebSocketError as e:
+            assert error in str(e).lower()
+    
+    # A server closes the connection on an unmasked client frame
+    try:
+        read_frame(io.BytesIO(encode_frame(TEXT, b"look")), require_mask=True)
+        assert False, "Unmasked frame accepted"
+    except WebSocketError:
+        pass
+    assert read_frame(io.BytesIO(encode_frame(TEXT, b"look", mask=b"abcd")), require_mask=True)[3] == b"look"
+    
+    # Clients speaking another protocol version are told which one we support
+    server_socket, client_socket = socket.socketpair()
+    session = WebSocketSession(server_socket, ("websocket", 0))
+    client_socket.sendall(b"GET / HTTP/1.1\r\nUpgrade: websocket\r\nConnection: keep-alive, Upgrade\r\n"
+                          b"Sec-WebSocket-Key: a2V5\r\nSec-WebSocket-Version: 8\r\n\r\n")
+    try:
+        session.handshake()
+        assert False, "Old protocol version accepted"
+    except WebSocketError:
+        pass
+    assert client_socket.recv(1024).startswith(b"HTTP/1.1 426 Upgrade Required\r\nSec-WebSocket-Version: 13")
+    client_socket.close()
+    server_socket.close()
+    
+    # Fragmented or oversized control frames close the connection with a protocol error
+    server_socket, client_socket = socket.socketpair()
+    session = WebSocketSession(server_socket, ("websocket", 0))
+    handshake = threading.Thread(target=session.handshake)
+    handshake.start()
+    client = WebSocketClient(client_socket, deflate=False)
+    handshake.join()
+    client_socket.sendall(encode_frame(PING, b"x" * 126, mask=b"abcd"))
+    try:
+        session.receive()
+        assert False, "Oversized ping accepted"
+    except WebSocketError:
+        pass
+    session.write(session.next_output())
+    fin, _, opcode, payload = read_frame(client.reader)
+    assert opcode == CLOSE and payload == struct.pack('!H', 1002)
+    fragmented = bytes([PING]) + encode_frame(PING, mask=b"abcd")[1:]  # FIN bit clear
+    try:
+        read_frame(io.BytesIO(fragmented), require_mask=True)
+        assert False, "Fragmented ping accepted"
+    except WebSocketError as e:
+        assert e.code == 1002
+    client.close()
+    server_socket.close()
+    
+    # Kicking a client queues the notice and close frame for the writer and wakes the reader
+    server_socket, client_socket = socket.socketpair()
+    session = WebSocketSession(server_socket, ("websocket", 0))
+    handshake = threading.Thread(target=session.handshake)
+    handshake.start()
+    client = WebSocketClient(client_socket)
+    handshake.join()
+    session.interrupt("\nYou have been disconnected.\n")
+    try:
+        session.receive()
+        assert False, "Reader was not woken"
+    except ConnectionError:
+        pass
+    session.write(session.next_output())
+    assert session.next_output() is None
+    assert client.receive() == "\nYou have been disconnected.\n" and client.receive() is None
+    client.close()
+    server_socket.close()
+    print("WebSocket test completed")
+
+def test_items():
+    """Test shared item templates, compact records and lazily loaded inventories"""
+    print("=== Testing Items ===")
+    
+    inventory = Inventory()
+    inventory.add("arrow", 150)
+    inventory.add("short_sword", 2)
+    inventory.add("ration", 1, state={"spoiled": True})
+    assert [str(item) for item in inventory] == ["Arrow x99", "Arrow x51", "Short Sword", "Short Sword", "Travel Ration"]
+    assert inventory.to_records() == ["arrow*99", "arrow*51", "short_sword", "short_sword", ["ration", {"spoiled": True}]]
+    assert inventory.weight() == 7
+    
+    loaded = Inventory.from_records(inventory.to_records())
+    assert loaded.find("ARR").template is ITEMS["arrow"] and loaded.find("RATION").state == {"spoiled": True}
+    loaded.remove(loaded.find("sword"), 1)
+    assert len(loaded) == 4 and loaded.find("nothing") is None
+    
+    player = Player("Packer", "password_hash", "Human", "Ranger")
+    data = player.to_dict()
+    assert "shortbow" in data['inventory'] and "arrow*40" in data['inventory']
+    restored = Player.from_dict(data)
+    assert restored.loaded_inventory is None  # Not decoded until something looks
+    restored.inventory.add("arrow", 10)
+    assert "arrow*50" in restored.to_dict()['inventory'] and restored.inventory_records is None
+    legacy = {key: value for key, value in data.items() if key != "inventory"}
+    assert Player.from_dict(legacy).to_dict()["inventory"] == []  # Saved before inventories existed
+    
+    print("Items test completed")
+
+def test_help_index():
+    """Test pre-rendered help topics, keyword search and incremental refresh"""
+    print("=== Testing Help Index ===")
+    
+    index = HelpIndex()
+    assert index.topic("ELF").text.startswith("=== Elf (race) ===") and index.topic("sword mastery").category == "skill"
+    assert [entry.title for entry in index.search("heal")] == ["Cleric", "Heal", "Paladin"]
+    assert index.search("heal zebra") == [] and index.search("the") == []
+    assert index.refresh() == {'added': 0, 'updated': 0, 'removed': 0}
+    assert "- tell <name> <message>" in index.command_summary()
+    
+    # Edit a copy of races.py and point the index at it, as if the file had changed on disk
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "races.py")
+        with open("races.py") as f:
+            source = f.read()
+        with open(path, "w") as f:
+            f.write(source.replace("Graceful and wise", "Moonlit and wise"))
+        index.modules['races'] = (types.SimpleNamespace(__file__=path), 0)
+        assert index.refresh() == {'added': 0, 'updated': 1, 'removed': 0}
+    assert [entry.title for entry in index.search("moonlit")] == ["Elf"]
+    assert RACES["Elf"]["description"].startswith("Graceful")  # The game's own data is untouched
+    
+    sim = Simulation("test_help.json")
+    reader = sim.join("Reader", "help", "help mana shield", "help search mana shield", "help nothing")
+    sim.run()
+    output = reader.take_output()
+    assert any(message.startswith("=== Help Topics ===") for message in output)
+    assert any(message.startswith("=== Mana Shield (skill) ===") for message in output)
+    assert "Topics about mana shield: Mage, Mana Shield, Warrior" in output
+    assert "No help found for nothing." in output
+    sim.close()
+    
+    if os.path.exists("test_help.json"):
+        os.remove("test_help.json")
+    print("Help index test completed")
+
+def test_memory_report():
+    """Test memory accounting by subsystem and allocation tracing on demand"""
+    print("=== Testing Memory Report ===")
+    
+    shared = ["x" * 1000]
+    assert deep_size([shared, shared]) < 2 * deep_size(shared)  # Shared objects count once
+    
+    sim = Simulation("test_memory.json")
+    reader = sim.join("Reader", *["help"] * 20)
+    sim.join("Quiet")
+    sim.run()
+    admin = AdminServer(sim.server, path=None)
+    assert not admin.tracer.status()['tracing']  # Off unless asked for
+    
+    sim.server.db.save_many([Player(f"Stored{i}", "password_hash", "Human", "Bard").to_dict() for i in range(50)])
+    report = admin.memory()
+    assert report['online_players'] == 2 and report['total'] == sum(report['subsystems'].values())
+    # The database is estimated from a sample, scaled up to every record
+    cache = database_report(sim.server.db, sample_size=10)['database_cache']
+    assert 0.8 < cache / deep_size(sim.server.db.players) < 1.25
+    assert report['subsystems']['database_indexes'] > 0
+    assert report['subsystems']['players'] > 0 and report['subsystems']['help'] > 0
+    largest = report['largest_sessions']
+    assert [session['player'] for session in largest] == ["Reader", "Quiet"]
+    assert largest[0]['bytes'] > largest[1]['bytes']
+    
+    admin.memory('start')
+    hoard = [bytearray(1000) for _ in range(100)]
+    growth = admin.memory('diff', limit=5)
+    assert growth[0]['size_diff'] >= 100000 and "test_game.py" in growth[0]['location']
+    assert admin.memory('stop')['tracing'] is False
+    try:
+        admin.memory('diff')
+        assert False, "diff should need tracing"
+    except ValueError:
+        pass
+    del hoard
+    reader.take_output()
+    sim.close()
+    
+    if os.path.exists("test_memory.json"):
+        os.remove("test_memory.json")
+    print("Memory report test completed")
+
+def test_npc_scheduler():
+    """Test NPC thinking within a time budget, nearest to players first, and sleeping when unobserved"""
+    print("=== Testing NPC Scheduler ===")
+    
+    clock = VirtualClock()
+    calls = iter(range(1000000))
+    heard = []
+    # Every reading of the timer takes 1 ms, so a budget just under 10 ms fits 10 thoughts
+    # (just under, so float rounding of the readings can't let an eleventh in)
+    scheduler = NPCScheduler(notify=lambda sessions, message: heard.append((sessions, message)),
+                             clock=clock, budget=0.0095, seed=1, timer=lambda: next(calls) / 1000)
+    merchants = [scheduler.spawn("merchant") for _ in range(20)]
+    wolves = [scheduler.spawn("grey_wolf") for _ in range(5)]
+    shepherds = [scheduler.spawn("shepherd") for _ in range(5)]
+    watching = {"great_forest": ["watcher"]}
+    
+    scheduler.tick(watching)  # Wakes the forest and the town square next to it, spreading their first thoughts
+    assert scheduler.stats['thinks'] == 0 and scheduler.report()['asleep'] == 5
+    assert all(shepherd.next_think is None for shepherd in shepherds)
+    
+    clock.advance(60)
+    scheduler.tick(watching)
+    assert scheduler.stats['thinks'] == 10 and scheduler.stats['exhausted_ticks'] == 1
+    assert all(wolf.next_think > 60 for wolf in wolves)  # The wolves share the watcher's room, so go first
+    assert all(sessions == ["watcher"] for sessions, _ in heard)
+    
+    # The merchants put off go first on the next ticks, and are counted as late
+    clock.advance(5)
+    scheduler.tick(watching)
+    assert scheduler.stats['thinks'] == 20 and scheduler.stats['late'] == 10 and scheduler.stats['skipped'] == 10
+    assert scheduler.stats['max_late_seconds'] >= 5
+    clock.advance(5)
+    scheduler.tick(watching)
+    assert scheduler.stats['thinks'] == 25 and scheduler.stats['late'] == 15 and scheduler.stats['skipped'] == 20
+    assert all(merchant.next_think > 65 for merchant in merchants) and scheduler.stats['exhausted_ticks'] == 2
+    
+    scheduler.tick({})  # Nobody watching: everyone sleeps and nothing thinks
+    clock.advance(600)
+    scheduler.tick({})
+    assert scheduler.stats['thinks'] == 25 and scheduler.report()['asleep'] == 30
+    
+    # A crowded room coming into view is woken a batch at a time within the budget
+    crowd = NPCScheduler(clock=clock, budget=0.0095, seed=1, timer=lambda: next(calls) / 1000)
+    for _ in range(20 * WAKE_BATCH):
+        crowd.spawn("shepherd")
+    crowd.tick({"rolling_hills": ["watcher"]})
+    assert 0 < crowd.report()['waking'] < 20 * WAKE_BATCH and crowd.stats['exhausted_ticks'] == 1
+    crowd.tick({"rolling_hills": ["watcher"]})
+    crowd.tick({"rolling_hills": ["watcher"]})
+    assert crowd.report()['waking'] == 0 and all(npc.next_think is not None for npc in crowd.npcs)
+    crowd.move(crowd.npcs[0], "town_square")  # Wandering off updates the room lists in O(1)
+    assert len(crowd.present("rolling_hills")) == 20 * WAKE_BATCH - 1 and crowd.present("town_square") == crowd.npcs[:1]
+    
+    sim = Simulation("test_npcs.json")
+    visitor = sim.join("Visitor", "look")
+    sim.run()
+    assert any("You see a merchant, a town guard, a stray dog." in message for message in visitor.take_output())
+    sim.advance(300)
+    assert sim.server.npcs.stats['thinks'] > 0
+    assert any(message.startswith(("A merchant", "A town guard", "A stray dog")) for message in visitor.take_output())
+    sim.close()
+    
+    if os.path.exists("test_npcs.json"):
+        os.remove("test_npcs.json")
+    print("NPC scheduler test completed")
+
+def test_client_script():
+    """Test the client's decoding of split characters and its timed script mode"""
+    print("=== Testing Client Script Mode ===")
+    
+    server_socket, client_socket = socket.socketpair()
+    
+    def serve():
+        """Answer each line, splitting the reply in the middle of a two-byte character"""
+        server_socket.sendall("Welcome to the café\n".encode('utf-8'))
+        with server_socket.makefile('rb') as lines:
+            for line in lines:
+                reply = f"You said: {line.decode('utf-8').strip()} – noted\n".encode('utf-8')
+                middle = reply.index("–".encode('utf-8')) + 1
+                server_socket.sendall(reply[:middle])
+                time.sleep(0.01)
+                server_socket.sendall(reply[middle:])
+        server_socket.close()
+    
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    output = io.StringIO()
+    client = MUDClient(output=output)
+    client.socket = client_socket
+    client.connected = True
+    script = ["# Log in first", "@expect café", "@password s3cret", "look", "say héllo", "say again",
+              "@expect again – noted", "@sleep 0.05"]
+    timings, passed = client.run_script(script, settle=0.05, timeout=2)
+    assert passed and sorted(timings) == ["look", "say"] and len(timings["say"]) == 2  # Passwords aren't timed
+    assert "You said: say héllo – noted" in output.getvalue() and "\ufffd" not in output.getvalue()
+    assert "\n********\n" in output.getvalue()
+    
+    timings, passed = client.run_script(["@expect goodbye"], timeout=0.1, echo=False)
+    assert not passed
+    assert client.run_script(["@sleep"], echo=False) == ({}, False)  # A script error, not a crash
+    
+    # An unanswered command fails the script
+    quiet_socket, client.socket = socket.socketpair()
+    client.connected = True
+    timings, passed = client.run_script(["look"], timeout=0.1, echo=False)
+    assert not passed and not timings
+    quiet_socket.close()
+    client.socket.close()
+    client_socket.close()
+    thread.join(timeout=2)
+    print("Client script mode test completed")
+
+def test_game_thread():
+    """Test that commands posted from other threads run in order on the game thread"""
+    print("=== Testing Game Thread ===")
+    
+    server = MUDServer(admin_socket=None, db_file="test_game_thread.json")
+    ticks = []
+    
+    def broken_tick():
+        ticks.append(len(ticks))
+        if len(ticks) == 1:
+            raise RuntimeError("tick failed")
+    
+    server.world_tick = broken_tick
+    server.game_thread = threading.Thread(target=server.run_game, args=(0.01,))
+    server.game_thread.daemon = True
+    server.game_thread.start()
+    
+    server.db.start_writer(delay=60)  # Long enough that only flush() writes during the test
+    
+    session = MemorySession("threaded")
+    queued = threading.BoundedSemaphore(1)
+    queued.acquire()
+    server.post(server.enter_game, session, Player("Threaded", "password_hash", "Elf", "Bard"))
+    server.post(server.handle_input, session, "who", queued)
+    assert server.call(lambda: threading.current_thread() is server.game_thread)
+    assert queued.acquire(blocking=False)  # Handling the line let the reader queue another
+    deadline = time.monotonic() + 2
+    while len(ticks) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # A tick that raised was logged and the thread kept ticking and running commands
+    assert len(ticks) >= 2 and server.get_metrics()['tick_errors'] == 1
+    assert server.call(lambda: 42) == 42
+    server.call(server.handle_input, session, "quit")
+    
+    assert server.call(len, server.players) == 0
+    assert "Goodbye!" in session.outbox and session.closed
+    # Quitting saved the player in memory; the writer thread, or a flush, writes the file
+    assert server.db.player_exists("Threaded") and not os.path.exists("test_game_thread.json")
+    server.db.dirty.clear()  # As the writer does just before it writes
+    server.db.flush()
+    with open("test_game_thread.json") as f:
+        assert "threaded" in json.load(f)
+    metrics = server.get_metrics()
+    assert metrics['commands'] >= 5 and metrics['max_queue_depth'] >= 1
+    server.hasher.shutdown()
+    
+    if os.path.exists("test_game_thread.json"):
+        os.remove("test_game_thread.json")
+    print("Game thread test completed")
+
 if __name__ == "__main__":
     print("PyPeake MUD Component Tests\n")
     
@@ -72,5 +1144,32 @@ if __name__ == "__main__":
     test_classes()
     test_player_creation()
     test_database()
+    test_database_paging()
+    test_incremental_backup()
+    test_timer_heap()
+    test_rate_limiter()
+    test_nanny()
+    test_password_hashing()
+    test_resume_tokens()
+    test_vitals_store()
+    test_server_vitals()
+    test_combat_engine()
+    test_leaderboard()
+    test_secondary_indexes()
+    test_population_stats()
+    test_bulk_experience()
+    test_admin_socket()
+    test_simulation()
+    test_resume_after_long_session()
+    test_channels()
+    test_name_index()
+    test_input_recording()
+    test_websocket()
+    test_items()
+    test_help_index()
+    test_memory_report()
+    test_npc_scheduler()
+    test_client_script()
+    test_game_thread()
     
     print("All tests completed successfully!")
@@ -0,0 +1,94 @@
+"""
+Timer module for PyPeake MUD
+A single heap of deadlines shared by every connection
+
+Copyright (c) 2025 PyPeake MUD
+Licensed under the MIT License - see LICENSE file for details
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+class TimerHeap:
+    """Deadlines for many keys, kept in one heap
+
+    Pushing back a deadline (the common case, on every line a client
+    sends) only updates a dict entry. Each key keeps at most one live
+    heap entry, which is re-armed at the real deadline when it comes due,
+    so the work done by the reaper tracks expirations rather than the
+    number of connections or how busy they are.
+
+    clock returns the current time in seconds; a simulation can pass a
+    virtual clock to control when deadlines pass.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.heap = []
+        self.deadlines = {}  # key -> current deadline
+        self.armed = {}      # key -> (deadline, sequence) of its live heap entry
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+
+    def schedule(self, key, delay):
+        """Set the deadline for key to delay seconds from now"""
+        deadline = self.clock() + delay
+        with self.condition:
+            self.deadlines[key] = deadline
+            armed = self.armed.get(key)
+            if armed and armed[0] <= deadline:
+                return
+            self._arm(key, deadline)
+            if self.heap[0][2] == key:
+                self.condition.notify()
+
+    def cancel(self, key):
+        """Remove the deadline for key, if any"""
+        with self.condition:
+            self.deadlines.pop(key, None)
+
+    def _arm(self, key, deadline):
+        seq = next(self.sequence)
+        self.armed[key] = (deadline, seq)
+        heapq.heappush(self.heap, (deadline, seq, key))
+
+    def pop_expired(self, now=None):
+        """Remove and return every key whose deadline has passed"""
+        if now is None:
+            now = self.clock()
+        expired = []
+        with self.condition:
+            while self.heap and self.heap[0][0] <= now:
+                _, seq, key = heapq.heappop(self.heap)
+                armed = self.armed.get(key)
+                if not armed or armed[1] != seq:
+                    continue  # Superseded by an earlier deadline
+                del self.armed[key]
+
+                deadline = self.deadlines.get(key)
+                if deadline is None:
+                    continue  # Cancelled
+                if deadline > now:
+                    self._arm(key, deadline)
+                    continue
+
+                del self.deadlines[key]
+                expired.append(key)
+        return expired
+
+    def wait_expired(self):
+        """Block until at least one key expires, then return the expired keys"""
+        while True:
+            expired = self.pop_expired()
+            if expired:
+                return expired
+            with self.condition:
+                timeout = None
+                if self.heap:
+                    timeout = max(0, self.heap[0][0] - self.clock())
+                self.condition.wait(timeout)
+
+    def __len__(self):
+        return len(self.deadlines)
@@ -0,0 +1,139 @@
+"""
+Vitals store for PyPeake MUD
+Health, mana and attributes of online players kept in NumPy columns
+
+NumPy is optional. Without it players keep their vitals as ordinary
+attributes and regeneration falls back to a plain Python loop.
+
+Copyright (c) 2025 PyPeake MUD
+Licensed under the MIT License - see LICENSE file for details
+"""
+
+import threading
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    np = None
+    HAS_NUMPY = False
+
+VITAL_FIELDS = (
+    'health', 'max_health', 'mana', 'max_mana',
+    'strength', 'dexterity', 'constitution', 'intelligence', 'wisdom', 'charisma'
+)
+
+def health_regen(constitution):
+    """Health regained per tick"""
+    return 1 + constitution // 5
+
+def mana_regen(wisdom):
+    """Mana regained per tick"""
+    return 1 + wisdom // 5
+
+class VitalField:
+    """A Player attribute that lives in a VitalsStore column while the player is attached"""
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        state = obj.__dict__
+        store = state.get('_vitals')
+        if store is not None:
+            return int(store.columns[self.name][state['_vitals_slot']])
+        return state[self.name]
+
+    def __set__(self, obj, value):
+        state = obj.__dict__
+        store = state.get('_vitals')
+        if store is not None:
+            store.columns[self.name][state['_vitals_slot']] = value
+        else:
+            state[self.name] = value
+
+class VitalsStore:
+    """Columns of vitals for online players, one slot per player
+
+    Attached players read and write their vitals straight from the
+    columns, so a whole tick of regeneration is a handful of array
+    operations no matter how many players are online. Unused slots hold
+    zeros, and clamping to a zero maximum keeps them at zero, so ticks
+    can run over every slot without a mask.
+    """
+
+    def __init__(self, capacity=1024):
+        if not HAS_NUMPY:
+            raise ImportError("VitalsStore requires NumPy")
+        self.capacity = capacity
+        self.columns = {field: np.zeros(capacity, dtype=np.int64) for field in VITAL_FIELDS}
+        self.players = [None] * capacity
+        self.free_slots = list(range(capacity - 1, -1, -1))
+        self.lock = threading.Lock()
+
+    def grow(self):
+        """Double the number of slots"""
+        old_capacity = self.capacity
+        self.capacity *= 2
+        for field in VITAL_FIELDS:
+            column = np.zeros(self.capacity, dtype=np.int64)
+            column[:old_capacity] = self.columns[field]
+            self.columns[field] = column
+        self.players.extend([None] * old_capacity)
+        self.free_slots.extend(range(self.capacity - 1, old_capacity - 1, -1))
+
+    def attach(self, player):
+        """Move a player's vitals into the store"""
+        with self.lock:
+            if not self.free_slots:
+                self.grow()
+            slot = self.free_slots.pop()
+            state = player.__dict__
+            for field in VITAL_FIELDS:
+                self.columns[field][slot] = state.pop(field)
+            self.players[slot] = player
+            state['_vitals_slot'] = slot
+            state['_vitals'] = self
+        return slot
+
+    def detach(self, player):
+        """Move a player's vitals back onto the player object"""
+        with self.lock:
+            state = player.__dict__
+            if state.get('_vitals') is not self:
+                return
+            slot = state.pop('_vitals_slot')
+            del state['_vitals']
+            for field in VITAL_FIELDS:
+                state[field] = int(self.columns[field][slot])
+                self.columns[field][slot] = 0
+            self.players[slot] = None
+            self.free_slots.append(slot)
+
+    def regenerate(self):
+        """Apply one tick of health and mana regeneration to every attached player"""
+        with self.lock:
+            columns = self.columns
+            health, mana = columns['health'], columns['mana']
+            health += health_regen(columns['constitution'])
+            np.minimum(health, columns['max_health'], out=health)
+            mana += mana_regen(columns['wisdom'])
+            np.minimum(mana, columns['max_mana'], out=mana)
+
+    def damage(self, slots, amounts):
+        """Apply damage to many slots at once, returning the slots that died"""
+        with self.lock:
+            health = self.columns['health']
+            health[slots] = np.maximum(health[slots] - amounts, 0)
+            return slots[health[slots] == 0]
+
+    def __len__(self):
+        return self.capacity - len(self.free_slots)
+
+def regenerate_players(players):
+    """Apply one tick of regeneration to players one at a time, without NumPy"""
+    for player in players:
+        player.heal(health_regen(player.constitution))
+        player.restore_mana(mana_regen(player.wisdom))
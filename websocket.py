@@ -0,0 +1,439 @@
+"""
+WebSocket transport for PyPeake MUD
+Lets browser clients play over the same sessions as the telnet port
+
+Implements the parts of RFC 6455 the game needs (the opening handshake,
+framing, masking, ping/pong and the closing handshake) and the
+permessage-deflate extension from RFC 7692, using only the standard library.
+
+Copyright (c) 2025 PyPeake MUD
+Licensed under the MIT License - see LICENSE file for details
+"""
+
+import base64
+import hashlib
+import os
+import socket
+import struct
+import zlib
+from collections import deque
+from session import SocketSession
+
+WEBSOCKET_PORT = 4001
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# Seconds between keepalive pings; a client that misses a pong is disconnected
+PING_INTERVAL = 30
+
+MAX_MESSAGE_SIZE = 64 * 1024  # Largest message accepted from a client, after decompression
+MAX_HEADER_SIZE = 8 * 1024    # Largest opening handshake accepted
+MAX_FRAGMENTS = 256           # Most frames one message may be split into
+MAX_EMPTY_FRAGMENTS = 8       # Most empty non-final frames in one message; more is a flood
+
+# Opcodes
+CONTINUATION = 0x0
+TEXT = 0x1
+BINARY = 0x2
+CLOSE = 0x8
+PING = 0x9
+PONG = 0xA
+
+# The empty stored block that ends every permessage-deflate message
+DEFLATE_TAIL = b'\x00\x00\xff\xff'
+
+# Close codes
+PROTOCOL_ERROR = 1002
+INVALID_DATA = 1007
+MESSAGE_TOO_BIG = 1009
+
+MAX_CONTROL_PAYLOAD = 125  # Control frames must not be fragmented or longer than this
+
+class WebSocketError(ConnectionError):
+    """The other end broke the WebSocket protocol
+
+    code is the close code to send back before dropping the connection.
+    """
+
+    def __init__(self, message, code=PROTOCOL_ERROR):
+        super().__init__(message)
+        self.code = code
+
+class ControlFrame(bytes):
+    """An encoded control frame queued between a session's text messages"""
+
+def accept_key(key):
+    """The Sec-WebSocket-Accept value for a client's Sec-WebSocket-Key"""
+    digest = hashlib.sha1((key + WEBSOCKET_GUID).encode('ascii')).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+def apply_mask(payload, mask):
+    """XOR a payload with a 4-byte mask, which both masks and unmasks it"""
+    if not payload:
+        return payload
+    length = len(payload)
+    key = (mask * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(key, 'big')).to_bytes(length, 'big')
+
+def encode_frame(opcode, payload=b'', compressed=False, mask=None):
+    """Build one complete frame; clients must pass a mask, servers must not"""
+    first = 0x80 | opcode | (0x40 if compressed else 0)
+    mask_bit = 0x80 if mask else 0
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', first, mask_bit | length)
+    elif length < 65536:
+        header = struct.pack('!BBH', first, mask_bit | 126, length)
+    else:
+        header = struct.pack('!BBQ', first, mask_bit | 127, length)
+    if mask:
+        return header + mask + apply_mask(payload, mask)
+    return header + payload
+
+def read_exactly(reader, count):
+    data = reader.read(count)
+    if len(data) < count:
+        raise ConnectionError("Connection closed")
+    return data
+
+def read_frame(reader, max_size=MAX_MESSAGE_SIZE, require_mask=False):
+    """Read one frame, returning (fin, compressed, opcode, unmasked payload)
+
+    Servers pass require_mask, since RFC 6455 requires a server to close
+    the connection on any unmasked frame from a client.
+    """
+    first, second = read_exactly(reader, 2)
+    if require_mask and not second & 0x80:
+        raise WebSocketError("Unmasked frame from client")
+    length = second & 0x7F
+    if length == 126:
+        length, = struct.unpack('!H', read_exactly(reader, 2))
+    elif length == 127:
+        length, = struct.unpack('!Q', read_exactly(reader, 8))
+    if first & 0x08 and (not first & 0x80 or length > MAX_CONTROL_PAYLOAD):
+        raise WebSocketError("Fragmented or oversized control frame")
+    if length > max_size:
+        raise WebSocketError("Frame too large", MESSAGE_TOO_BIG)
+    mask = read_exactly(reader, 4) if second & 0x80 else None
+    payload = read_exactly(reader, length)
+    if mask:
+        payload = apply_mask(payload, mask)
+    return bool(first & 0x80), bool(first & 0x40), first & 0x0F, payload
+
+def parse_extensions(header):
+    """Split a Sec-WebSocket-Extensions header into (name, {param: value}) offers"""
+    offers = []
+    for offer in header.split(','):
+        parts = [part.strip() for part in offer.split(';')]
+        if not parts[0]:
+            continue
+        params = {}
+        for part in parts[1:]:
+            name, _, value = part.partition('=')
+            params[name.strip().lower()] = value.strip().strip('"') or None
+        offers.append((parts[0].lower(), params))
+    return offers
+
+def negotiate_deflate(header):
+    """Pick a permessage-deflate offer we can honour
+
+    Returns (response, server_window_bits, reset_context) or None if no
+    offer is acceptable. zlib cannot compress with an 8 bit window, so
+    offers that insist on one are declined.
+    """
+    for name, params in parse_extensions(header):
+        if name != 'permessage-deflate':
+            continue
+        response = ['permessage-deflate']
+        window_bits = 15
+        if 'server_max_window_bits' in params:
+            try:
+                window_bits = int(params['server_max_window_bits'])
+            except (TypeError, ValueError):
+                continue
+            if not 9 <= window_bits <= 15:
+                continue
+            response.append(f'server_max_window_bits={window_bits}')
+        reset_context = 'server_no_context_takeover' in params
+        if reset_context:
+            response.append('server_no_context_takeover')
+        return '; '.join(response), window_bits, reset_context
+    return None
+
+def read_http_headers(reader):
+    """Read an HTTP request or response head, returning (start line, {header: value})"""
+    start_line = reader.readline(MAX_HEADER_SIZE).decode('latin-1').strip()
+    headers = {}
+    size = len(start_line)
+    while True:
+        line = reader.readline(MAX_HEADER_SIZE).decode('latin-1')
+        size += len(line)
+        if not line:
+            raise ConnectionError("Connection closed during handshake")
+        if size > MAX_HEADER_SIZE:
+            raise WebSocketError("Handshake too large")
+        line = line.strip()
+        if not line:
+            return start_line, headers
+        name, _, value = line.partition(':')
+        name = name.strip().lower()
+        headers[name] = f"{headers[name]}, {value.strip()}" if name in headers else value.strip()
+
+class MessageDecoder:
+    """Reassembles fragmented and compressed messages for one direction of a connection
+
+    The decompressor lives as long as the connection, since a peer using
+    context takeover refers back to earlier messages.
+    """
+
+    def __init__(self, deflate, max_size=MAX_MESSAGE_SIZE):
+        self.inflater = zlib.decompressobj(-15) if deflate else None
+        self.max_size = max_size
+        self.fragments = []
+        self.size = 0  # Bytes in fragments, kept as they arrive rather than summed per frame
+        self.frames = 0
+        self.empty_frames = 0
+        self.compressed = False
+
+    def add(self, fin, compressed, opcode, payload):
+        """Feed a data frame, returning the finished message as text or None"""
+        if opcode == CONTINUATION:
+            if not self.fragments:
+                raise WebSocketError("Unexpected continuation frame")
+        else:
+            if self.fragments:
+                raise WebSocketError("Expected a continuation frame")
+            if compressed and self.inflater is None:
+                raise WebSocketError("Compressed frame without permessage-deflate")
+            self.compressed = compressed
+        self.frames += 1
+        if self.frames > MAX_FRAGMENTS:
+            raise WebSocketError("Message split into too many frames")
+        if not payload and not fin:
+            self.empty_frames += 1
+            if self.empty_frames > MAX_EMPTY_FRAGMENTS:
+                raise WebSocketError("Too many empty continuation frames")
+        self.size += len(payload)
+        if self.size > self.max_size:
+            raise WebSocketError("Message too large", MESSAGE_TOO_BIG)
+        self.fragments.append(payload)
+        if not fin:
+            return None
+
+        data = b''.join(self.fragments)
+        self.fragments = []
+        self.size = self.frames = self.empty_frames = 0
+        if self.compressed:
+            data = self.inflater.decompress(data + DEFLATE_TAIL, self.max_size)
+            if self.inflater.unconsumed_tail:
+                raise WebSocketError("Message too large", MESSAGE_TOO_BIG)
+        try:
+            return data.decode('utf-8')
+        except UnicodeDecodeError:
+            raise WebSocketError("Text message is not UTF-8", INVALID_DATA)
+
+class MessageEncoder:
+    """Encodes text messages as frames, compressing them if deflate was agreed"""
+
+    def __init__(self, deflate=False, window_bits=15, reset_context=False):
+        self.deflate = deflate
+        self.window_bits = window_bits
+        self.reset_context = reset_context
+        self.deflater = self.new_deflater() if deflate else None
+
+    def new_deflater(self):
+        return zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -self.window_bits)
+
+    def encode(self, data, mask=None):
+        """Encode UTF-8 text as a single text frame"""
+        if not self.deflate:
+            return encode_frame(TEXT, data, mask=mask)
+        if self.reset_context:
+            self.deflater = self.new_deflater()
+        compressed = self.deflater.compress(data) + self.deflater.flush(zlib.Z_SYNC_FLUSH)
+        if compressed.endswith(DEFLATE_TAIL):
+            compressed = compressed[:-len(DEFLATE_TAIL)]
+        return encode_frame(TEXT, compressed, compressed=True, mask=mask)
+
+class WebSocketSession(SocketSession):
+    """A session carried over a WebSocket
+
+    Call handshake before using it. Each batch of output becomes one text
+    frame, compressed on the writer thread when the client agreed to
+    permessage-deflate; control frames are queued alongside the text so
+    only the writer thread ever writes to the socket.
+    """
+
+    def __init__(self, client_socket, address=None):
+        super().__init__(client_socket, address)
+        self.reader = client_socket.makefile('rb')
+        self.encoder = MessageEncoder()
+        self.decoder = None
+        self.lines = deque()
+        self.awaiting_pong = False
+        self.close_sent = False
+        self.compressed = False
+        self.writing = False
+
+    def handshake(self):
+        """Answer the client's opening handshake, raising WebSocketError if it is not one"""
+        request, headers = read_http_headers(self.reader)
+        connection = [token.strip().lower() for token in headers.get('connection', '').split(',')]
+        if not request.startswith('GET ') or headers.get('upgrade', '').lower() != 'websocket' \
+                or 'upgrade' not in connection or 'sec-websocket-key' not in headers:
+            self.socket.sendall(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            raise WebSocketError("Not a WebSocket handshake")
+        if headers.get('sec-websocket-version') != '13':
+            self.socket.sendall(b"HTTP/1.1 426 Upgrade Required\r\nSec-WebSocket-Version: 13\r\n"
+                                b"Content-Length: 0\r\nConnection: close\r\n\r\n")
+            raise WebSocketError("Unsupported WebSocket version")
+
+        response = [
+            "HTTP/1.1 101 Switching Protocols",
+            "Upgrade: websocket",
+            "Connection: Upgrade",
+            f"Sec-WebSocket-Accept: {accept_key(headers['sec-websocket-key'])}",
+        ]
+        deflate = negotiate_deflate(headers.get('sec-websocket-extensions', ''))
+        if deflate is not None:
+            extension, window_bits, reset_context = deflate
+            response.append(f"Sec-WebSocket-Extensions: {extension}")
+            self.encoder = MessageEncoder(True, window_bits, reset_context)
+            self.compressed = True
+        self.decoder = MessageDecoder(deflate is not None)
+        self.socket.sendall(('\r\n'.join(response) + '\r\n\r\n').encode('latin-1'))
+
+    def encode(self, messages):
+        frames = []
+        text = []
+        for message in messages:
+            if isinstance(message, ControlFrame):
+                if text:
+                    frames.append(self.encoder.encode(b''.join(text)))
+                    text = []
+                frames.append(message)
+            else:
+                text.append((message if isinstance(message, bytes) else message.encode('utf-8')) + b'\n')
+        if text:
+            frames.append(self.encoder.encode(b''.join(text)))
+        return b''.join(frames)
+
+    def write(self, data):
+        self.writing = True
+        try:
+            super().write(data)
+        finally:
+            self.writing = False
+
+    def receive(self):
+        try:
+            return self.next_line()
+        except WebSocketError as e:
+            if not self.close_sent:
+                self.close_sent = True
+                self.outgoing.put(ControlFrame(encode_frame(CLOSE, struct.pack('!H', e.code))))
+            raise
+
+    def next_line(self):
+        while not self.lines:
+            fin, compressed, opcode, payload = read_frame(self.reader, require_mask=True)
+            if opcode == PING:
+                self.outgoing.put(ControlFrame(encode_frame(PONG, payload)))
+            elif opcode == PONG:
+                self.awaiting_pong = False
+            elif opcode == CLOSE:
+                self.close_sent = True
+                self.outgoing.put(ControlFrame(encode_frame(CLOSE, payload[:2])))
+                raise ConnectionError("Client closed the WebSocket")
+            elif opcode in (TEXT, BINARY, CONTINUATION):
+                message = self.decoder.add(fin, compressed, opcode, payload)
+                if message is not None:
+                    self.lines.extend(message.splitlines() or [''])
+            else:
+                raise WebSocketError(f"Unknown opcode {opcode}")
+        return self.lines.popleft().strip()
+
+    def ping(self):
+        """Queue a keepalive ping, returning False if the last one was never answered"""
+        if self.awaiting_pong:
+            return False
+        self.awaiting_pong = True
+        self.outgoing.put(ControlFrame(encode_frame(PING)))
+        return True
+
+    def interrupt(self, notice=None):
+        """Queue the notice and a going-away close frame for the writer, then stop reading
+
+        Only the writer thread writes frames, so one can never land in the
+        middle of another. A writer stuck mid-frame on a client that stopped
+        reading can deliver nothing more, so the connection is cut outright.
+        """
+        if self.writing:
+            how = socket.SHUT_RDWR
+        else:
+            how = socket.SHUT_RD
+            if notice:
+                self.outgoing.put(notice.rstrip('\n'))
+            if not self.close_sent:
+                self.close_sent = True
+                self.outgoing.put(ControlFrame(encode_frame(CLOSE, struct.pack('!H', 1001))))
+            self.outgoing.put(None)
+        try:
+            self.socket.shutdown(how)
+        except OSError:
+            pass
+
+    def close(self):
+        if not self.close_sent:
+            self.close_sent = True
+            self.outgoing.put(ControlFrame(encode_frame(CLOSE, struct.pack('!H', 1000))))
+        super().close()
+
+class WebSocketClient:
+    """A minimal WebSocket client, used by the tests and the load benchmark"""
+
+    def __init__(self, sock, host='localhost', path='/', deflate=True):
+        self.socket = sock
+        self.reader = sock.makefile('rb')
+        key = base64.b64encode(os.urandom(16)).decode('ascii')
+        request = [
+            f"GET {path} HTTP/1.1",
+            f"Host: {host}",
+            "Upgrade: websocket",
+            "Connection: Upgrade",
+            f"Sec-WebSocket-Key: {key}",
+            "Sec-WebSocket-Version: 13",
+        ]
+        if deflate:
+            request.append("Sec-WebSocket-Extensions: permessage-deflate; client_max_window_bits")
+        sock.sendall(('\r\n'.join(request) + '\r\n\r\n').encode('latin-1'))
+
+        status, headers = read_http_headers(self.reader)
+        if ' 101 ' not in f"{status} " or headers.get('sec-websocket-accept') != accept_key(key):
+            raise WebSocketError(f"Handshake refused: {status}")
+        self.deflate = headers.get('sec-websocket-extensions', '').startswith('permessage-deflate')
+        self.encoder = MessageEncoder(self.deflate)
+        self.decoder = MessageDecoder(self.deflate, max_size=1 << 30)
+
+    def send(self, text):
+        """Send a text message"""
+        self.socket.sendall(self.encoder.encode(text.encode('utf-8'), mask=os.urandom(4)))
+
+    def receive(self):
+        """Wait for the next text message, answering pings on the way; None once closed"""
+        while True:
+            fin, compressed, opcode, payload = read_frame(self.reader, max_size=1 << 30)
+            if opcode == PING:
+                self.socket.sendall(encode_frame(PONG, payload, mask=os.urandom(4)))
+            elif opcode == CLOSE:
+                return None
+            elif opcode != PONG:
+                message = self.decoder.add(fin, compressed, opcode, payload)
+                if message is not None:
+                    return message
+
+    def close(self):
+        try:
+            self.socket.sendall(encode_frame(CLOSE, struct.pack('!H', 1000), mask=os.urandom(4)))
+        except OSError:
+            pass
+        self.socket.close()